@@ -1,3 +1,6 @@
+from __future__ import annotations
+
+import gzip
 import struct
 import zlib
 
@@ -5,20 +8,114 @@ _LCG_BASE = 0x19000000   # BASE_SEED (i32)
 _LCG_VAL1 = 0x41C64E6D  # multiplier (i32)
 _LCG_VAL2 = 12345        # increment  (i32)
 
+# Number of keystream bytes generated per block by the lane-packed path.
+_BLOCK_SIZE = 0x10000
+
+# Each keystream byte gets a 64-bit lane in a packed integer.  The lane holds
+# A_k*state + C_k which is always < 2**64, so lanes never carry into each other.
+_LANE_BITS = 64
+_LANE_BYTES = _LANE_BITS // 8
+
 
 def to_i32(v: int) -> int:
     v &= 0xFFFFFFFF
     return v - 0x100000000 if v >= 0x80000000 else v
 
 
+def lcg_jump(steps: int) -> tuple[int, int]:
+    """
+    Return (mult, incr) such that advancing the LCG by `steps` is
+    state -> (mult*state + incr) mod 2**32.
+    """
+    mult, incr = 1, 0
+    step_mult, step_incr = _LCG_VAL1, _LCG_VAL2
+    while steps > 0:
+        if steps & 1:
+            mult = (mult * step_mult) & 0xFFFFFFFF
+            incr = (incr * step_mult + step_incr) & 0xFFFFFFFF
+        step_incr = (step_incr * (step_mult + 1)) & 0xFFFFFFFF
+        step_mult = (step_mult * step_mult) & 0xFFFFFFFF
+        steps >>= 1
+    return mult, incr
+
+
+class _LaneTable:
+    """
+    Jump-ahead coefficients for k = 1.._BLOCK_SIZE packed into 64-bit lanes.
+
+    For a block starting at LCG state s, the state after k steps is
+    A_k*s + C_k (mod 2**32).  Multiplying the packed A table by s and adding
+    the packed C table computes every lane at once in C, and byte 3 of each
+    lane is the keystream byte.
+    """
+
+    def __init__(self, size: int):
+        mults = bytearray(size * _LANE_BYTES)
+        incrs = bytearray(size * _LANE_BYTES)
+        mult, incr = 1, 0
+        for k in range(size):
+            mult = (mult * _LCG_VAL1) & 0xFFFFFFFF
+            incr = (incr * _LCG_VAL1 + _LCG_VAL2) & 0xFFFFFFFF
+            pos = k * _LANE_BYTES
+            mults[pos:pos+4] = mult.to_bytes(4, 'little')
+            incrs[pos:pos+4] = incr.to_bytes(4, 'little')
+        self.size = size
+        self.mults = bytes(mults)
+        self.incrs = bytes(incrs)
+        self.packed_mult = int.from_bytes(mults, 'little')
+        self.packed_incr = int.from_bytes(incrs, 'little')
+        self.block_mult = mult
+        self.block_incr = incr
+
+
+_lane_table: _LaneTable | None = None
+
+
+def _get_lane_table() -> _LaneTable:
+    global _lane_table
+    if _lane_table is None:
+        _lane_table = _LaneTable(_BLOCK_SIZE)
+    return _lane_table
+
+
+def keystream(block_seed: int, length: int, start: int = 0) -> bytes:
+    """
+    Return `length` keystream bytes for a block, beginning `start` bytes
+    into the stream.  Chunks of one stream can be generated independently.
+    """
+    table = _get_lane_table()
+    state = (_LCG_BASE + block_seed) & 0xFFFFFFFF
+    if start:
+        mult, incr = lcg_jump(start)
+        state = (mult * state + incr) & 0xFFFFFFFF
+
+    parts = []
+    remaining = length
+    while remaining > 0:
+        if remaining >= table.size:
+            count = table.size
+            packed_mult, packed_incr = table.packed_mult, table.packed_incr
+        else:
+            # Only pack the lanes we need for a short tail.
+            count = remaining
+            packed_mult = int.from_bytes(table.mults[:count * _LANE_BYTES], 'little')
+            packed_incr = int.from_bytes(table.incrs[:count * _LANE_BYTES], 'little')
+        lanes = packed_mult * state + packed_incr
+        lane_bytes = lanes.to_bytes(count * _LANE_BYTES, 'little')
+        parts.append(lane_bytes[3::_LANE_BYTES])
+        remaining -= count
+        state = (table.block_mult * state + table.block_incr) & 0xFFFFFFFF
+    return b''.join(parts)
+
+
 def xor_decrypt(data: bytes, block_seed: int) -> bytes:
     """XOR-decrypt a block using the LCG keystream."""
-    num1 = to_i32(_LCG_BASE + block_seed)
-    out = bytearray(len(data))
-    for i, b in enumerate(data):
-        num1 = to_i32(num1 * _LCG_VAL1 + _LCG_VAL2)
-        out[i] = b ^ ((num1 >> 24) & 0xFF)
-    return bytes(out)
+    length = len(data)
+    if length == 0:
+        return b''
+    key = keystream(block_seed, length)
+    value = int.from_bytes(data, 'little') ^ int.from_bytes(key, 'little')
+    return value.to_bytes(length, 'little')
 
 
 def decrypt_then_decompress(data: bytes, block_seed: int) -> bytes:
@@ -30,3 +127,12 @@ def decrypt_then_decompress(data: bytes, block_seed: int) -> bytes:
     decompressed_len = struct.unpack_from('>I', decrypted, 0)[0]
     decompressed = zlib.decompress(decrypted[4:], wbits=47)
     return decompressed[:decompressed_len]
+
+
+def compress_then_encrypt(data: bytes, block_seed: int) -> bytes:
+    """
+    Inverse of decrypt_then_decompress: gzip, prepend the 4-byte big-endian
+    decompressed length and encrypt with the LCG keystream.
+    """
+    payload = struct.pack('>I', len(data)) + gzip.compress(data, mtime=0)
+    return xor_decrypt(payload, block_seed)
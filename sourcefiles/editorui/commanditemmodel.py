@@ -143,6 +143,7 @@ class CommandModel(QAbstractItemModel):
                 cmd = get_command(script.data, node_addr, script.platform)
                 arg_offset = len(cmd) - cmd.arg_lens[-1]
                 script.data[node_addr + arg_offset] = expected_jump
+                script.dirty = True
             node = node.parent
 
     def update_command(self, item: CommandItem, new_command: EventCommand):
@@ -154,8 +155,7 @@ class CommandModel(QAbstractItemModel):
             )
         if self._backend is not None:
             script = self._backend.get_script(self._location_id)
-            script.insert_commands(new_command.to_bytearray(), item.address)
-            script.delete_commands(item.address + len(new_command), 1)
+            script.replace_commands(new_command.to_bytearray(), item.address)
             
         size_change = len(new_command) - (len(item.command) if item.command else 0)
         if size_change != 0 and item.parent:
@@ -292,13 +292,12 @@ class CommandModel(QAbstractItemModel):
             
         script = self._backend.get_script(self._location_id) if self._backend else None
         if script:
-            current_address = insert_address
             total_inserted = 0
-            for item, offset in items:
-                bytes_to_insert = self._extract_bytes(item)
-                script.insert_commands(bytes_to_insert, current_address)
-                current_address += len(bytes_to_insert)
-                total_inserted += len(bytes_to_insert)
+            with script.batch():
+                for item, offset in items:
+                    bytes_to_insert = self._extract_bytes(item)
+                    script.insert_commands(bytes_to_insert, insert_address)
+                    total_inserted += len(bytes_to_insert)
                 
             self._patch_ancestor_jumps(target_parent, total_inserted)
 
@@ -477,13 +476,12 @@ class CommandModel(QAbstractItemModel):
         else:
             insert_address = target_addr + len(target_item.command) if target_item.command else target_addr
 
-        current_address = insert_address
         total_inserted = 0
-        for deep_copy in deep_copies:
-            bytes_to_insert = self._extract_bytes(deep_copy)
-            script.insert_commands(bytes_to_insert, current_address)
-            current_address += len(bytes_to_insert)
-            total_inserted += len(bytes_to_insert)
+        with script.batch():
+            for deep_copy in deep_copies:
+                bytes_to_insert = self._extract_bytes(deep_copy)
+                script.insert_commands(bytes_to_insert, insert_address)
+                total_inserted += len(bytes_to_insert)
             
         self._patch_ancestor_jumps(target_parent, total_inserted)
 
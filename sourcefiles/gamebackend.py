@@ -23,10 +23,21 @@ class GameBackend(ABC):
     def write_script(self, location_id: int) -> None:
         pass
 
+    @abstractmethod
+    def write_dirty_scripts(self) -> list[int]:
+        """Write every loaded script with unsaved edits and return their location ids."""
+        pass
+
     @abstractmethod
     def save_to_file(self, path: Path) -> None:
         pass
 
+    def save_as(self, path: Path) -> list[int]:
+        """Save every script with unsaved edits to path and return their location ids."""
+        written = self.write_dirty_scripts()
+        self.save_to_file(path)
+        return written
+
     @property
     @abstractmethod
     def platform(self) -> Platform:
@@ -61,6 +72,9 @@ class SnesBackend(GameBackend):
     def write_script(self, location_id: int) -> None:
         self._ct_rom.script_manager.write_script_to_rom(location_id)
 
+    def write_dirty_scripts(self) -> list[int]:
+        return self._ct_rom.script_manager.write_scripts_to_rom()
+
     def save_to_file(self, path: Path) -> None:
         path.write_bytes(self._ct_rom.rom_data.getvalue())
 
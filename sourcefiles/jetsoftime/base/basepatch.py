@@ -106,6 +106,8 @@ def apply_mauron_player_tech_patch(
     reserved for some menu functions.
 
     param ct_rom:  The CTRom to apply the patch to.
+    param local_ptr_addr: If not none, the local pointer table will be
+                          placed at this (file) address in the rom.
     param bank_table_addr: If not none, the lookup table for the bank table
                            will be placed at this (file) address in the rom.
     '''
@@ -114,6 +116,24 @@ def apply_mauron_player_tech_patch(
     FSW = freespace.FSWriteType
 
     space_man = ct_rom.rom_data.space_manager
+    if local_ptr_addr is None and bank_table_addr is None:
+        # Place both tables in one step.  Asking for them one at a time
+        # would return the same address twice since nothing is marked
+        # until the writes below.
+        local_ptr_addr, bank_table_addr = \
+            space_man.plan_same_bank([0x200, 0x100])
+        space_man.claim_blocks([(local_ptr_addr, local_ptr_addr+0x200),
+                                (bank_table_addr, bank_table_addr+0x100)])
+
+    # Reserve a table the caller placed before finding room for the other,
+    # or get_free_addr could hand back the caller's block.
+    if local_ptr_addr is not None:
+        space_man.mark_block((local_ptr_addr, local_ptr_addr+0x200),
+                             FSW.MARK_USED)
+    if bank_table_addr is not None:
+        space_man.mark_block((bank_table_addr, bank_table_addr+0x100),
+                             FSW.MARK_USED)
+
     if local_ptr_addr is None:
         # Allocate 2 bytes per tech for local pointers
         # We really only need 0x1FE bytes because tech 0xFF isn't allowed.
@@ -133,7 +153,7 @@ def apply_mauron_player_tech_patch(
 
     bank_table_b = (b'\xCE' * 0x80) + (b'\x00' * 0x80)
     rom.seek(bank_table_addr)
-    rom.write(bank_table_b)
+    rom.write(bank_table_b, FSW.MARK_USED)
 
     local_ptr_addr_hex = int.to_bytes(
         byteops.to_rom_ptr(local_ptr_addr), 3, 'little'
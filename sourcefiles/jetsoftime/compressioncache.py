@@ -0,0 +1,175 @@
+'''
+Cache of compressed event scripts keyed by a hash of the uncompressed bytes.
+
+The cache can be saved to a file and reloaded, so a later session working on
+the same ROM skips recompressing scripts it has already compressed.  Only
+full-search and max compression results are saved; results of a shallower
+chain_depth are kept for the session only.  Saving also drops entries that
+were not used this session, so scripts that no longer exist age out.
+
+In memory, the least recently used entries are evicted once the compressed
+bytes held exceed max_bytes.
+
+File format (little endian):
+  Header:
+    [0..4]  "TRCC" signature
+    [4..6]  u16 format version
+    [6..10] u32 record count
+  Records:
+    [0..20]  sha1 of the uncompressed script
+    [20]     u8 1 if compressed with compress_py_max, else 0
+    [21..25] u32 compressed length
+    [25..]   compressed bytes
+'''
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from typing import ByteString, Optional, Tuple
+
+from .ctdecompress import MAX_CHAIN_DEPTH, compress, compress_py_max
+
+_SIGNATURE = b'TRCC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+_RECORD = struct.Struct('<20sBI')
+
+# Default budget for compressed bytes held in memory.  A whole ROM's worth of
+# event scripts is a few MiB.
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+_Key = Tuple[bytes, bool, Optional[int]]
+
+
+def script_digest(data: ByteString) -> bytes:
+    return hashlib.sha1(data).digest()
+
+
+class CompressionCache:
+    '''
+    Compressed scripts keyed by (sha1 of the script, max compression, chain
+    depth).  hits and misses count compress() calls.
+    '''
+
+    def __init__(self, path: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Least recently used first.
+        self._entries: OrderedDict[_Key, bytes] = OrderedDict()
+        self._total_bytes = 0
+        # Keys compressed or hit this session; only these are saved.
+        self._used: set[_Key] = set()
+        if path is not None:
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _put(self, key: _Key, compressed: bytes) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= len(old)
+        self._entries[key] = compressed
+        self._total_bytes += len(compressed)
+        while self._total_bytes > self.max_bytes and self._entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= len(evicted)
+            self._used.discard(evicted_key)
+
+    def compress(self, data: ByteString, max_compression: bool = False,
+                 chain_depth: Optional[int] = MAX_CHAIN_DEPTH) -> bytes:
+        '''
+        Compressed data, with compress_py_max if max_compression is set and
+        otherwise with compress at chain_depth.
+        '''
+        if max_compression:
+            chain_depth = MAX_CHAIN_DEPTH
+        key = (script_digest(data), max_compression, chain_depth)
+        compressed = self._entries.get(key)
+        self._used.add(key)
+        if compressed is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compressed
+
+        self.misses += 1
+        if max_compression:
+            compressed = bytes(compress_py_max(data))
+        else:
+            compressed = bytes(compress(data, chain_depth))
+        self._put(key, compressed)
+        return compressed
+
+    def load(self, path: str) -> bool:
+        '''
+        Merge entries from a saved cache.  Returns False if the file is
+        missing or unreadable, in which case nothing is loaded.
+        '''
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+
+        if len(data) < _HEADER.size:
+            return False
+        sig, version, count = _HEADER.unpack_from(data, 0)
+        if sig != _SIGNATURE or version != _VERSION:
+            return False
+
+        entries = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            if pos + _RECORD.size > len(data):
+                return False
+            digest, is_max, size = _RECORD.unpack_from(data, pos)
+            pos += _RECORD.size
+            if pos + size > len(data):
+                return False
+            entries[(digest, bool(is_max), MAX_CHAIN_DEPTH)] = \
+                data[pos:pos+size]
+            pos += size
+
+        for key, compressed in entries.items():
+            if key not in self._entries:
+                self._put(key, compressed)
+        return True
+
+    def save(self, path: Optional[str] = None) -> bool:
+        '''
+        Write the entries used this session atomically to path (default:
+        the path it was loaded from).  Returns False if it could not be
+        written.
+        '''
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError('No path to save the compression cache to.')
+
+        saved = [(digest, is_max, compressed)
+                 for (digest, is_max, chain_depth), compressed
+                 in self._entries.items()
+                 if chain_depth == MAX_CHAIN_DEPTH and
+                 (digest, is_max, chain_depth) in self._used]
+        out = bytearray(_HEADER.pack(_SIGNATURE, _VERSION, len(saved)))
+        for digest, is_max, compressed in saved:
+            out += _RECORD.pack(digest, is_max, len(compressed))
+            out += compressed
+
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(out)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+        return True
@@ -1,97 +1,142 @@
 # Copied from Gieger's (Michael Springer, evilpeer@hotmail.com) C version
-from .byteops import get_value_from_bytes, to_little_endian
-from typing import ByteString
+from __future__ import annotations
+
+from .byteops import get_value_from_bytes
+from typing import ByteString, Optional, Tuple, Union
+
+# Chain depths for compress_py_hc.  None searches the whole lookback window,
+# so every copy is the longest match available.  FAST_CHAIN_DEPTH only tries
+# the most recent candidates, which is much faster on repetitive data at a
+# small cost in ratio.
+MAX_CHAIN_DEPTH: Optional[int] = None
+FAST_CHAIN_DEPTH = 8
 
 # ctcompress is the fast C library.  If it's not present, use the python
 # implementation.
 try:
-    from ctcompress import compress
+    from ctcompress import compress as _compress_c
     # print('Using C compression implementation.')
 except ImportError:
     # print('C compression module not found.  Falling back to python.')
-    def compress(source: bytearray) -> bytearray:
-        return compress_py_2(source)
+    _compress_c = None
 
 
-def decompress(rom, start):
-    out_buffer = bytearray([0 for i in range(0, 0x10000)])
+def compress(source: ByteString,
+             chain_depth: Optional[int] = MAX_CHAIN_DEPTH) -> bytearray:
+    '''
+    Compress with the C library, or compress_py_hc at chain_depth when it is
+    not present.  The C library always searches the whole window.
+    '''
+    if _compress_c is not None:
+        return _compress_c(source)
+    return compress_py_hc(source, chain_depth)
 
-    # First two bytes are little endian size of compressed packet
-    main_len = get_value_from_bytes(rom[start:start+2])
 
-    # print(f"Start position: {start:06X}")
-    # print(f"Main body length: {main_len:04X}")
-    # print(f"Max compr length: {len(rom[start:]):04X}")
+class DecompressionError(ValueError):
+    '''Raise when a compressed packet does not decode.'''
 
-    out_pos = 0
-    src_pos = start+2
 
-    add_byte = src_pos + main_len
+# Largest output the game's decompression buffer can hold.
+DECOMPRESS_BUFFER_SIZE = 0x10000
 
-    if rom[add_byte] & 0xC0 != 0:
-        smallwidth = True
-    else:
-        smallwidth = False
 
-    end_pos = add_byte
+def decompress(rom: ByteString, start: int) -> bytearray:
+    '''Decompress the packet at rom[start].'''
+    out_buffer = bytearray(DECOMPRESS_BUFFER_SIZE)
+    out_len = decompress_into(rom, start, out_buffer)
+    del out_buffer[out_len:]
+    return out_buffer
+
 
+def decompress_into(rom: ByteString, start: int, buf: bytearray) -> int:
+    '''
+    Decompress the packet at rom[start] into the front of buf and return
+    the decompressed length.  Bytes of buf past that length are left as they
+    were, so one buffer can be reused across calls.  Raises
+    DecompressionError if the output would not fit in buf.
+    '''
+    capacity = len(buf)
+
+    # First two bytes are little endian size of compressed packet
+    src_pos = start + 2
+    end_pos = src_pos + (rom[start] | rom[start+1] << 8)
+
+    # The addendum byte after the main body gives the copy width.
+    if rom[end_pos] & 0xC0 != 0:
+        size_shift, off_mask = 3, 0x07FF
+    else:
+        size_shift, off_mask = 4, 0x0FFF
+
+    out_pos = 0
     while True:
         # First check if we've passed the main body
         if src_pos == end_pos:
-            # print(f"End pos: {end_pos:06X}")
-            # print(f"Addendum byte: {rom[src_pos]:02X}")
             if rom[src_pos] & 0x3F == 0:
-                # No addendum
-                # print(f"Compressed Size: {end_pos-start:04X}")
-                return out_buffer[0:out_pos]
-            else:
-                # Addendum, new end in next two bytes
-                end_pos = \
-                    start + get_value_from_bytes(rom[src_pos+1:src_pos+3])
-                # print(' '.join(f"{x:02X}"
-                #                for x in rom[src_pos+1:src_pos+3]))
-                # print(f"Addendum found, new end pos = {end_pos:04X}")
-                src_pos += 3  # Get to the byte after the new end byte
-
-        # print(f"[{out_pos:04X}] Getting new packet.")
+                return out_pos
+
+            # Addendum, new end in next two bytes
+            end_pos = start + (rom[src_pos+1] | rom[src_pos+2] << 8)
+            src_pos += 3
+
         header = rom[src_pos]
         src_pos += 1
-        # input()
+
+        # A zero header is 8 literal bytes.
+        if header == 0 and end_pos - src_pos >= 8:
+            if out_pos + 8 > capacity:
+                raise DecompressionError(
+                    f"Packet at {start:06X} overflows the output buffer."
+                )
+            buf[out_pos:out_pos+8] = rom[src_pos:src_pos+8]
+            out_pos += 8
+            src_pos += 8
+            continue
 
         for i in range(8):
             if src_pos == end_pos:
                 # ran out of data mid packet (in addendum)
                 break
-            elif header & (1 << i) == 0:
+
+            if header & (1 << i) == 0:
                 # Uncompressed, copy next byte
-                out_buffer[out_pos] = rom[src_pos]
+                if out_pos == capacity:
+                    raise DecompressionError(
+                        f"Packet at {start:06X} overflows the output buffer."
+                    )
+                buf[out_pos] = rom[src_pos]
                 out_pos += 1
                 src_pos += 1
+                continue
+
+            # Compressed, determine copy size and offset
+            size_byte = rom[src_pos+1]
+            copy_size = (size_byte >> size_shift) + 3
+            copy_off = (rom[src_pos] | size_byte << 8) & off_mask
+            src_pos += 2
+
+            copy_end = out_pos + copy_size
+            if copy_end > capacity:
+                raise DecompressionError(
+                    f"Packet at {start:06X} overflows the output buffer."
+                )
+
+            copy_st = out_pos - copy_off
+            if copy_st >= 0 and copy_off >= copy_size:
+                buf[out_pos:copy_end] = buf[copy_st:copy_st+copy_size]
+            elif copy_off == 0:
+                # Copies the bytes being written, which start out zero.
+                buf[out_pos:copy_end] = bytes(copy_size)
             else:
-                # Compressed, determine copy size and offset
-
-                copy_size = rom[src_pos+1]
-                copy_off = get_value_from_bytes(rom[src_pos:src_pos+2])
-
-                if smallwidth:
-                    copy_size >>= 3
-                    copy_off &= 0x07FF
+                # An overlapping run repeats the last copy_off bytes.  Reads
+                # from before the start of the output see zeros.
+                if copy_st >= 0:
+                    pattern = buf[copy_st:out_pos]
                 else:
-                    copy_size >>= 4
-                    copy_off &= 0x0FFF
-
-                copy_size += 3
-                for j in range(0, copy_size):
-                    try:
-                        out_buffer[out_pos + j] = \
-                            out_buffer[out_pos - copy_off + j]
-                    except IndexError:
+                    pattern = bytes(-copy_st) + buf[0:out_pos]
+                reps = copy_size // copy_off + 1
+                buf[out_pos:copy_end] = (pattern * reps)[:copy_size]
 
-                        # print(out_pos + j)
-                        exit()
-
-                out_pos += copy_size
-                src_pos += 2
+            out_pos = copy_end
 
 
 # Find the length of a compressed packet
@@ -286,363 +331,243 @@ def CTCopyBytes(rom, WorkingBuffer, nBytePos, nWorkPos,  bSmallerBitWidth):
     return nBytePos, nWorkPos
 
 
-def find_match_len(data: bytes, pos_1: int, pos_2: int,
-                   max_match: int):
-
-    match_len = 0
-    while data[pos_1+match_len] == data[pos_2+match_len]:
-        match_len += 1
-
-        if match_len == max_match:
-            break
-
-        if (pos_1 + match_len == len(data)) or \
-           (pos_2 + match_len == len(data)):
-            break
-
-    return match_len
-
-
-# Modification of compress_py which precomputes starting indices of every byte.
-# This was suggested by Atmatek on
-# https://www.ff6hacking.com/forums/thread-4085.html.
-def compress_py_2(source: bytes) -> bytearray:
-    # We have to try compressing in two configurations and then return the
-    # better of the two.
-    compressed_data = [bytearray([0 for i in range(0x10000)])
-                       for j in range(2)]
-
-    best_size = 0x10000
-
-    byte_starts: list[list[int]] = [[] for ind in range(0x100)]
-    for ind, byte in enumerate(source):
-        byte_starts[byte].append(ind)
-
-    byte_ptrs = [0 for ind in range(0x100)]
-
-    # We're only going to use the i=0 version because it's almost always a
-    # smaller file.
-    for i in range(1):
-        # i=0: use 0x07FF for the range, 0xF800 for the max copy length
-        # i=1: use 0x0FFF for the range, 0xF000 for the max copy length
-        lookback_range = 0x07FF | (i << 11)
-
-        # max_copy_length = 0xFFFF ^ lookback_range (bits used)
-        max_copy_length = (0xFFFF ^ lookback_range) >> (16-(5-i))
-        max_copy_length += 3
-        src_pos = 0
-
-        # First two bytes are main body length
-        # Next byte will be the first packet's header
-        out_pos = 2
-
-        done = False
-        while not done:
-            # Fill up a compressed packet
-            header_pos = out_pos
-            out_pos += 1
-
-            for bit in range(8):
-                # While filling a packet we ran out of source.
-                if src_pos == len(source):
-                    if bit == 0:
-                        # If bit == 0, then we ran out after filling a packet.
-                        # This means no addendum.
-                        compressed_data[i][header_pos] = 0xC0*(1-i)
-
-                        # Truncate to used size
-                        compressed_data[i] = compressed_data[i][0:header_pos+1]
-                    else:
-                        # Otherwise, we're mid-packet.  The packet becomes
-                        # the addendum.
-                        # print("Addendum.")
-
-                        # set unused bits of header for addendum header
-                        mask = (0xFF << bit) & 0xFF
-                        compressed_data[i][header_pos] |= mask
-
-                        # shift the addendum packet down three bytes
-                        compressed_data[i][header_pos+3:out_pos+3] = \
-                            compressed_data[i][header_pos:out_pos]
-
-                        # copy range + addendum length
-                        compressed_data[i][header_pos] = \
-                            0xC0*(1-i) | bit
-
-                        # total compressed length (remember shift by 3)
-                        compressed_data[i][header_pos+1:header_pos+3] = \
-                            int.to_bytes(out_pos+3, 2, 'little')
-
-                        # Truncate to used size
-                        compressed_data[i][out_pos+3] = 0xC0*(1-i)
-                        compressed_data[i] = compressed_data[i][0:out_pos+4]
-
-                    # print(f"Main body len: {header_pos-2:04X}")
-                    compressed_data[i][0:2] =\
-                        int.to_bytes(header_pos-2, 2, 'little')
-
-                    done = True
-                    break
-
-                lookback_st = max(0, src_pos - lookback_range)
-                lookback_end = src_pos
-
-                best_len = 0
-                best_len_st = 0
-
-                src_val = source[src_pos]
-                while byte_starts[src_val][byte_ptrs[src_val]] < lookback_st:
-                    byte_ptrs[src_val] += 1
-
-                ptr = byte_ptrs[src_val]
-                while byte_starts[src_val][ptr] < src_pos:
-                    match_len = find_match_len(
-                        source,
-                        byte_starts[src_val][ptr],
-                        src_pos,
-                        max_copy_length
-                    )
-
-                    if match_len > best_len:
+# A token is either a literal byte or a (lookback, length) copy.
+Token = Union[int, Tuple[int, int]]
+
+
+def _window_config(i: int) -> tuple[int, int]:
+    '''Lookback range and max copy length of window configuration i.'''
+    # i=0: use 0x07FF for the range, 0xF800 for the max copy length
+    # i=1: use 0x0FFF for the range, 0xF000 for the max copy length
+    lookback_range = 0x07FF | (i << 11)
+    max_copy_length = ((0xFFFF ^ lookback_range) >> (16-(5-i))) + 3
+    return lookback_range, max_copy_length
+
+
+def _greedy_tokens(source: bytes, lookback_range: int, max_copy_length: int,
+                   chain_depth: Optional[int]) -> list[Token]:
+    '''
+    Greedy LZ parse using hash chains keyed on the next three bytes.  Each
+    copy is the longest match in the window, taking the earliest start on a
+    tie.  A finite chain_depth only tries that many of the most recent
+    candidates.
+    '''
+    src_len = len(source)
+    # head[key] is the latest position whose next three bytes are key and
+    # prev[pos] is the position before pos with the same key.
+    head: dict[int, int] = {}
+    prev = [-1]*src_len
+    num_hashed = 0
+    last_hashable = src_len - 3
+
+    tokens: list[Token] = []
+    src_pos = 0
+    while src_pos < src_len:
+        while num_hashed < src_pos and num_hashed <= last_hashable:
+            key = (source[num_hashed] << 16 | source[num_hashed+1] << 8 |
+                   source[num_hashed+2])
+            prev[num_hashed] = head.get(key, -1)
+            head[key] = num_hashed
+            num_hashed += 1
+
+        best_len = 0
+        best_st = 0
+        limit = min(max_copy_length, src_len - src_pos)
+        if limit >= 3:
+            key = (source[src_pos] << 16 | source[src_pos+1] << 8 |
+                   source[src_pos+2])
+            lookback_st = max(0, src_pos - lookback_range)
+            cand = head.get(key, -1)
+            depth = 0
+            while cand >= lookback_st and depth != chain_depth:
+                depth += 1
+                # Only a match at least as long as the best can win.  Check
+                # the last byte it would need before comparing the rest.
+                if (
+                        best_len <= 3 or
+                        source[cand+best_len-1] == source[src_pos+best_len-1]
+                        and source[cand+3:cand+best_len] ==
+                        source[src_pos+3:src_pos+best_len]
+                ):
+                    match_len = max(best_len, 3)
+                    while (match_len < limit and
+                           source[cand+match_len] == source[src_pos+match_len]):
+                        match_len += 1
+                    # Walking back in time, so >= keeps the earliest start.
+                    if match_len >= best_len:
                         best_len = match_len
-                        best_len_st = byte_starts[src_val][ptr]
-
-                    ptr += 1
-
-                if best_len > 2:
-                    # print(f'Best len: {best_len:02X}')
-                    # We matched at least 3 bytes, so we'll use compression
-
-                    # Mark the header to use compression for this bit
-                    compressed_data[i][header_pos] |= (1 << bit)
-
-                    lookback = src_pos - best_len_st
-                    # print(f"\tlookback: {lookback:04X}")
-
-                    # length is encoded with a -3 because there are always at
-                    # least 3 bytes to copy.  The length is shifted to the most
-                    # significant bits.  The shift depends on i.
-                    length = ((best_len-3) << (16-(5-i)))
-
-                    compr_stream = lookback | length
+                        best_st = cand
+                cand = prev[cand]
 
-                    compressed_data[i][out_pos:out_pos+2] = \
-                        int.to_bytes(compr_stream, 2, 'little')
-
-                    out_pos += 2
-                    src_pos += best_len
-                else:
-                    # We failed to match 3 or more bytes, so just copy a byte
-                    compressed_data[i][out_pos] = source[src_pos]
-                    out_pos += 1
-                    src_pos += 1
-            # End of for loop to fill packet
-            # print(f'Header: {compressed_data[i][header_pos]:02X}')
-        # End of while not done loop
-
-        if len(compressed_data[i]) < best_size:
-            best_size = len(compressed_data[i])
-            best_ind = i
+        if best_len > 2:
+            tokens.append((src_pos - best_st, best_len))
+            src_pos += best_len
         else:
-            best_ind = 0
-
-    # Test code for comparing performance of the two window schemes
-    # if len(compressed_data[0]) < len(compressed_data[1]):
-    #     min_len = len(compressed_data[0])
-    #     max_len = len(compressed_data[1])
-    #     best = "0"
-    # elif len(compressed_data[1]) < len(compressed_data[0]):
-    #     min_len = len(compressed_data[1])
-    #     max_len = len(compressed_data[0])
-    #     best = "1"
-    # else:
-    #     min_len = 1
-    #     max_len = 1
-    #     best = "Tie"
-
-    # print(max_len/min_len, 'Best:', best)
-
-    # if len(compressed_data[0]) <= len(compressed_data[1]):
-    #     return compressed_data[0]
-    # else:
-    #     return compressed_data[1]
-
-    return compressed_data[0]
-    
-
-# Modification of Michael Springer's code to fit my applications
-# This is a greedy algorithm. On occassion it will be a byte (or two?) larger
-# than the original game's compression.  This happens when you almost fill up
-# the addendum packet but then have to add another 2 bytes for the compressed
-# length prior to the addendum.
-def compress_py(source):
-
-    # We have to try compressing in two configurations and then return the
-    # better of the two.
-    compressed_data = [bytearray([0 for i in range(0x10000)])
-                       for j in range(2)]
-
-    best_size = 0x10000
-
-    for i in range(2):
-        # i=0: use 0x07FF for the range, 0xF800 for the max copy length
-        # i=1: use 0x0FFF for the range, 0xF000 for the max copy length
-        lookback_range = 0x07FF | (i << 11)
-
-        # max_copy_length = 0xFFFF ^ lookback_range (bits used)
-        max_copy_length = (0xFFFF ^ lookback_range) >> (16-(5-i))
-        max_copy_length += 3
-
-        # print(f'Iteration: i={i}')
-        # print(f'{lookback_range:04X} {max_copy_length:04X}')
-        src_pos = 0
-
-        # First two bytes are main body length
-        # Next byte will be the first packet's header
-        out_pos = 2
-
-        done = False
-
-        # print('i =', i)
-
-        while out_pos < best_size and not done:
-            # Fill up a compressed packet
-            header_pos = out_pos
-            out_pos += 1
-
-            # print(f'out_pos: {out_pos:04X}')
-
-            for bit in range(8):
-
-                # While filling a packet we ran out of source.
-                if src_pos == len(source):
-                    if bit == 0:
-                        # If bit == 0, then we ran out after filling a packet.
-                        # This means no addendum.
-                        compressed_data[i][header_pos] = 0xC0*(1-i)
-
-                        # Truncate to used size
-                        compressed_data[i] = compressed_data[i][0:header_pos+1]
-                    else:
-                        # Otherwise, we're mid-packet.  The packet becomes
-                        # the addendum.
-                        # print("Addendum.")
-
-                        # set unused bits of header for addendum header
-                        mask = (0xFF << bit) & 0xFF
-                        compressed_data[i][header_pos] |= mask
-
-                        # shift the addendum packet down three bytes
-                        compressed_data[i][header_pos+3:out_pos+3] = \
-                            compressed_data[i][header_pos:out_pos]
-
-                        # copy range + addendum length
-                        compressed_data[i][header_pos] = \
-                            0xC0*(1-i) | bit
-
-                        # total compressed length (remember shift by 3)
-                        compressed_data[i][header_pos+1:header_pos+3] = \
-                            to_little_endian(out_pos+3, 2)
-
-                        # Truncate to used size
-                        compressed_data[i][out_pos+3] = 0xC0*(1-i)
-                        compressed_data[i] = compressed_data[i][0:out_pos+4]
-
-                    # print(f"Main body len: {header_pos-2:04X}")
-                    compressed_data[i][0:2] = \
-                        to_little_endian(header_pos-2, 2)
-
-                    done = True
-                    break
-
-                lookback_st = max(0, src_pos - lookback_range)
-                lookback_end = src_pos
-
-                best_len = 0
-                best_len_st = 0
-
-                # Weird python stuff to avoid too many loops
-                # I hope we can do better than this.
-
-                # Use list comprehension to find potential starts
-                starts = [x for x in range(lookback_st, lookback_end)
-                          if source[x] == source[src_pos]]
-
-                # Refine the list of starts by matching the next bytes up
-                # to max copy length
-                for j in range(1, max_copy_length):
-                    next_starts = \
-                        [x for x in starts
-                         if (src_pos + j < len(source)
-                             and source[x+j] == source[src_pos+j])]
-
-                    if not next_starts:  # 'pythonic' way to check empty
+            tokens.append(source[src_pos])
+            src_pos += 1
+
+    return tokens
+
+
+def _pack_tokens(tokens: list[Token], i: int) -> bytearray:
+    '''Write tokens as packets using window configuration i.'''
+    length_shift = 16-(5-i)
+    out = bytearray(2)
+    for packet_st in range(0, len(tokens), 8):
+        header_pos = len(out)
+        header = 0
+        out.append(0)
+        for bit, token in enumerate(tokens[packet_st:packet_st+8]):
+            if isinstance(token, int):
+                out.append(token)
+            else:
+                header |= 1 << bit
+                lookback, copy_len = token
+                out += ((copy_len-3) << length_shift | lookback).to_bytes(
+                    2, 'little')
+        out[header_pos] = header
+
+    last_bits = len(tokens) % 8
+    if last_bits == 0:
+        # Ran out after filling a packet.  This means no addendum.
+        header_pos = len(out)
+        out.append(0xC0*(1-i))
+    else:
+        # The last packet becomes the addendum.  Set the unused header
+        # bits, then put the copy range + addendum length and the total
+        # compressed length in front of it.
+        header_pos = len(out) - (
+            1 + sum(1 if isinstance(token, int) else 2
+                    for token in tokens[-last_bits:])
+        )
+        out[header_pos] |= (0xFF << last_bits) & 0xFF
+        out_pos = len(out)
+        out[header_pos:header_pos] = bytes([0xC0*(1-i) | last_bits]) + \
+            int.to_bytes(out_pos+3, 2, 'little')
+        out.append(0xC0*(1-i))
+
+    out[0:2] = int.to_bytes(header_pos-2, 2, 'little')
+    return out
+
+
+def compress_py_hc(source: ByteString,
+                   chain_depth: Optional[int] = MAX_CHAIN_DEPTH) -> bytearray:
+    '''
+    Greedy compressor that finds matches with hash chains.  With
+    chain_depth=MAX_CHAIN_DEPTH every copy is the longest in the window.
+    '''
+    lookback_range, max_copy_length = _window_config(0)
+    tokens = _greedy_tokens(bytes(source), lookback_range, max_copy_length,
+                            chain_depth)
+    return _pack_tokens(tokens, 0)
+
+
+def _longest_matches(source: bytes, lookback_range: int,
+                     max_copy_length: int) -> tuple[list[int], list[int]]:
+    '''
+    Length and lookback of a longest match (0 if under 3 bytes) at every
+    position of source.
+    '''
+    src_len = len(source)
+    head: dict[int, int] = {}
+    prev = [-1]*src_len
+    lengths = [0]*src_len
+    lookbacks = [0]*src_len
+
+    for src_pos in range(src_len - 2):
+        key = (source[src_pos] << 16 | source[src_pos+1] << 8 |
+               source[src_pos+2])
+        limit = min(max_copy_length, src_len - src_pos)
+        lookback_st = src_pos - lookback_range
+        best_len = 0
+        cand = head.get(key, -1)
+        while cand >= 0 and cand >= lookback_st:
+            if (
+                    best_len <= 3 or
+                    source[cand+best_len-1] == source[src_pos+best_len-1]
+                    and source[cand+3:cand+best_len] ==
+                    source[src_pos+3:src_pos+best_len]
+            ):
+                match_len = max(best_len, 3)
+                while (match_len < limit and
+                       source[cand+match_len] == source[src_pos+match_len]):
+                    match_len += 1
+                if match_len > best_len:
+                    best_len = match_len
+                    lookbacks[src_pos] = src_pos - cand
+                    if match_len == limit:
                         break
-                    else:
-                        starts = next_starts
-                        best_len_st = starts[0]
-                        best_len = j+1
-
-                '''
-                # This is how it would go in a C program and in Geiger's orig
-
-                best_len = 0
-                for start in range(lookback_st, lookback_end):
-                # for start in starts:
-
-                    # Match the source starting at 'start' with the source
-                    # starting at 'src_pos'
-                    cur_len = 0
-
-                    while (src_pos + cur_len < len(source) and
-                           cur_len < max_copy_length and
-                           source[start+cur_len] == source[src_pos+cur_len]):
-                        cur_len += 1
-
-                    # Update best match if needed
-                    if cur_len >= best_len:
-                        best_len = cur_len
-                        best_len_st = start
-                        if cur_len == max_copy_length:
-                            break
-
-                '''
-
-                if best_len > 2:
-                    # print(f'Best len: {best_len:02X}')
-                    # We matched at least 3 bytes, so we'll use compression
-
-                    # Mark the header to use compression for this bit
-                    compressed_data[i][header_pos] |= (1 << bit)
-
-                    lookback = src_pos - best_len_st
-                    # print(f"\tlookback: {lookback:04X}")
-
-                    # length is encoded with a -3 because there are always at
-                    # least 3 bytes to copy.  The length is shifted to the most
-                    # significant bits.  The shift depends on i.
-                    length = ((best_len-3) << (16-(5-i)))
+            cand = prev[cand]
+        lengths[src_pos] = best_len
+
+        prev[src_pos] = head.get(key, -1)
+        head[key] = src_pos
+
+    return lengths, lookbacks
+
+
+def _optimal_tokens(source: bytes, lookback_range: int,
+                    max_copy_length: int) -> list[Token]:
+    '''
+    Parse with the fewest output bytes, counting a header byte for every
+    eight tokens and the addendum bytes when the last packet is partial.
+    '''
+    src_len = len(source)
+    lengths, lookbacks = _longest_matches(source, lookback_range,
+                                          max_copy_length)
+
+    # cost[k][pos] is the size of the packed output for source[pos:] when k
+    # tokens of the current packet are already used.  take[k][pos] is the
+    # length of the token to emit there (1 for a literal).
+    cost = [[0]*(src_len+1) for _ in range(8)]
+    take = [[1]*(src_len+1) for _ in range(8)]
+    cost[0][src_len] = 1  # End byte
+    for k in range(1, 8):
+        cost[k][src_len] = 4  # Addendum header and length, end byte
+
+    for pos in range(src_len-1, -1, -1):
+        match_len = lengths[pos]
+        for k in range(8):
+            next_cost = cost[(k+1) & 7]
+            best = 1 + next_cost[pos+1]
+            best_take = 1
+            if match_len:
+                # Any length up to the longest match can be copied.
+                tail = next_cost[pos+3:pos+match_len+1]
+                copy_cost = min(tail)
+                if 2 + copy_cost < best:
+                    best = 2 + copy_cost
+                    best_take = tail.index(copy_cost) + 3
+            cost[k][pos] = best + (k == 0)
+            take[k][pos] = best_take
+
+    tokens: list[Token] = []
+    pos = 0
+    k = 0
+    while pos < src_len:
+        length = take[k][pos]
+        if length == 1:
+            tokens.append(source[pos])
+        else:
+            tokens.append((lookbacks[pos], length))
+        pos += length
+        k = (k+1) & 7
 
-                    compr_stream = lookback | length
+    return tokens
 
-                    compressed_data[i][out_pos:out_pos+2] = \
-                        to_little_endian(compr_stream, 2)
 
-                    out_pos += 2
-                    src_pos += best_len
-                else:
-                    # We failed to match 3 or more bytes, so just copy a byte
-                    compressed_data[i][out_pos] = source[src_pos]
-                    out_pos += 1
-                    src_pos += 1
-            # End of for loop to fill packet
-            # print(f'Header: {compressed_data[i][header_pos]:02X}')
-        # End of while not done loop
-
-        if len(compressed_data[i]) < best_size:
-            best_size = len(compressed_data[i])
-
-    if len(compressed_data[0]) <= len(compressed_data[1]):
-        return compressed_data[0]
-    else:
-        return compressed_data[1]
+def compress_py_max(source: ByteString) -> bytearray:
+    '''
+    Smallest output of an optimal parse under both window configurations.
+    Much slower than compress, so meant for final builds.
+    '''
+    source = bytes(source)
+    best = None
+    for i in range(2):
+        lookback_range, max_copy_length = _window_config(i)
+        packed = _pack_tokens(
+            _optimal_tokens(source, lookback_range, max_copy_length), i
+        )
+        if best is None or len(packed) < len(best):
+            best = packed
+    return best
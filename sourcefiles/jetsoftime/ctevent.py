@@ -1,17 +1,26 @@
 from __future__ import annotations
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 import enum
+from itertools import accumulate
 from pathlib import Path
-from typing import ByteString, Optional, Union, Tuple
+import sys
+from typing import ByteString, Iterable, Iterator, Optional, Union, Tuple
 
-from .ctdecompress import compress, decompress, get_compressed_length, \
-    get_compressed_packet
+from .compressioncache import CompressionCache, script_digest
+from .ctdecompress import DECOMPRESS_BUFFER_SIZE, MAX_CHAIN_DEPTH, \
+    decompress, decompress_into, get_compressed_length, get_compressed_packet
 from .ctenums import LocID
 from .byteops import get_value_from_bytes, to_little_endian, to_file_ptr, \
     to_rom_ptr
 from . import ctstrings
-from .eventcommand import EventCommand as EC, get_command, Platform
+from .eventcommand import EventCommand as EC, get_command, Platform, \
+    command_length, DECODED_COMMAND_IDS
 from .eventfunction import EventFunction as EF
-from .freespace import FSRom, FSWriteType
+from .functiontable import FunctionTable, pointer_array
+from .instructionindex import InstructionIndex
+from .freespace import FSRom, FSWriteType, FreeSpaceError
 
 
 class FunctionID(enum.IntEnum):
@@ -114,20 +123,91 @@ class Event:
 
         self.data = bytearray()
 
+        # Set by every method that changes data or strings.  ScriptManager
+        # only writes dirty scripts and clears the flag after a write.
+        # Code that edits self.data directly must set it too.
+        self.dirty = False
+
         self.modified_strings = False
         self.strings = []
         self.platform: Platform = Platform.SNES
 
+        self._instruction_index: Optional[InstructionIndex] = None
+        self._function_table: Optional[FunctionTable] = None
+
+        # Edits queued by batch(): (pos, del_len, ins_bytes)
+        self._batch: Optional[list[Tuple[int, int, bytes]]] = None
+        self._batch_len = 0
+
     def get_bytearray(self) -> bytearray:
         return bytearray([self.num_objects]) + self.data
 
+    # Changed strings always need a write, so flagging them marks the
+    # script dirty.
+    @property
+    def modified_strings(self) -> bool:
+        return self._modified_strings
+
+    @modified_strings.setter
+    def modified_strings(self, value: bool):
+        self._modified_strings = value
+        if value:
+            self.dirty = True
+
+    # The instruction index is rebuilt on demand.  Methods that change the
+    # layout of self.data either patch it (insert_commands/delete_commands)
+    # or drop it.  Direct edits to self.data that change opcodes or command
+    # lengths must call invalidate_instruction_index().
+    @property
+    def instruction_index(self) -> InstructionIndex:
+        '''Index of every command from object 0 to the end of the data.'''
+        index = self._valid_instruction_index()
+        if index is None:
+            index = InstructionIndex(self.data, self.get_object_start(0),
+                                     self.platform)
+            self._instruction_index = index
+        return index
+
+    def invalidate_instruction_index(self):
+        self._instruction_index = None
+
+    def _valid_instruction_index(self) -> Optional[InstructionIndex]:
+        index = self._instruction_index
+        if (
+                index is None or index.platform != self.platform or
+                not index.is_valid_for(self.data, self.get_object_start(0))
+        ):
+            return None
+        return index
+
+    def _command_offsets(self, start_pos: int,
+                         end_pos: int) -> Iterator[int]:
+        '''
+        Yield the offset of each command starting in [start_pos, end_pos)
+        when walking forward from start_pos.
+        '''
+        index = self.instruction_index
+        first = index.locate(start_pos)
+        if first is not None:
+            offsets = index.offsets
+            for ind in range(first, index.bound(end_pos)):
+                yield offsets[ind]
+            return
+
+        # start_pos is not on the indexed command grid.  Walk it directly.
+        pos = start_pos
+        while pos < end_pos:
+            yield pos
+            pos += command_length(self.data, pos, self.platform)
+
     @staticmethod
-    def from_rom_location(rom: ByteString, loc_id: int) -> Event:
+    def from_rom_location(rom: ByteString, loc_id: int,
+                          buf: Optional[bytearray] = None) -> Event:
         ''' Read an event from the specified game location. '''
 
         ptr = get_loc_event_ptr(rom, loc_id)
         print(hex(ptr))
-        return Event.from_rom(rom, ptr)
+        return Event.from_rom(rom, ptr, buf)
 
     @staticmethod
     def from_flux(filename: str):
@@ -210,17 +290,27 @@ class Event:
         return ret_script
 
     @classmethod
-    def from_rom(cls, rom: ByteString, ptr: int) -> Event:
+    def from_rom(cls, rom: ByteString, ptr: int,
+                 buf: Optional[bytearray] = None) -> Event:
+        '''
+        Read the event whose compressed packet is at rom[ptr].  Loaders
+        reading many scripts can pass a buf of DECOMPRESS_BUFFER_SIZE bytes
+        to decompress into instead of allocating one per script.
+        '''
         ret_event = Event()
 
-        event = decompress(rom, ptr)
+        if buf is None:
+            buf = decompress(rom, ptr)
+            out_len = len(buf)
+        else:
+            out_len = decompress_into(rom, ptr, buf)
 
         # Note: The game itself writes all pointers as offsets from the initial
         # byte that gives the number of objects.  So we're going to store the
         # script data without that initial byte so that the offsets are actual
         # indices into the data.
-        ret_event.data = event[1:]
-        ret_event.num_objects = event[0]
+        ret_event.data = buf[1:out_len]
+        ret_event.num_objects = buf[0]
 
         # According to Geiger's notes, sometimes there are extra pointers.
         # I might just throw them away, but potentially these can be associated
@@ -256,12 +346,8 @@ class Event:
     def get_commands_for_object(self, i):
         pos = self.get_object_start(i)
         end = self.get_object_end(i)
-        commands = []
-        while pos < end:
-            cmd = get_command(self.data, pos, self.platform)
-            commands.append(cmd)
-            pos += len(cmd)
-        return commands
+        return [get_command(self.data, pos, self.platform)
+                for pos in self._command_offsets(pos, end)]
     
     def get_all_commands(self):
         command_map = {}
@@ -323,14 +409,11 @@ class Event:
 
         string_indices = set()
 
-        while pos < end:
-            cmd = get_command(self.data, pos, self.platform)
-
-            if cmd.command in EC.str_commands:
+        for pos in self._command_offsets(pos, end):
+            if DECODED_COMMAND_IDS[self.data[pos]] in EC.str_commands:
+                cmd = get_command(self.data, pos, self.platform)
                 string_indices.add(cmd.args[0])
 
-            pos += len(cmd)
-
         ret_dict = {
             index: bytearray(self.strings[index])
             for index in string_indices
@@ -345,18 +428,14 @@ class Event:
         start = self.get_function_start(0, 0)
         end = min(self.get_object_end(0), len(self.data))
 
-        pos = start
         found = False
-        while pos < end:
-            cmd = get_command(self.data, pos, self.platform)
-
-            if cmd.command == 0xB8:
+        for pos in self._command_offsets(start, end):
+            if DECODED_COMMAND_IDS[self.data[pos]] == 0xB8:
+                cmd = get_command(self.data, pos, self.platform)
                 string_index = cmd.args[0]
                 found = True
                 # Can maybe just return here.  There should only be one
 
-            pos += len(cmd)
-
         if not found:
             print("Warning: No string index.")
             return None
@@ -387,18 +466,15 @@ class Event:
         pos = self.get_object_start(0)
 
         str_pos = None
-        while pos < len(self.data):
-            cmd = get_command(self.data, pos, self.platform)
-
-            if cmd.command == 0xB8:
+        for pos in self._command_offsets(pos, len(self.data)):
+            if DECODED_COMMAND_IDS[self.data[pos]] == 0xB8:
+                cmd = get_command(self.data, pos, self.platform)
                 str_pos = cmd.args[0]
                 # print(cmd)
 
                 # The string index should only be set once
                 # break
 
-            pos += len(cmd)
-
         self.modified_strings = False
         # indices that are used
         str_indices = set()
@@ -408,16 +484,13 @@ class Event:
         str_addrs = []
 
         pos = self.get_object_start(0)
-        while pos < len(self.data):
-            cmd = get_command(self.data, pos, self.platform)
-
-            if cmd.command in EC.str_commands:
+        for pos in self._command_offsets(pos, len(self.data)):
+            if DECODED_COMMAND_IDS[self.data[pos]] in EC.str_commands:
+                cmd = get_command(self.data, pos, self.platform)
                 # string index argument is 0th arg
                 str_indices.add(cmd.args[0])
                 str_addrs.append(pos+1)
 
-            pos += len(cmd)
-
         # turn str_indices into a sorted list
         str_indices_list = sorted(list(str_indices))
         self.strings = []
@@ -450,6 +523,35 @@ class Event:
 
         # end if there are any strings
 
+    @contextmanager
+    def _pointer_table(self, data: Optional[bytearray] = None):
+        '''
+        The pointer table of data (default self.data) as u16s.  On little
+        endian hosts this is a zero-copy memoryview, which pins the buffer:
+        data can not be resized until the block exits.
+        '''
+        if data is None:
+            data = self.data
+        size = 32*self.num_objects
+        if sys.byteorder == 'little':
+            with memoryview(data) as raw, raw[:size].cast('H') as ptrs:
+                yield ptrs
+        else:
+            ptrs = pointer_array(data[:size])
+            yield ptrs
+            ptrs.byteswap()
+            data[:size] = ptrs.tobytes()
+
+    @property
+    def function_table(self) -> FunctionTable:
+        '''Extents and link status of every function, rebuilt when stale.'''
+        table = self._function_table
+        if table is None or not table.is_valid_for(self.data):
+            table = FunctionTable(self.data[:32*self.num_objects],
+                                  len(self.data))
+            self._function_table = table
+        return table
+
     def get_object_start(self, obj_id: int) -> int:
         return get_value_from_bytes(self.data[32*obj_id: 32*obj_id+2])
 
@@ -466,21 +568,9 @@ class Event:
         return get_value_from_bytes(self.data[ptr:ptr+2])
 
     def get_function_end(self, obj_id: int, func_id: int) -> int:
-        start = self.get_function_start(obj_id, func_id)
-
-        # print(f"{start:04X}")
-
-        next_ptr_st = 32*obj_id + 2*func_id + 2
-
-        for ptr in range(next_ptr_st, self.num_objects*32, 2):
-            next_fn_st = get_value_from_bytes(self.data[ptr:ptr+2])
-            # print("f{next_fn_st:04X}")
-            if next_fn_st != start:
-                return next_fn_st
-
-        # If we get here, we didn't find a nonempty function after the given
-        # function.  So our function goes to the end of the data.
-        return len(self.data)
+        # The end is the next different function start, or the end of the
+        # data if no nonempty function follows.
+        return self.function_table.end(obj_id, func_id)
     
     def get_raw_function(self, obj_id: int, func_id: int) -> bytearray:
         start = self.get_function_start(obj_id, func_id)
@@ -520,11 +610,13 @@ class Event:
         # print(f"{obj_st+1:04X} - {obj_end+1:04X}")
         # input()
 
+        self.dirty = True
         self.__shift_starts(obj_st, -obj_len)
         self.__shift_starts(-1, -32)
 
         del self.data[obj_st:obj_end]
         del self.data[32*obj_id:32*(obj_id+1)]
+        self.invalidate_instruction_index()
 
         self.num_objects -= 1
 
@@ -633,6 +725,7 @@ class Event:
 
         obj_data = self.data[obj_start:obj_end]
 
+        self.dirty = True
         self.data[32*self.num_objects:32*self.num_objects] = obj_ptrs[:]
 
         for ptr in range(0, 32*self.num_objects, 2):
@@ -640,6 +733,7 @@ class Event:
             self.data[ptr:ptr+2] = to_little_endian(ptr_loc+32, 2)
 
         self.data.extend(obj_data)
+        self.invalidate_instruction_index()
         self.num_objects += 1
 
         return self.num_objects-1
@@ -654,7 +748,9 @@ class Event:
         end_b = to_little_endian(len(self.data)+32, 2)
 
         new_ptrs = b''.join(end_b for i in range(16))
+        self.dirty = True
         self.data[32*self.num_objects:32*self.num_objects] = new_ptrs
+        self.invalidate_instruction_index()
 
         # shift all old pointers by 32
         for i in range(self.num_objects*16):
@@ -727,6 +823,8 @@ class Event:
 
         self.data[insert_pos:insert_pos] = object_data
         self.data[32*ins_id:32*ins_id] = ins_obj_ptrs_b
+        self.invalidate_instruction_index()
+        self.dirty = True
         self.num_objects += 1
         self.__shift_starts(-1, 32)
 
@@ -734,34 +832,17 @@ class Event:
         '''
         Determine whether a function links to another object's function.
         '''
-        this_obj_st = self.get_object_start(obj_id)
-        if obj_id == self.num_objects - 1:
-            next_obj_st = len(self.data)
-        else:
-            next_obj_st = self.get_object_start(obj_id+1)
-
-        this_fn_st = self.get_function_start(obj_id, func_id)
-        return not (this_obj_st <= this_fn_st < next_obj_st)
+        return self.function_table.is_linked(obj_id, func_id)
 
     def _function_is_empty(self, obj_id, func_id) -> bool:
         '''
         Determine whether a function is empty (links to previous function)
         '''
 
-        if func_id == 0:
-            return False
-
-        given_start = self.get_function_start(obj_id, func_id)
-        for ind in range(func_id - 1, -1, -1):
-            prev_start = self.get_function_start(obj_id, ind)
-            if prev_start == given_start:
-                return True
-
-        return False
+        return self.function_table.is_empty(obj_id, func_id)
 
     def _function_is_real(self, obj_id, func_id) -> bool:
-        return not (self._function_is_empty(obj_id, func_id) or
-                    self._function_is_linked(obj_id, func_id))
+        return self.function_table.is_real(obj_id, func_id)
 
     def get_link_target(self, obj_id: int, func_id: int) -> tuple[int, int] | None:
         '''
@@ -769,18 +850,7 @@ class Event:
         (target_obj_id, target_func_id) of the real function it points to.
         Returns None if the function is real, or if the link is unresolvable.
         '''
-        if self._function_is_real(obj_id, func_id):
-            return None
-        target_offset = self.get_function_start(obj_id, func_id)
-        for tgt_obj in range(self.num_objects):
-            for tgt_func in range(16):
-                if (tgt_obj, tgt_func) == (obj_id, func_id):
-                    continue
-                if not self._function_is_real(tgt_obj, tgt_func):
-                    continue
-                if self.get_function_start(tgt_obj, tgt_func) == target_offset:
-                    return (tgt_obj, tgt_func)
-        return None
+        return self.function_table.link_target(obj_id, func_id)
 
     def break_function_link(self, obj_id: int, func_id: int) -> None:
         '''
@@ -795,6 +865,7 @@ class Event:
         startup_ptr = self.get_function_start(obj_id, 0)
         ptr_st = obj_id * 32 + func_id * 2
         self.data[ptr_st:ptr_st + 2] = int.to_bytes(startup_ptr, 2, 'little')
+        self.dirty = True
 
     def set_function_link(self, obj_id: int, func_id: int,
                           target_obj_id: int, target_func_id: int) -> None:
@@ -814,6 +885,7 @@ class Event:
         target_offset = self.get_function_start(target_obj_id, target_func_id)
         ptr_st = obj_id * 32 + func_id * 2
         self.data[ptr_st:ptr_st + 2] = int.to_bytes(target_offset, 2, 'little')
+        self.dirty = True
 
     def _get_next_true_start(self, obj_id: int, func_id: int) -> int:
         '''
@@ -915,6 +987,8 @@ class Event:
                                              func_st + shift)
 
         self.data[true_start:true_end] = ev_func.get_bytearray()
+        self.invalidate_instruction_index()
+        self.dirty = True
 
         # for i in range(0x10):
         #     is_linked = self._function_is_linked(obj_id, i)
@@ -994,6 +1068,8 @@ class Event:
         # print(f"{func_st+1:04X} to {func_end+1:04X}")
 
         self.data[func_st:func_end] = ev_func.get_bytearray()
+        self.invalidate_instruction_index()
+        self.dirty = True
 
         # Now shift all of the pointers after the one for the function we set
         # TODO: Make sure that function starts are really monotone
@@ -1028,6 +1104,7 @@ class Event:
         # pointers and move on with our lives.
 
         # Shift Pointers.  Don't forget the extra 32 when the ptrs go.
+        self.dirty = True
 
         for ptr in range(0, 32*(obj_id), 2):
             ptr_loc = get_value_from_bytes(self.data[ptr:ptr+2])
@@ -1041,6 +1118,7 @@ class Event:
         # delete object data and pointers
         del self.data[start:end]
         del self.data[32*obj_id:32*(obj_id+1)]
+        self.invalidate_instruction_index()
 
         # update object count
         self.num_objects -= 1
@@ -1069,7 +1147,9 @@ class Event:
                 self.insert_commands(cmd.to_bytearray(), start)
         else:
             str_ind_bytes = to_little_endian(rom_ptr, 3)
-            self.data[pos+1:pos+4] = str_ind_bytes
+            if self.data[pos+1:pos+4] != str_ind_bytes:
+                self.data[pos+1:pos+4] = str_ind_bytes
+                self.dirty = True
 
     def find_command_opt(
             self, cmd_ids: list[int],
@@ -1089,14 +1169,17 @@ class Event:
 
         # print(f"{start_pos:04X}, {end_pos:04X}")
 
-        pos = start_pos
-        while pos < end_pos:
-            cmd = get_command(self.data, pos, self.platform)
-
-            if cmd.command in cmd_ids:
-                return (pos, cmd)
-
-            pos += len(cmd)
+        index = self.instruction_index
+        first = index.locate(start_pos)
+        if first is not None:
+            ind = index.find(cmd_ids, first, end_pos)
+            if ind is not None:
+                pos = index.offsets[ind]
+                return (pos, get_command(self.data, pos, self.platform))
+        else:
+            for pos in self._command_offsets(start_pos, end_pos):
+                if DECODED_COMMAND_IDS[self.data[pos]] in cmd_ids:
+                    return (pos, get_command(self.data, pos, self.platform))
 
         # returning colorcrash so mypy doesn't want Optional[Event]
         return (None, EC.get_blank_command(1))
@@ -1135,8 +1218,10 @@ class Event:
 
         jump_cmds = EC.fwd_jump_commands + EC.back_jump_commands
 
-        pos = start_pos
-        while pos < end_pos:
+        for pos in self._command_offsets(start_pos, end_pos):
+            # Both matches below need the same command id.
+            if DECODED_COMMAND_IDS[self.data[pos]] != find_cmd.command:
+                continue
             cmd = get_command(self.data, pos, self.platform)
 
             if cmd == find_cmd:
@@ -1148,8 +1233,6 @@ class Event:
             ):
                 return pos
 
-            pos += len(cmd)
-
         return None
 
     def find_exact_command(
@@ -1184,49 +1267,30 @@ class Event:
                       after_pos: int,
                       shift: int):
 
-        pos: Optional[int] = self.get_object_start(0)
-
-        jmp_cmds = EC.fwd_jump_commands + EC.back_jump_commands
-
-        while True:
-            # Find the next jump command
-            (pos, cmd) = self.find_command_opt(jmp_cmds, pos)
-
-            if pos is None:
-                break
-
-            jump_mult = 2*(cmd.command in EC.fwd_jump_commands)-1
-            jump_target = pos + len(cmd) + cmd.args[-1]*jump_mult - 1
-
-            # For backwards jumps, we need to count the bytes of the command
-            # within the bounds of the jump block.
-            cmd_bound = pos
-            if jump_mult == -1:
-                cmd_bound += len(cmd)
-
-            # This has been wrong a few times.  Let's be clear.
-            # We only shift if [before_pos, after_pos) is contained in
-            # (start, end).  We don't shift when before_pos == start
-            # because this means either the insertion will happen prior
-            # to the jump (before_pos == after_pos) or the deletion would
-            # include the jump command.
-            start = min(cmd_bound, jump_target)
-            end = max(cmd_bound, jump_target)
-
-            if before_pos == after_pos:
-                can_shift_aft = (end > after_pos)
-            else:
-                can_shift_aft = (end >= after_pos)
+        # Only jumps within a byte's reach of the edit can span it.
+        for site in self.instruction_index.jumps_spanning(before_pos,
+                                                          after_pos):
+            if self._jump_spans_edit(site, before_pos, after_pos):
+                self.data[site.pos + site.width - 1] += shift
 
-            if can_shift_aft and start < before_pos:
-                arg_offset = len(cmd) - cmd.arg_lens[-1]
-                self.data[pos+arg_offset] += shift
-            else:
-                pass
-                # print('not shifting')
-                # input()
+    @staticmethod
+    def _jump_spans_edit(site, before_pos: int, after_pos: int) -> bool:
+        # For backwards jumps, the bytes of the command are within the bounds
+        # of the jump block.  JumpSite.span accounts for this.
+        start, end = site.span
+
+        # This has been wrong a few times.  Let's be clear.
+        # We only shift if [before_pos, after_pos) is contained in
+        # (start, end).  We don't shift when before_pos == start
+        # because this means either the insertion will happen prior
+        # to the jump (before_pos == after_pos) or the deletion would
+        # include the jump command.
+        if before_pos == after_pos:
+            can_shift_aft = (end > after_pos)
+        else:
+            can_shift_aft = (end >= after_pos)
 
-            pos += len(cmd)
+        return can_shift_aft and start < before_pos
 
     # Helper method for dealing with insertions and deletions.
     # All function starts strictly exceeding start_thresh will be shifted
@@ -1241,11 +1305,9 @@ class Event:
     #       the pointer block expanded/contracted.  Use start_thresh <=0 and
     #       shift will be +/- a multiple of 32.
     def __shift_starts(self, start_thresh: int, shift: int):
-        for ptr in range(32*self.num_objects-2, -2, -2):
-            ptr_loc = get_value_from_bytes(self.data[ptr:ptr+2])
-
-            if ptr_loc > start_thresh:
-                self.data[ptr:ptr+2] = to_little_endian(ptr_loc+shift, 2)
+        with self._pointer_table() as ptrs:
+            ptrs[:] = array('H', [ptr_loc+shift if ptr_loc > start_thresh
+                                  else ptr_loc for ptr_loc in ptrs])
 
     def __shift_calls_back(self, deleted_obj: int):
         pos: Optional[int] = self.get_function_start(0, 0)
@@ -1314,10 +1376,15 @@ class Event:
                 print("Error: Deleting out of script's range.")
                 raise ValueError
 
-            cmd = get_command(self.data, pos, self.platform)
-            cmd_len += len(cmd)
-            pos += len(cmd)
+            length = command_length(self.data, pos, self.platform)
+            cmd_len += length
+            pos += length
+
+        if self._batch is not None:
+            self._queue_edit(del_pos, cmd_len, b'')
+            return
 
+        self.dirty = True
         pos = del_pos
 
         self.__shift_jumps(before_pos=pos,
@@ -1327,7 +1394,10 @@ class Event:
         self.__shift_starts(start_thresh=del_pos,
                             shift=-cmd_len)
 
+        index = self._valid_instruction_index()
         del self.data[del_pos:del_pos+cmd_len]
+        if index is not None and not index.patch_delete(del_pos, cmd_len):
+            self.invalidate_instruction_index()
 
     def delete_commands_range(self, del_start_pos: int, del_end_pos: int):
         if del_start_pos > del_end_pos:
@@ -1337,9 +1407,14 @@ class Event:
         length_to_delete = del_end_pos - del_start_pos
         deleted_length = 0
         while deleted_length < length_to_delete:
-            cmd = get_command(self.data, pos, self.platform)
-            self.delete_commands(pos)
-            deleted_length += len(cmd)
+            length = command_length(self.data, pos, self.platform)
+            if self._batch is not None:
+                # Queued positions are not shifted, so step over the command.
+                self._queue_edit(pos, length, b'')
+                pos += length
+            else:
+                self.delete_commands(pos)
+            deleted_length += length
 
         if deleted_length != length_to_delete:
             print('Warning: Last deleted command exceeded del_end_pos')
@@ -1403,11 +1478,137 @@ class Event:
         # print(f"{ins_position: 04X}")
         # input()
 
+        if self._batch is not None:
+            self._queue_edit(ins_position, 0, bytes(new_commands))
+            return
+
+        self.dirty = True
+
         # Finally simplifying this using the __shift methods
         self.__shift_jumps(ins_position, ins_position, len(new_commands))
         self.__shift_starts(ins_position, len(new_commands))
 
+        index = self._valid_instruction_index()
         self.data[ins_position:ins_position] = new_commands
+        if (
+                index is not None and
+                not index.patch_insert(ins_position, len(new_commands))
+        ):
+            self.invalidate_instruction_index()
+
+    def replace_commands(self, new_commands: bytearray, pos: int,
+                         num_commands: int = 1):
+        '''Replace num_commands commands at pos with new_commands.'''
+        with self.batch():
+            self.delete_commands(pos, num_commands)
+            self.insert_commands(new_commands, pos)
+
+    @contextmanager
+    def batch(self):
+        '''
+        Queue insert_commands, delete_commands and replace_commands calls
+        and apply them in one pass when the block exits.
+
+        Positions given inside the block refer to the script as it was when
+        the block began, and reads inside the block still see that script.
+        Inserts at the same position keep their call order and go ahead of
+        any delete there, as in replace_commands.  Jumps and function
+        starts are shifted as if the edits had been made one at a time from
+        the end of the script backwards.  Nested blocks join the outer one.
+        If the block raises, the queued edits are dropped.
+        '''
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = []
+        self._batch_len = len(self.data)
+        try:
+            yield self
+            edits = self._batch
+        finally:
+            self._batch = None
+
+        self._apply_edits(edits)
+
+    def _queue_edit(self, pos: int, del_len: int, ins: bytes):
+        if not 32*self.num_objects <= pos <= pos + del_len <= len(self.data):
+            raise ValueError(f"Edit at {pos:04X} is outside the script.")
+        self._batch.append((pos, del_len, ins))
+
+    def _apply_edits(self, edits: list[Tuple[int, int, bytes]]):
+        if not edits:
+            return
+        if len(self.data) != self._batch_len:
+            raise RuntimeError("Script was resized during a batch.")
+
+        # Merge edits at the same position.  sorted() is stable, so inserts
+        # keep their call order.
+        groups: list[list] = []
+        for pos, del_len, ins in sorted(edits, key=lambda edit: edit[0]):
+            if groups and groups[-1][0] == pos:
+                if del_len and groups[-1][1]:
+                    raise ValueError(f"Overlapping deletes at {pos:04X}.")
+                groups[-1][1] += del_len
+                groups[-1][2] += ins
+            else:
+                groups.append([pos, del_len, bytearray(ins)])
+
+        for (pos, del_len, _), (next_pos, _, _) in zip(groups, groups[1:]):
+            if pos + del_len > next_pos:
+                raise ValueError(f"Edit at {next_pos:04X} overlaps a delete.")
+
+        # Decide each jump's shift in original coordinates.  Working from
+        # the end of the script back, earlier edits never move the bounds of
+        # a jump relative to later ones, so this matches sequential edits.
+        index = self.instruction_index
+        jump_shifts: dict[int, int] = {}
+        for pos, del_len, ins in groups:
+            for site in index.jumps_spanning(pos, pos):
+                shift = 0
+                if del_len and self._jump_spans_edit(site, pos,
+                                                     pos + del_len):
+                    shift -= del_len
+                if ins and self._jump_spans_edit(site, pos, pos):
+                    shift += len(ins)
+                if shift:
+                    jump_shifts[site.pos] = \
+                        jump_shifts.get(site.pos, 0) + shift
+
+        positions = [group[0] for group in groups]
+        deltas = list(accumulate(len(ins) - del_len
+                                 for _, del_len, ins in groups))
+
+        new_data = bytearray()
+        cur = 0
+        for pos, del_len, ins in groups:
+            new_data += self.data[cur:pos]
+            new_data += ins
+            cur = pos + del_len
+        new_data += self.data[cur:]
+
+        # Same rule as __shift_starts: starts strictly past an edit move.
+        with self._pointer_table(new_data) as ptrs:
+            ptrs[:] = array('H', [
+                ptr_loc + deltas[bisect_left(positions, ptr_loc) - 1]
+                if ptr_loc > positions[0] else ptr_loc
+                for ptr_loc in ptrs
+            ])
+
+        for jump_pos, shift in jump_shifts.items():
+            group = bisect_right(positions, jump_pos) - 1
+            if group >= 0:
+                pos, del_len, _ = groups[group]
+                if jump_pos < pos + del_len:
+                    # The jump itself was deleted.
+                    continue
+                jump_pos += deltas[group]
+            width = command_length(new_data, jump_pos, self.platform)
+            new_data[jump_pos + width - 1] += shift
+
+        self.dirty = True
+        self.data[:] = new_data
+        self.invalidate_instruction_index()
 
 
     @staticmethod
@@ -1438,21 +1639,37 @@ class ScriptManager:
     def __init__(self, fsrom: FSRom,
                  location_list: list[LocID],
                  loc_data_ptr=0x360000,
-                 event_data_ptr=0x3CF9F0):
+                 event_data_ptr=0x3CF9F0,
+                 compression_cache: Optional[CompressionCache] = None):
         self.fsrom = fsrom
 
+        # Use the slow optimal-parse compressor when writing scripts.  Meant
+        # for final builds where every byte of free space counts.
+        self.max_compression = False
+
+        # Match search depth of the python compressor when ctcompress is
+        # missing.  FAST_CHAIN_DEPTH trades a little size for speed.
+        self.chain_depth = MAX_CHAIN_DEPTH
+
+        if compression_cache is None:
+            compression_cache = CompressionCache()
+        self.compression_cache = compression_cache
+
         self.script_dict: dict[LocID, Event] = {}
         self.orig_len_dict: dict[LocID, int] = {}
 
+        # Hash of the script bytes currently in the rom for each location,
+        # when known.  Writing a script that still matches is skipped.
+        self._rom_digests: dict[LocID, bytes] = {}
+
         # TODO: Just read the ptr from the rom since we have it.
         self.loc_data_ptr = loc_data_ptr
         self.event_data_ptr = event_data_ptr
 
+        # Every script loads through one decompression buffer.
+        self._load_buffer = bytearray(DECOMPRESS_BUFFER_SIZE)
         for loc_id in location_list:
-            self.script_dict[loc_id] = \
-                Event.from_rom_location(self.fsrom.getbuffer(), loc_id)
-            self.orig_len_dict[loc_id] = \
-                get_compressed_event_length(self.fsrom.getbuffer(), loc_id)
+            self._load_script(loc_id)
 
     # A note:  If a script obtained by get_script is edited it will edit
     # the copy in the manager.  This is how I think it should be since
@@ -1460,24 +1677,41 @@ class ScriptManager:
     # clunky.
     def get_script(self, loc_id: LocID) -> Event:
         if loc_id not in self.script_dict:
-            self.script_dict[loc_id] = \
-                Event.from_rom_location(self.fsrom.getbuffer(), loc_id)
-            self.orig_len_dict[loc_id] = \
-                get_compressed_event_length(self.fsrom.getbuffer(), loc_id)
+            self._load_script(loc_id)
 
         return self.script_dict[loc_id]
 
+    def _load_script(self, loc_id: LocID):
+        script = Event.from_rom_location(self.fsrom.getbuffer(), loc_id,
+                                         self._load_buffer)
+        self.script_dict[loc_id] = script
+        self.orig_len_dict[loc_id] = \
+            get_compressed_event_length(self.fsrom.getbuffer(), loc_id)
+        if not script.modified_strings:
+            self._rom_digests[loc_id] = script_digest(script.get_bytearray())
+
     def set_script(self, script, loc_id: LocID):
         if loc_id not in self.script_dict:
             self.orig_len_dict[loc_id] = \
                 get_compressed_event_length(self.fsrom.getbuffer(), loc_id)
 
+        # The rom holds some other script for loc_id.
+        script.dirty = True
         self.script_dict[loc_id] = script
 
+    def dirty_locations(self) -> list[LocID]:
+        '''Loaded locations whose scripts have unsaved changes.'''
+        return [loc_id for loc_id, script in self.script_dict.items()
+                if script.dirty]
+
+    def _script_block(self, loc_id: LocID) -> Tuple[int, int]:
+        '''The [start, end) of loc_id's compressed script in the rom.'''
+        script_ptr = get_loc_event_ptr(self.fsrom.getbuffer(), loc_id)
+        return (script_ptr, script_ptr+self.orig_len_dict[loc_id])
+
     def free_script(self, loc_id: LocID):
         script = self.get_script(loc_id)
-        script_ptr = get_loc_event_ptr(self.fsrom.getbuffer(), loc_id)
-        script_compr_len = self.orig_len_dict[loc_id]
+        block = self._script_block(loc_id)
 
         spaceman = self.fsrom.space_manager
 
@@ -1486,20 +1720,82 @@ class ScriptManager:
             # This will take some more sophistication to do correctly.
             pass
 
-        spaceman.mark_block((script_ptr, script_ptr+script_compr_len),
-                            FSWriteType.MARK_FREE)
+        spaceman.mark_block(block, FSWriteType.MARK_FREE)
+        self._rom_digests.pop(loc_id, None)
+
+    def _is_unchanged(self, loc_id: LocID, script: Event) -> bool:
+        '''
+        True if the rom already holds exactly this script: it is clean, or
+        its edits were undone.
+        '''
+        if not script.dirty:
+            return True
+        if (
+                not script.modified_strings and
+                self._rom_digests.get(loc_id) == script_digest(
+                    script.get_bytearray())
+        ):
+            script.dirty = False
+            return True
+        return False
+
+    @staticmethod
+    def _string_block(script: Event, string_index: int) -> bytearray:
+        '''Pointer table and strings of script as written at string_index.'''
+        ptrs_len = 2*len(script.strings)
+
+        # str_pos tracks where the pointer needs to point
+        str_pos = string_index % 0x10000 + ptrs_len
+        block = bytearray()
+        for string in script.strings:
+            block += to_little_endian(str_pos, 2)
+            str_pos += len(string)
+
+        # Write the strings immediately afterwards
+        for string in script.strings:
+            block += string
+
+        return block
+
+    def _write_script_ptr(self, loc_id: LocID, script_ptr: int):
+        event_ind_st = self.loc_data_ptr + 14*loc_id + 8
+
+        loc_script_ind = \
+            get_value_from_bytes(
+                self.fsrom.getbuffer()[event_ind_st:event_ind_st+2])
 
-    # writes the script to the specified locations
-    def write_script_to_rom(self, loc_id: LocID, free_old: bool = True):
+        # Each event pointer is an absolute, 3 byte pointer
+        loc_ptr = self.event_data_ptr + 3*loc_script_ind
+
+        self.fsrom.seek(loc_ptr)
+        self.fsrom.write(to_little_endian(to_rom_ptr(script_ptr), 3))
+
+    def _finish_write(self, loc_id: LocID, script: Event, compr_len: int,
+                      digest: bytes):
+        # When the script is written, update the orig len and modified_strings.
+        # Just in case we end up modifying and writing again.
+        script.modified_strings = False
+        script.dirty = False
+        self.orig_len_dict[loc_id] = compr_len
+        self._rom_digests[loc_id] = digest
+
+    # writes the script to the specified locations.  Returns False if the
+    # script was clean and nothing was written.
+    def write_script_to_rom(self, loc_id: LocID,
+                            free_old: bool = True) -> bool:
         # print('calling wstr', loc_id)
 
         spaceman = self.fsrom.space_manager
 
+        script = self.get_script(loc_id)
+
+        # Nothing to do if the rom already holds exactly this script.
+        if free_old and self._is_unchanged(loc_id, script):
+            return False
+
         if free_old:
             self.free_script(loc_id)
 
-        script = self.get_script(loc_id)
-
         if script.modified_strings:
             # We need to find space for the new strings
             strings_len = sum(len(x) for x in script.strings)
@@ -1509,47 +1805,142 @@ class ScriptManager:
             # Note: fsrom doesn't let the block cross bank boundaries
             string_index = spaceman.get_free_addr(total_len)
 
-            # str_pos tracks where the pointer needs to point
-            str_pos = string_index % 0x10000 + ptrs_len
             self.fsrom.seek(string_index)
-
-            # Write the pointers
-            for i in range(len(script.strings)):
-                self.fsrom.write(to_little_endian(str_pos, 2),
-                                 FSWriteType.MARK_USED)
-                str_pos += len(script.strings[i])
-
-            # Write the strings immediately afterwards
-            for x in script.strings:
-                self.fsrom.write(x, FSWriteType.MARK_USED)
+            self.fsrom.write(self._string_block(script, string_index),
+                             FSWriteType.MARK_USED)
 
             script.set_string_index(to_rom_ptr(string_index))
 
         # The rest is mostly straightforward
-        compr_event = compress(script.get_bytearray())
+        script_bytes = script.get_bytearray()
+        compr_event = self.compression_cache.compress(
+            script_bytes, self.max_compression, self.chain_depth
+        )
         script_ptr = spaceman.get_free_addr(len(compr_event))
 
         self.fsrom.seek(script_ptr)
         self.fsrom.write(compr_event, FSWriteType.MARK_USED)
 
         # Now write the location's pointer
-        event_ind_st = self.loc_data_ptr + 14*loc_id + 8
+        self._write_script_ptr(loc_id, script_ptr)
+        self._finish_write(loc_id, script, len(compr_event),
+                           script_digest(script_bytes))
+        return True
+    # End of write_script_to_rom
 
-        loc_script_ind = \
-            get_value_from_bytes(
-                self.fsrom.getbuffer()[event_ind_st:event_ind_st+2])
+    def write_scripts_to_rom(self, loc_ids: Optional[Iterable[LocID]] = None,
+                             free_old: bool = True) -> list[LocID]:
+        '''
+        Write many scripts in one pass and return the locations written.
+        Clean scripts are skipped.  Defaults to every dirty script.
+
+        All old copies are freed first.  Then every string block is placed,
+        and then every compressed script, each group largest first into the
+        smallest free block in one bank that holds it.  Nothing is written
+        until everything has a place.  If something does not fit,
+        FreeSpaceError is raised.  On that or any other failure the old
+        copies are still marked used and the scripts are as they were.
+        '''
+        if loc_ids is None:
+            loc_ids = self.dirty_locations()
 
-        # Each event pointer is an absolute, 3 byte pointer
-        loc_ptr = self.event_data_ptr + 3*loc_script_ind
+        pending = [
+            loc_id for loc_id in loc_ids
+            if not (free_old and
+                    self._is_unchanged(loc_id, self.get_script(loc_id)))
+        ]
+        scripts = {loc_id: self.get_script(loc_id) for loc_id in pending}
 
-        self.fsrom.seek(loc_ptr)
-        self.fsrom.write(to_little_endian(to_rom_ptr(script_ptr), 3))
+        string_sizes = {
+            loc_id: sum(len(x) for x in script.strings) +
+            2*len(script.strings)
+            for loc_id, script in scripts.items()
+            if script.modified_strings and script.strings
+        }
 
-        # When the script is written, update the orig len and modified_strings.
-        # Just in case we end up modifying and writing again.
-        script.modified_strings = False
-        self.orig_len_dict[loc_id] = len(compr_event)
-    # End of write_script_to_rom
+        # Everything needed to undo the batch if it fails.
+        old_blocks = {}
+        old_digests = {}
+        old_data: dict[LocID, Tuple[bytearray, bool]] = {}
+        string_addrs: dict[LocID, int] = {}
+        packets = {}
+        try:
+            if free_old:
+                for loc_id in pending:
+                    old_blocks[loc_id] = self._script_block(loc_id)
+                    if loc_id in self._rom_digests:
+                        old_digests[loc_id] = self._rom_digests[loc_id]
+                    self.free_script(loc_id)
+
+            string_addrs = self._claim_largest_first(string_sizes)
+
+            # Strings go first because the script holds the string index.
+            for loc_id, string_index in string_addrs.items():
+                script = scripts[loc_id]
+                old_data[loc_id] = (bytearray(script.data), script.dirty)
+                script.set_string_index(to_rom_ptr(string_index))
+            for loc_id, script in scripts.items():
+                packets[loc_id] = self.compression_cache.compress(
+                    script.get_bytearray(), self.max_compression,
+                    self.chain_depth
+                )
+            script_addrs = self._claim_largest_first(
+                {loc_id: len(packet) for loc_id, packet in packets.items()}
+            )
+        except BaseException:
+            self._release(string_addrs, string_sizes)
+            for loc_id, (data, dirty) in old_data.items():
+                # In place: callers may hold script.data.
+                scripts[loc_id].data[:] = data
+                scripts[loc_id].dirty = dirty
+                scripts[loc_id].invalidate_instruction_index()
+            spaceman = self.fsrom.space_manager
+            for block in old_blocks.values():
+                spaceman.mark_block(block, FSWriteType.MARK_USED)
+            self._rom_digests.update(old_digests)
+            raise
+
+        for loc_id, string_index in string_addrs.items():
+            self.fsrom.seek(string_index)
+            self.fsrom.write(
+                self._string_block(scripts[loc_id], string_index),
+                FSWriteType.MARK_USED
+            )
+
+        for loc_id, script_ptr in script_addrs.items():
+            script = scripts[loc_id]
+            self.fsrom.seek(script_ptr)
+            self.fsrom.write(packets[loc_id], FSWriteType.MARK_USED)
+            self._write_script_ptr(loc_id, script_ptr)
+            self._finish_write(loc_id, script, len(packets[loc_id]),
+                               script_digest(script.get_bytearray()))
+
+        return pending
+
+    def _claim_largest_first(self,
+                             sizes: dict[LocID, int]) -> dict[LocID, int]:
+        '''
+        Best fit decreasing: mark a block of each size used, largest first,
+        in the smallest free block of one bank that holds it.
+        '''
+        spaceman = self.fsrom.space_manager
+        addrs: dict[LocID, int] = {}
+        try:
+            for loc_id in sorted(sizes, key=lambda loc_id: -sizes[loc_id]):
+                size = sizes[loc_id]
+                addr = spaceman.get_best_fit_addr(size)
+                spaceman.mark_block((addr, addr+size), FSWriteType.MARK_USED)
+                addrs[loc_id] = addr
+        except BaseException:
+            self._release(addrs, sizes)
+            raise
+        return addrs
+
+    def _release(self, addrs: dict[LocID, int], sizes: dict[LocID, int]):
+        spaceman = self.fsrom.space_manager
+        for loc_id, addr in addrs.items():
+            spaceman.mark_block((addr, addr+sizes[loc_id]),
+                                FSWriteType.MARK_FREE)
 # End class ScriptManager
 
 
@@ -1,7 +1,12 @@
+from __future__ import annotations
+
 import hashlib
+from typing import Optional
 
 from . import ctevent
 from . import freespace
+from . import scriptcompaction
+from .compressioncache import CompressionCache
 
 
 class InvalidRomException(Exception):
@@ -20,14 +25,17 @@ class RomFormatException(Exception):
 # and mechanisms for manipulating scripts.
 class CTRom():
 
-    def __init__(self, rom: bytes, ignore_checksum=False):
+    def __init__(self, rom: bytes, ignore_checksum=False,
+                 compression_cache: Optional[CompressionCache] = None):
         # ignore_checksum is so that I can load already-randomized roms
         # if need be.
         if not ignore_checksum and not CTRom.validate_ct_rom_bytes(rom):
             raise InvalidRomException('Bad checksum.')
 
         self.rom_data = freespace.FSRom(rom, False)
-        self.script_manager = ctevent.ScriptManager(self.rom_data, [])
+        self.script_manager = ctevent.ScriptManager(
+            self.rom_data, [], compression_cache=compression_cache
+        )
 
     @classmethod
     def from_file(cls, filename: str, ignore_checksum=False):
@@ -36,15 +44,28 @@ class CTRom():
 
         return cls(rom_bytes, ignore_checksum)
 
-    def write_all_scripts_to_rom(self, clear_scripts: bool = True):
-        script_dict = self.script_manager.script_dict
-        for loc_id in script_dict:
-            self.script_manager.write_script_to_rom(loc_id)
+    def write_all_scripts_to_rom(
+            self, clear_scripts: bool = True
+    ) -> list[ctevent.LocID]:
+        '''Write every dirty script.  Returns the locations written.'''
+        written = self.script_manager.write_scripts_to_rom()
+
+        cache = self.script_manager.compression_cache
+        if cache.path is not None:
+            cache.save()
 
         if clear_scripts:
             self.script_manager.script_dict = {}
             self.script_manager.orig_len_dict = {}
 
+        return written
+
+    def compact_scripts(
+            self, dry_run: bool = False
+    ) -> scriptcompaction.CompactionReport:
+        '''Merge the holes between event scripts.  See scriptcompaction.'''
+        return scriptcompaction.compact_scripts(self.script_manager, dry_run)
+
     @staticmethod
     def validate_ct_rom_file(filename: str) -> bool:
         with open(filename, 'rb') as infile:
@@ -1,6 +1,8 @@
 from __future__ import annotations
 import math
-from typing import Tuple
+import struct
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
 
 from .byteops import to_little_endian, get_value_from_bytes
 from enum import Enum, IntEnum, auto
@@ -134,7 +136,53 @@ def get_offset(script_addr):
     return (script_addr - 0x7F0200) // 2
 
 
+@dataclass(frozen=True)
+class OpcodeSpec:
+    '''
+    Metadata shared by every decoded instance of one opcode on one
+    platform.  Only the args differ between instances.
+    '''
+    command: int
+    num_args: int
+    arg_lens: Tuple[int, ...]
+    arg_descs: Tuple[str, ...]
+    name: str
+    desc: str
+    command_type: Optional[EventCommandType] = None
+    command_subtype: Optional[EventCommandSubtype] = None
+    length: int = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'length', 1 + sum(self.arg_lens))
+
+
+def _spec_property(attr: str, as_list: bool = False) -> property:
+    '''
+    Instance attribute backed by the shared OpcodeSpec.  Reading returns the
+    spec's value, so list attributes come back as the shared tuple.
+    Assigning stores a per-instance override; list attributes are copied
+    into a list of the instance's own, which may then be edited in place.
+    '''
+    def getter(self):
+        own = self._own
+        if own is not None and attr in own:
+            return own[attr]
+        return getattr(self._spec, attr)
+
+    def setter(self, value):
+        self._set_own(attr, list(value) if as_list else value)
+
+    return property(getter, setter)
+
+
 class EventCommand:
+    '''
+    One event command.  Instances hold only the opcode, the args and a
+    reference to the opcode's OpcodeSpec; the other attributes read through
+    to the spec unless they have been set on the instance.
+    '''
+
+    __slots__ = ('command', 'args', '_spec', '_own')
 
     str_commands = [0xBB, 0xC0, 0xC1, 0xC2, 0xC3, 0xC4]
     str_arg_pos = [0, 0, 0, 0, 0, 0]
@@ -161,20 +209,66 @@ class EventCommand:
                  arg_lens, arg_descs,
                  name, desc, command_type = None, command_subtype = None):
         self.command = command
-        self.num_args = num_args
-        self.arg_lens = arg_lens
-        self.arg_descs = arg_descs
-        self.name = name
-        self.desc = desc
-
-        self.command_type = command_type
-        self.command_subtype = command_subtype
+        self._spec = OpcodeSpec(command, num_args, tuple(arg_lens),
+                                tuple(arg_descs), name, desc,
+                                command_type, command_subtype)
+        self._own: Optional[dict] = None
 
         # These are the actual arguments from the string of bytes in the script
         self.args = []
 
-        # These are the decoded args
-        self.logical_args = []
+    @classmethod
+    def from_spec(cls, spec: OpcodeSpec, args: list,
+                  arg_lens: Optional[list[int]] = None) -> EventCommand:
+        '''
+        Build a command sharing spec.  arg_lens overrides the spec's lengths
+        for variable-length commands.
+        '''
+        ret = cls.__new__(cls)
+        ret.command = spec.command
+        ret._spec = spec
+        ret._own = None if arg_lens is None else {'arg_lens': arg_lens}
+        ret.args = args
+        return ret
+
+    @property
+    def spec(self) -> OpcodeSpec:
+        return self._spec
+
+    def _set_own(self, attr: str, value) -> None:
+        if self._own is None:
+            self._own = {}
+        self._own[attr] = value
+
+    def own_list(self, attr: str) -> list:
+        '''
+        This instance's own list for arg_lens or arg_descs, copied from the
+        spec if it has none yet, for edits made in place.
+        '''
+        own = self._own
+        if own is None or attr not in own:
+            self._set_own(attr, list(getattr(self._spec, attr)))
+        return self._own[attr]
+
+    num_args = _spec_property('num_args')
+    arg_lens = _spec_property('arg_lens', as_list=True)
+    arg_descs = _spec_property('arg_descs', as_list=True)
+    name = _spec_property('name')
+    desc = _spec_property('desc')
+    command_type = _spec_property('command_type')
+    command_subtype = _spec_property('command_subtype')
+
+    @property
+    def logical_args(self) -> list:
+        '''The decoded args.'''
+        own = self._own
+        if own is None or 'logical_args' not in own:
+            self._set_own('logical_args', [])
+        return self._own['logical_args']
+
+    @logical_args.setter
+    def logical_args(self, value: list) -> None:
+        self._set_own('logical_args', value)
 
     def __eq__(self, other):
         return self.command == other.command and self.args == other.args
@@ -1614,23 +1708,20 @@ class EventCommand:
     @staticmethod
     def mem_copy(address: int, bytes: bytearray):
         command = event_commands[0x4E].copy()
-        command.arg_lens[-1] = len(bytes)
+        command.own_list('arg_lens')[-1] = len(bytes)
         command.args = [address & 0xFFFF, (address >> 16) & 0xFF, len(bytes) + 2, bytes]
 
         return command
 
     def copy(self) -> EventCommand:
-        ret_command = EventCommand(-1, 0, [], [], '', '')
+        ret_command = EventCommand.from_spec(self._spec, self.args[:])
         ret_command.command = self.command
-        ret_command.num_args = self.num_args
-        ret_command.arg_lens = self.arg_lens[:]
-        ret_command.arg_descs = self.arg_descs[:]
-        ret_command.name = self.name
-        ret_command.desc = self.desc
-        ret_command.command_type = self.command_type
-        ret_command.command_subtype = self.command_subtype
-
-        ret_command.args = self.args[:]
+        if self._own is not None:
+            ret_command._own = {
+                attr: value[:] if isinstance(value, list) else value
+                for attr, value in self._own.items()
+                if attr != 'logical_args'
+            }
 
         return ret_command
 
@@ -1700,7 +1791,10 @@ class EventCommand:
         return ret
 
     def __len__(self):
-        return 1 + sum(self.arg_lens)
+        own = self._own
+        if own is not None and 'arg_lens' in own:
+            return 1 + sum(own['arg_lens'])
+        return self._spec.length
 
     def __str__(self):
         if self.command == 0x4E:
@@ -3827,86 +3921,158 @@ event_commands[0xFF] = \
 
 
 
-def get_command(buf: bytes, offset: int = 0,
-                platform: Platform = Platform.SNES) -> EventCommand:
-
-    command_id = buf[offset]
-    command = event_commands[command_id].copy()
-
-    # Apply PC-specific argument-length overrides before mode-based fixups.
-    if platform == Platform.PC and command_id in _PC_ARG_LENS_OVERRIDES:
-        command.arg_lens = _PC_ARG_LENS_OVERRIDES[command_id][:]
-        command.num_args = len(command.arg_lens)
-
+def _special_arg_lens(command_id: int, buf: bytes, offset: int,
+                      platform: Platform,
+                      arg_lens: list[int]) -> list[int]:
+    '''
+    Argument lengths for the opcodes whose layout depends on the bytes that
+    follow them.  arg_lens is returned unchanged for unrecognized modes.
+    '''
     if command_id == 0x2E:
         mode = buf[offset+1] >> 4
         if mode in [4, 5]:
-            command.arg_lens = [1, 1, 1, 1, 1]
+            return [1, 1, 1, 1, 1]
         elif mode == 8:
             if platform == Platform.PC:
                 # PC: cmd byte + bits byte + palette-index byte = 3 args
-                command.arg_lens = [1, 1, 1]
-            else:
-                copy_len = get_value_from_bytes(buf[offset+3:offset+4]) - 2
-                command.arg_lens = [1, 1, 2, copy_len]
-        else:
-            print(f"{command_id:02X}: Error, Unknown Mode")
+                return [1, 1, 1]
+            copy_len = get_value_from_bytes(buf[offset+3:offset+4]) - 2
+            return [1, 1, 2, copy_len]
+        print(f"{command_id:02X}: Error, Unknown Mode")
     elif command_id == 0x4E:
         # Data to copy follows command.  Shove data in last arg.
         # SNES layout: [dest(2), mid(1), length(2), blob(n)] — length at offset+4
         # PC layout:   [dest(2), length(2), blob(n)]          — length at offset+3
         if platform == Platform.PC:
             data_len = get_value_from_bytes(buf[offset+3:offset+5]) - 2
-            command.arg_lens = [2, 2, data_len]
-        else:
-            data_len = get_value_from_bytes(buf[offset+4:offset+6]) - 2
-            command.arg_lens = [2, 1, 2, data_len]
+            return [2, 2, data_len]
+        data_len = get_value_from_bytes(buf[offset+4:offset+6]) - 2
+        return [2, 1, 2, data_len]
     elif command_id == 0x88:
         mode = buf[offset+1] >> 4
         if mode == 0:
-            command.arg_lens = [1]
+            return [1]
         elif mode in [2, 3]:
-            command.arg_lens = [1, 1, 1]
+            return [1, 1, 1]
         elif mode in [4, 5]:
-            command.arg_lens = [1, 1, 1, 1]
+            return [1, 1, 1, 1]
         elif mode == 8:
             if platform == Platform.PC:
                 # PC: cmd byte + palette-index byte = 2 args
-                command.arg_lens = [1, 1]
-            else:
-                # SNES: variable-length copy; length encoded in third byte
-                copy_len = buf[offset+2] - 2
-                command.arg_lens = [1, 1, 1, copy_len]
-        else:
-            print(f"{command_id:02X}: Error, Unknown Mode")
+                return [1, 1]
+            # SNES: variable-length copy; length encoded in third byte
+            copy_len = buf[offset+2] - 2
+            return [1, 1, 1, copy_len]
+        print(f"{command_id:02X}: Error, Unknown Mode")
     elif command_id == 0xF1:
         color = buf[offset+1]
         if color == 0:
-            command.arg_lens = [1]
-        else:
-            command.arg_lens = [1, 1]
+            return [1]
+        return [1, 1]
     elif command_id == 0xFF:  # Mode7 scenes can be weird
         scene = buf[offset+1]
-        if scene == 0x90:
-            command.arg_lens = [1, 1, 1, 1]
-        if scene == 0x97:
-            command.arg_lens = [1, 1, 1, 1]
+        if scene in (0x90, 0x97):
+            return [1, 1, 1, 1]
+    return arg_lens
+
+
+_SPECIAL_OPCODES = frozenset({0x2E, 0x4E, 0x88, 0xF1, 0xFF})
+_STRUCT_CODES = {1: 'B', 2: 'H', 4: 'I'}
+
+
+class _OpcodeDecoder:
+    '''
+    Precompiled decoding info for one opcode on one platform: the shared
+    OpcodeSpec (with platform overrides applied) and a struct that unpacks
+    all args at once when every arg is 1, 2 or 4 bytes.
+    '''
+    __slots__ = ('spec', 'arg_lens', 'length', 'unpacker', 'special')
+
+    def __init__(self, command_id: int, platform: Platform):
+        base = event_commands[command_id]
+        arg_lens = base.arg_lens
+        num_args = base.num_args
+        if platform == Platform.PC and command_id in _PC_ARG_LENS_OVERRIDES:
+            arg_lens = _PC_ARG_LENS_OVERRIDES[command_id]
+            num_args = len(arg_lens)
+        self.spec = OpcodeSpec(base.command, num_args, tuple(arg_lens),
+                               tuple(base.arg_descs), base.name, base.desc,
+                               base.command_type, base.command_subtype)
+        self.arg_lens = self.spec.arg_lens
+        self.length = self.spec.length
+        self.special = command_id in _SPECIAL_OPCODES
+        self.unpacker = None
+        if all(x in _STRUCT_CODES for x in self.arg_lens):
+            self.unpacker = struct.Struct(
+                '<' + ''.join(_STRUCT_CODES[x] for x in self.arg_lens)
+            )
+
+
+_SNES_DECODERS = [_OpcodeDecoder(i, Platform.SNES) for i in range(0x100)]
+_PC_DECODERS = [_OpcodeDecoder(i, Platform.PC) for i in range(0x100)]
+
+# The .command of the decoded command for each opcode byte.  This is the
+# opcode itself except for aliases such as 0x9E/0x9F.  Scanners compare
+# against it so they can skip non-matching commands with command_length.
+DECODED_COMMAND_IDS: tuple[int, ...] = \
+    tuple(decoder.spec.command for decoder in _SNES_DECODERS)
+
+
+def command_length(buf: bytes, offset: int = 0,
+                   platform: Platform = Platform.SNES) -> int:
+    '''
+    Length in bytes of the command at buf[offset] without decoding it.
+    Equal to len(get_command(buf, offset, platform)).
+    '''
+    command_id = buf[offset]
+    if platform == Platform.PC:
+        decoder = _PC_DECODERS[command_id]
+    else:
+        decoder = _SNES_DECODERS[command_id]
+
+    if decoder.special:
+        arg_lens = _special_arg_lens(command_id, buf, offset, platform,
+                                     decoder.arg_lens)
+        return 1 + sum(arg_lens)
+    return decoder.length
+
+
+def get_command(buf: bytes, offset: int = 0,
+                platform: Platform = Platform.SNES) -> EventCommand:
+
+    command_id = buf[offset]
+    if platform == Platform.PC:
+        decoder = _PC_DECODERS[command_id]
+    else:
+        decoder = _SNES_DECODERS[command_id]
+
+    if not decoder.special:
+        if (
+                decoder.unpacker is not None and
+                offset + decoder.length <= len(buf)
+        ):
+            args = list(decoder.unpacker.unpack_from(buf, offset+1))
+            return EventCommand.from_spec(decoder.spec, args)
+        command = EventCommand.from_spec(decoder.spec, [])
+        arg_lens = decoder.arg_lens
+    else:
+        arg_lens = list(_special_arg_lens(command_id, buf, offset, platform,
+                                          decoder.arg_lens))
+        command = EventCommand.from_spec(decoder.spec, [], arg_lens)
 
     # Now we can use arg_lens to extract the args
     pos = offset + 1
-    command.args = []
-
     if command.command == 0x4E:
-        for i in command.arg_lens[0:-1]:
+        for i in arg_lens[0:-1]:
             command.args.append(get_value_from_bytes(buf[pos:pos+i]))
             pos += i
 
         command.args.append(
-            bytearray(buf[pos:pos+command.arg_lens[-1]])
+            bytearray(buf[pos:pos+arg_lens[-1]])
         )
-        pos += command.arg_lens[-1]
+        pos += arg_lens[-1]
     else:
-        for i in command.arg_lens:
+        for i in arg_lens:
             command.args.append(get_value_from_bytes(buf[pos:pos+i]))
             pos += i
 
@@ -1,8 +1,10 @@
 from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
 from enum import Enum
 from io import BytesIO
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence, \
+    Tuple, Union
 
 from . import byteops
 
@@ -15,221 +17,436 @@ class FSWriteType(Enum):
     NO_MARK = 2
 
 
-class FreeSpace():
-    def __init__(self, num_bytes, is_free):
+_BANK_SIZE = 0x10000
+
+
+class BankStats(NamedTuple):
+    '''Free bytes, largest free block and number of free blocks in a bank.'''
+    free: int
+    largest: int
+    holes: int
+
+
+class FreeSpace:
+    '''
+    Map of the free and used blocks of a buffer.
+
+    Free extents are kept coalesced in two parallel sorted lists of starts
+    and ends, so marking a block is a pair of bisects and one slice
+    assignment.  Each extent is also split at bank boundaries and the
+    pieces are indexed by (length, start), both globally and per bank.
+    Queries use the per-bank maxima to skip banks that can not hold the
+    request.
 
+    get_free_addr keeps the first-fit results of the original marker-list
+    implementation exactly, quirks included.  get_first_fit_addr and get_best_fit_addr never return a
+    block that crosses a bank boundary and can be limited to one bank.
+
+    plan_same_bank places a group of blocks in one bank without changing
+    the map, and claim_blocks commits a plan all at once.
+    '''
+    def __init__(self, num_bytes, is_free):
         self.num_bytes = num_bytes
-        self.markers = [0, self.num_bytes]
-        self.first_free = is_free
+        self._end = num_bytes
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._by_size: list[Tuple[int, int]] = []
+        self._bank_sizes: dict[int, list[Tuple[int, int]]] = {}
+        self._bank_free: dict[int, int] = {}
+        if is_free and num_bytes > 0:
+            self._add_free(0, num_bytes)
+
+    @property
+    def markers(self) -> list[int]:
+        '''
+        Block boundaries.  The blocks between them alternate free and used,
+        starting with a free block if first_free.
+        '''
+        markers = [0]
+        for start, end in zip(self._starts, self._ends):
+            if start != markers[-1]:
+                markers.append(start)
+            markers.append(end)
+        if markers[-1] != self._end:
+            markers.append(self._end)
+        return markers
+
+    @property
+    def first_free(self) -> bool:
+        return bool(self._starts) and self._starts[0] == 0
+
+    def free_blocks(self) -> Iterator[Tuple[int, int]]:
+        '''Free extents as half-open (start, end) in address order.'''
+        return zip(self._starts, self._ends)
+
+    def largest_free_in_bank(self, bank: int) -> int:
+        '''Size of the largest free block inside bank (addr >> 16).'''
+        pieces = self._bank_sizes.get(bank)
+        return pieces[-1][0] if pieces else 0
+
+    def free_in_bank(self, bank: int) -> int:
+        '''Total free bytes inside bank (addr >> 16).'''
+        return self._bank_free.get(bank, 0)
+
+    def bank_stats(self) -> dict[int, BankStats]:
+        '''Fragmentation of every bank with free space.'''
+        return {
+            bank: BankStats(self._bank_free[bank], pieces[-1][0], len(pieces))
+            for bank, pieces in sorted(self._bank_sizes.items()) if pieces
+        }
+
+    def copy(self) -> FreeSpace:
+        '''An independent copy of the map, e.g. to try out a plan.'''
+        ret = FreeSpace.__new__(FreeSpace)
+        ret.num_bytes = self.num_bytes
+        ret._end = self._end
+        ret._starts = self._starts.copy()
+        ret._ends = self._ends.copy()
+        ret._by_size = self._by_size.copy()
+        ret._bank_sizes = {
+            bank: pieces.copy() for bank, pieces in self._bank_sizes.items()
+        }
+        ret._bank_free = self._bank_free.copy()
+        return ret
+
+    @staticmethod
+    def _pieces(start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        '''(bank, start, end) for each part of [start, end) in one bank.'''
+        bank = start >> 16
+        while start < end:
+            piece_end = min(end, (bank+1) << 16)
+            yield bank, start, piece_end
+            start = piece_end
+            bank += 1
+
+    def _index(self, start: int, end: int):
+        for bank, piece_st, piece_end in self._pieces(start, end):
+            key = (piece_end - piece_st, piece_st)
+            insort(self._by_size, key)
+            insort(self._bank_sizes.setdefault(bank, []), key)
+            self._bank_free[bank] = self._bank_free.get(bank, 0) + key[0]
+
+    def _unindex(self, start: int, end: int):
+        for bank, piece_st, piece_end in self._pieces(start, end):
+            key = (piece_end - piece_st, piece_st)
+            del self._by_size[bisect_left(self._by_size, key)]
+            pieces = self._bank_sizes[bank]
+            del pieces[bisect_left(pieces, key)]
+            self._bank_free[bank] -= key[0]
+
+    def _add_free(self, start: int, end: int):
+        starts, ends = self._starts, self._ends
+
+        # Merge with every extent overlapping or touching [start, end).
+        first = bisect_left(ends, start)
+        last = bisect_right(starts, end)
+        if first < last:
+            start = min(start, starts[first])
+            end = max(end, ends[last-1])
+            for ind in range(first, last):
+                self._unindex(starts[ind], ends[ind])
+
+        starts[first:last] = [start]
+        ends[first:last] = [end]
+        self._index(start, end)
+
+    def _remove_free(self, start: int, end: int):
+        starts, ends = self._starts, self._ends
+
+        first = bisect_right(starts, start) - 1
+        if first < 0 or ends[first] <= start:
+            first += 1
+        last = bisect_left(starts, end, first)
+        if first == last:
+            return
+
+        left_st, right_end = starts[first], ends[last-1]
+        for ind in range(first, last):
+            self._unindex(starts[ind], ends[ind])
+
+        new_starts, new_ends = [], []
+        if left_st < start:
+            new_starts.append(left_st)
+            new_ends.append(start)
+        if right_end > end:
+            new_starts.append(end)
+            new_ends.append(right_end)
+
+        starts[first:last] = new_starts
+        ends[first:last] = new_ends
+        for piece_st, piece_end in zip(new_starts, new_ends):
+            self._index(piece_st, piece_end)
+
+    def _block_at(self, addr: int) -> Tuple[bool, int]:
+        '''
+        (is_free, start) of the free or used block holding addr.  Addresses
+        past the end map to the last block.
+        '''
+        addr = max(min(addr, self._end - 1), 0)
+        ind = bisect_right(self._starts, addr) - 1
+        if ind >= 0 and addr < self._ends[ind]:
+            return True, self._starts[ind]
+        return False, (self._ends[ind] if ind >= 0 else 0)
 
-    # Mark a block of the buffer as free/not free depending on is_free.
-    # block is a half-open interval [block[0], block[1]) as is Python's way.
     def mark_block(self,
                    block: Tuple[int, int],
                    mark_type: FSWriteType):
 
         if mark_type == FSWriteType.NO_MARK:
             return
-        else:
-            # print(f"Marking [{block[0]:06X}, {block[1]:06X})  as {is_free}")
-            is_free = (mark_type == FSWriteType.MARK_FREE)
 
-        # maybe verify block is valid?
+        is_free = (mark_type == FSWriteType.MARK_FREE)
+
         if block[1] <= block[0]:
             print(
                 'Error: Block [%6.6X, %6.6X) has nonpositive size. Returning.'
                 % (block[0], block[1])
             )
+            return
 
-        # If the block to mark goes past the end of the file, extend?
-        # This should probably throw an error.
-        if block[1] > self.markers[-1]:
+        if block[1] > self._end:
             print('Warning: block [%6.6X, %6.6X) exceeds EOF. Truncating.'
                   % (block[0], block[1]))
-            block = (block[0], self.markers[-1])
+            block = (block[0], self._end)
 
         if block[0] < 0:
             print('Warning: block [%6.6X, %6.6X) preceeds 0. Truncating.'
                   % (block[0], block[1]))
             block = (0, block[1])
 
-        left_blk = self.__search(0, len(self.markers)-2, block[0])
-        right_blk = self.__search(0, len(self.markers)-2, block[1])
-
-        lc = (left_blk % 2 == 0)
-        rc = (right_blk % 2 == 0)
-
-        left_type = (lc == (self.first_free == is_free))
-        right_type = (rc == (self.first_free == is_free))
-
-        if left_type:
-            # If the left_type matches the type we're marking, then the left
-            # endpoint of the block we found will be the start of a block
-            start = left_blk
-        elif block[0] == self.markers[left_blk]:
-            # If the left_type doesn't match, but we're starting at its
-            # leftmost point, then we're just extending the previous matching
-            # block.
-            if left_blk != 0:  # Unless we're already at the start.
-                start = left_blk-1
-            else:
-                # When at the start, theen just start at the beginning
-                start = 0
+        if block[1] <= block[0]:
+            return
 
-                # Now the first block's type changes to is_free
-                self.first_free = is_free
-        else:
-            # cut a block
-            self.markers.insert(left_blk+1, block[0])
-            start = left_blk+1
-            right_blk += 1
-
-        if right_type:
-            # If the right_type matches, then just extend that block
-            end = right_blk+1
-        elif block[1] == self.markers[right_blk+1]:
-            # If it doesn't match, but it's at the very end of the block,
-            # then extend through the next matching block.
-            if right_blk+2 == len(self.markers):  # Unless we're at the end_grp
-                end = right_blk+1
-            else:
-                end = right_blk+2
+        if is_free:
+            self._add_free(block[0], block[1])
         else:
-            # cut the block
-            self.markers.insert(right_blk+1, block[1])
-            end = right_blk+1
-
-        # delete all markers between the start and the end (not inclusive)
-        if end > start+1:
-            del self.markers[start+1:end]
-    # End of mark_block
+            self._remove_free(block[0], block[1])
 
     def is_block_free(self, block) -> bool:
-        left = block[0]
-        right = block[1]
-
-        left_ind = self.__search(0, len(self.markers)-2, left)
-        right_ind = self.__search(0, len(self.markers)-2, right)
-
-        left_parity = left_ind % 2 == 0
-        left_free = left_parity == (self.first_free is True)
-
-        return (left_ind == right_ind) and left_free
+        # block[1] must lie in the same free block as block[0] (or past
+        # the end of the last block).
+        left_free, left_st = self._block_at(block[0])
+        _, right_st = self._block_at(block[1])
+        return left_free and left_st == right_st
 
     def extend_end_marker(self, new_end, is_free):
-        last_free = self.__is_free(len(self.markers)-2)
+        last_free = bool(self._ends) and self._ends[-1] == self._end
 
-        # print(f"{new_end:06X}, {is_free}")
-        if last_free == is_free:
-            self.markers[-1] = new_end
-        else:
-            self.markers.append(new_end)
+        # A block of the other type is appended unless is_free compares
+        # equal to the last block's type.  FSRom passes an FSWriteType here,
+        # which never does.
+        new_free = last_free if last_free == is_free else not last_free
 
-    def __is_free(self, ind):
-        return ((ind % 2 == 0) == self.first_free)
+        old_end, self._end = self._end, new_end
+        if new_free and new_end > old_end:
+            self._add_free(old_end, new_end)
 
-    # First fit.  Location must be after hint
     def get_free_addr(self, size, hint=0):
-        # block associated with its left marker, so search to len-2
-        ind = self.__search(0, len(self.markers)-2, hint)
+        '''
+        First fit at or after hint, with the original implementation's
+        exact results: a hint inside a free block is returned as is, and a block may start
+        at the beginning of the bank after a free block's first bank.
+        '''
+        starts, ends = self._starts, self._ends
 
-        # print(f"Searching for {size} free bytes.")
-        if self.__is_free(ind) and (self.markers[ind+1]-hint > 0):
+        ind = bisect_right(starts, hint) - 1
+        if ind >= 0 and hint < ends[ind]:
             return hint
+
+        if hint >= self._end and ends and ends[-1] == self._end:
+            ind = len(starts) - 1
         else:
-            if not self.__is_free(ind):
-                ind += 1
-
-            start = ind
-            ret = None
-            for x in range(start, len(self.markers)-1, 2):
-                # print(f"({self.markers[x]}, {self.markers[x+1]})")
-                # print(f"Size: {self.markers[x+1]-self.markers[x]}")
-
-                block_st = self.markers[x]
-                block_end = self.markers[x+1]
-                next_bank = (block_st & 0xFF0000) + 0x010000
-
-                true_block_end = min(block_end, next_bank)
-                if true_block_end - block_st >= size:
-                    ret = block_st
+            ind += 1
+
+        while ind < len(starts):
+            block_st, block_end = starts[ind], ends[ind]
+
+            # A block starting in a bank can only be used if that bank or
+            # the next one has a piece large enough.  Jump over runs of
+            # banks without one.
+            bank = block_st >> 16
+            if (
+                    size <= _BANK_SIZE and
+                    self.largest_free_in_bank(bank) < size and
+                    self.largest_free_in_bank(bank+1) < size
+            ):
+                next_bank = self._next_bank_fitting(bank+2, size)
+                if next_bank is None:
                     break
+                ind = bisect_left(starts, (next_bank-1) << 16, ind)
+                continue
+
+            next_bank = (block_st & 0xFF0000) + 0x010000
+            true_block_end = min(block_end, next_bank)
+            if true_block_end - block_st >= size:
+                return block_st
+            if block_end - true_block_end >= size:
+                return true_block_end
+            ind += 1
+
+        raise FreeSpaceError(
+            f'Not Enough Free Space.  Size: {size:06X}, '
+            f'hint: {hint:06X}'
+        )
+
+    def _next_bank_fitting(self, bank: int, size: int) -> Optional[int]:
+        '''First bank from bank on with a free block of at least size.'''
+        last_bank = (self._end - 1) >> 16
+        for ind in range(bank, last_bank+1):
+            if self.largest_free_in_bank(ind) >= size:
+                return ind
+        return None
+
+    def get_first_fit_addr(self, size: int, hint: int = 0,
+                           bank: Optional[int] = None) -> int:
+        '''
+        Lowest address at or after hint with size free bytes in one bank.
+        If bank is given, only that bank is searched.
+        '''
+        starts, ends = self._starts, self._ends
+
+        if size <= _BANK_SIZE:
+            if bank is None:
+                bank = self._next_bank_fitting(max(hint, 0) >> 16, size)
+                last_bank = (self._end - 1) >> 16
+            else:
+                last_bank = bank
+
+            while bank is not None and bank <= last_bank:
+                if self.largest_free_in_bank(bank) >= size:
+                    bank_end = (bank+1) << 16
+                    addr = max(hint, bank << 16)
+                    ind = bisect_right(starts, addr) - 1
+                    if ind < 0 or ends[ind] <= addr:
+                        ind += 1
+                    while ind < len(starts) and starts[ind] < bank_end:
+                        block_st = max(starts[ind], addr)
+                        if min(ends[ind], bank_end) - block_st >= size:
+                            return block_st
+                        ind += 1
+                bank = self._next_bank_fitting(bank+1, size)
+
+        raise FreeSpaceError(
+            f'Not Enough Free Space.  Size: {size:06X}, '
+            f'hint: {hint:06X}'
+        )
+
+    def get_best_fit_addr(self, size: int, bank: Optional[int] = None) -> int:
+        '''
+        Start of the smallest free block (lowest address on ties) that
+        holds size bytes without crossing a bank boundary.  If bank is
+        given, only that bank is searched.
+        '''
+        if bank is None:
+            pieces = self._by_size
+        else:
+            pieces = self._bank_sizes.get(bank, [])
+
+        ind = bisect_left(pieces, (size, -1))
+        if ind == len(pieces):
+            raise FreeSpaceError(f'Not Enough Free Space.  Size: {size:06X}')
+        return pieces[ind][1]
+
+    def is_range_free(self, start: int, end: int) -> bool:
+        '''True if every byte of [start, end) is free.'''
+        ind = bisect_right(self._starts, start) - 1
+        return ind >= 0 and end <= self._ends[ind]
+
+    def is_range_used(self, start: int, end: int) -> bool:
+        '''True if no byte of [start, end) is free.'''
+        ind = bisect_left(self._ends, start + 1)
+        return ind == len(self._starts) or self._starts[ind] >= end
+
+    def free_extent(self, addr: int) -> Optional[Tuple[int, int]]:
+        '''The free block holding addr, or None if addr is used.'''
+        ind = bisect_right(self._starts, addr) - 1
+        if ind >= 0 and addr < self._ends[ind]:
+            return (self._starts[ind], self._ends[ind])
+        return None
+
+    def plan_same_bank(self, sizes: Sequence[int],
+                       hint: int = 0) -> list[int]:
+        '''
+        Addresses for blocks of the given sizes, all in one bank and at or
+        after hint.  Nothing is marked; pass the blocks to claim_blocks to
+        commit the plan.
+
+        Banks are tried in address order, skipping any whose largest free
+        block or total free space is too small.  Within a bank the blocks
+        go largest first, each at the lowest address that still fits.
+        '''
+        if not sizes:
+            return []
 
-                # If the block ends before the next bank starts, then
-                # block_end == true_block_end, and this if won't trigger.
-                # Otherwise, true_block_end is the start of the next bank, and
-                # we're trying to fit at the start of the next bank.
-                if block_end - true_block_end >= size:
-                    ret = true_block_end  # == next bank start
+        order = sorted(range(len(sizes)), key=lambda ind: -sizes[ind])
+        sorted_sizes = [sizes[ind] for ind in order]
+        total = sum(sizes)
+
+        bank = self._next_bank_fitting(max(hint, 0) >> 16, sorted_sizes[0])
+        while bank is not None:
+            if self.free_in_bank(bank) >= total:
+                addrs = self._pack_bank(bank, sorted_sizes, hint)
+                if addrs is not None:
+                    plan = [0]*len(sizes)
+                    for ind, addr in zip(order, addrs):
+                        plan[ind] = addr
+                    return plan
+            bank = self._next_bank_fitting(bank+1, sorted_sizes[0])
+
+        raise FreeSpaceError(
+            f'Not Enough Free Space in one bank.  Sizes: '
+            f'{", ".join(f"{size:04X}" for size in sizes)}, hint: {hint:06X}'
+        )
+
+    def _pack_bank(self, bank: int, sizes: Sequence[int],
+                   hint: int) -> Optional[list[int]]:
+        '''First fit of sizes, in order, into a private copy of bank's holes.'''
+        starts, ends = self._starts, self._ends
+        bank_st = max(bank << 16, hint)
+        bank_end = (bank+1) << 16
+
+        ind = bisect_right(starts, bank_st) - 1
+        if ind < 0 or ends[ind] <= bank_st:
+            ind += 1
+        holes = []
+        while ind < len(starts) and starts[ind] < bank_end:
+            holes.append([max(starts[ind], bank_st), min(ends[ind], bank_end)])
+            ind += 1
+
+        addrs = []
+        for size in sizes:
+            for hole in holes:
+                if hole[1] - hole[0] >= size:
+                    addrs.append(hole[0])
+                    hole[0] += size
                     break
+            else:
+                return None
+        return addrs
 
-            if ret is None:
-                # print("Error: Not enough free space.")
-                # print(f"size: {size:06X}, hint: {hint:06X}")
-                # self.print_blocks()
+    def claim_blocks(self, blocks: Iterable[Tuple[int, int]]):
+        '''
+        Mark every block used.  If any block is not entirely free, or two
+        blocks overlap, raise FreeSpaceError and mark nothing.
+        '''
+        blocks = sorted(blocks)
+        prev_end = None
+        for start, end in blocks:
+            if (
+                    end <= start or not self.is_range_free(start, end) or
+                    (prev_end is not None and start < prev_end)
+            ):
                 raise FreeSpaceError(
-                    f'Not Enough Free Space.  Size: {size:06X}, '
-                    f'hint: {hint:06X}'
+                    f'Block [{start:06X}, {end:06X}) can not be claimed.'
                 )
+            prev_end = end
 
-            return ret
+        for block in blocks:
+            self.mark_block(block, FSWriteType.MARK_USED)
 
-    # Sometimes data needs the same bank, so
     def get_same_bank_free_addrs(self, sizes: list[int],
                                  hint: int = 0) -> list[int]:
-
-        if not sizes:
-            return []
-
-        tries = [0 for x in sizes]
-        perm = tuple(i for i in range(len(sizes)))
-
-        # going to assign in sorted order.
-        # Should discard heavily used blocks more quickly.
-        # Save the permutation to recover the original order
-        sort_sizes, perm = zip(*sorted(zip(sizes, perm), reverse=True))
-
-        start = hint
-
-        while True:
-            tries[0] = self.get_free_addr(sort_sizes[0], start)
-            self.mark_block((tries[0], tries[0]+sort_sizes[0]),
-                            FSWriteType.MARK_USED)
-
-            first_bank = (tries[0] >> 16) << 16
-
-            success = True
-
-            for i in range(1, len(sort_sizes)):
-                tries[i] = self.get_free_addr(sort_sizes[i], first_bank)
-                this_bank = (tries[i] >> 16) << 16
-
-                if this_bank != first_bank:
-                    success = False
-                    start = this_bank
-
-                    # undo previous markings
-                    for j in range(0, i):
-                        self.mark_block((tries[j], tries[j]+sort_sizes[j]),
-                                        FSWriteType.MARK_FREE)
-                else:
-                    # Mark and proceed to next
-                    self.mark_block((tries[i], tries[i]+sort_sizes[i]),
-                                    FSWriteType.MARK_USED)
-
-            if success:
-                break
-
-        # Undo markings.  This is sort of ugly.  It would be nice to separate
-        # the buffer from the freespace checker so that we can copy the
-        # freespace checker and mess with that while finding addresses.
-        for i in range(len(tries)):
-            self.mark_block((tries[i], tries[i]+sort_sizes[i]),
-                            FSWriteType.MARK_FREE)
-
-        perm, tries_tuple = zip(*sorted(zip(perm, tries)))
-
-        return list(tries_tuple)
+        return self.plan_same_bank(sizes, hint)
 
     # Mark a file with Anskiy's .txt patch format
     # Duplicates much code.  Consider adding patching functionality into
@@ -296,47 +513,20 @@ class FreeSpace():
             self.mark_blocks_ips_obj(ips_obj)
 
     def print_blocks(self):
-
-        print('Free blocks: ')
-
-        if self.first_free is True:
-            start = 0
-        else:
-            start = 1
-
-        for x in range(start, len(self.markers)-1, 2):
-            print('[%6.6X, %6.6X)\t %X bytes'
-                  % (self.markers[x], self.markers[x+1],
-                     (self.markers[x+1]-self.markers[x])))
-
-        print('Used blocks: ')
-
-        if self.first_free is True:
-            start = 1
-        else:
-            start = 0
-
-        for x in range(start, len(self.markers)-1, 2):
-            print('[%6.6X, %6.6X)\t %X bytes'
-                  % (self.markers[x], self.markers[x+1],
-                     (self.markers[x+1]-self.markers[x])))
-
-    # Find the index of an address in the block map
-    def __search(self, start_ind, end_ind, addr):
-        search_ind = (start_ind+end_ind)//2
-
-        left = self.markers[search_ind]
-        right = self.markers[search_ind+1]
-
-        if left <= addr < right:
-            return search_ind
-        elif addr >= right:
-            if start_ind == len(self.markers)-1:
-                return len(self.markers)-2
-            else:
-                return self.__search(search_ind+1, end_ind, addr)
-        else:
-            return self.__search(start_ind, search_ind-1, addr)
+        used = []
+        prev_end = 0
+        for start, end in self.free_blocks():
+            if start > prev_end:
+                used.append((prev_end, start))
+            prev_end = end
+        if prev_end < self._end:
+            used.append((prev_end, self._end))
+
+        for title, blocks in (('Free blocks: ', self.free_blocks()),
+                              ('Used blocks: ', used)):
+            print(title)
+            for start, end in blocks:
+                print('[%6.6X, %6.6X)\t %X bytes' % (start, end, end-start))
 
 
 class FSRom(BytesIO):
@@ -471,11 +661,3 @@ class FSRom(BytesIO):
             # strip off leading './patches/' if included in filename
             parts = parts[1:]
         return Path(FSRom._patches_path, *parts)
-
-
-def main():
-    pass
-
-
-if __name__ == '__main__':
-    main()
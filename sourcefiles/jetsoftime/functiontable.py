@@ -0,0 +1,86 @@
+'''Function extents and link status for an event's pointer table.'''
+from __future__ import annotations
+
+from array import array
+import sys
+from typing import Optional, Tuple
+
+
+def pointer_array(header) -> array:
+    '''The little endian u16 pointers in header as an array.'''
+    ptrs = array('H', bytes(header))
+    if sys.byteorder != 'little':
+        ptrs.byteswap()
+    return ptrs
+
+
+class FunctionTable:
+    '''
+    Start, end and kind of every function slot, computed in one pass over
+    the 16-pointer-per-object table at the head of an event's data.
+
+    A slot is empty if it shares its start with an earlier slot of the same
+    object, linked if its start lies outside its object, and real
+    otherwise.  The table is a snapshot: Event compares the header bytes
+    and data length before reusing it.
+    '''
+
+    def __init__(self, header: bytes, data_len: int):
+        self.header = bytes(header)
+        self.data_len = data_len
+
+        starts = pointer_array(self.header)
+        num_slots = len(starts)
+        self.starts = starts
+
+        # A function ends where the next pointer with a different value
+        # starts.  Sharing a start means sharing an end, so fill backwards.
+        ends = [data_len] * num_slots
+        for ind in range(num_slots - 2, -1, -1):
+            next_start = starts[ind+1]
+            ends[ind] = next_start if next_start != starts[ind] \
+                else ends[ind+1]
+        self.ends = ends
+
+        obj_starts = list(starts[0::16]) + [data_len]
+        self.empty = [False] * num_slots
+        self.linked = [False] * num_slots
+        self._first_real: dict[int, int] = {}
+        for ind, start in enumerate(starts):
+            obj_id, func_id = divmod(ind, 16)
+            obj_base = 16*obj_id
+            self.empty[ind] = start in starts[obj_base:ind]
+            self.linked[ind] = \
+                not obj_starts[obj_id] <= start < obj_starts[obj_id+1]
+            if not (self.empty[ind] or self.linked[ind]):
+                self._first_real.setdefault(start, ind)
+
+    def is_valid_for(self, data: bytearray) -> bool:
+        return (
+            len(data) == self.data_len and
+            data[:len(self.header)] == self.header
+        )
+
+    def end(self, obj_id: int, func_id: int) -> int:
+        return self.ends[16*obj_id + func_id]
+
+    def is_empty(self, obj_id: int, func_id: int) -> bool:
+        return self.empty[16*obj_id + func_id]
+
+    def is_linked(self, obj_id: int, func_id: int) -> bool:
+        return self.linked[16*obj_id + func_id]
+
+    def is_real(self, obj_id: int, func_id: int) -> bool:
+        ind = 16*obj_id + func_id
+        return not (self.empty[ind] or self.linked[ind])
+
+    def link_target(self, obj_id: int,
+                    func_id: int) -> Optional[Tuple[int, int]]:
+        '''First real slot sharing this slot's start, if this is a link.'''
+        ind = 16*obj_id + func_id
+        if not (self.empty[ind] or self.linked[ind]):
+            return None
+        target = self._first_real.get(self.starts[ind])
+        if target is None:
+            return None
+        return divmod(target, 16)
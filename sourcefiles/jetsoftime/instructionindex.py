@@ -0,0 +1,200 @@
+'''Compact per-command index of an event script's bytecode.'''
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from .eventcommand import EventCommand as EC, Platform, command_length, \
+    DECODED_COMMAND_IDS
+
+
+@lru_cache(maxsize=256)
+def _opcodes_for(cmd_ids: frozenset[int]) -> frozenset[int]:
+    '''Raw opcode bytes that decode to one of cmd_ids.'''
+    return frozenset(
+        opcode for opcode in range(0x100)
+        if DECODED_COMMAND_IDS[opcode] in cmd_ids
+    )
+
+
+_FWD_JUMP_OPCODES = frozenset(EC.fwd_jump_commands)
+_JUMP_OPCODES = _FWD_JUMP_OPCODES | frozenset(EC.back_jump_commands)
+
+# Jump offsets are one byte, so a jump whose command starts further than
+# this from an edit can not span it.
+_JUMP_REACH = 0x100 + 0x10
+
+
+class JumpSite(NamedTuple):
+    '''A jump command.  target is where execution continues if it jumps.'''
+    pos: int
+    width: int
+    forward: bool
+    target: int
+
+    @property
+    def span(self) -> Tuple[int, int]:
+        '''
+        (start, end) of the block the jump controls.  For a backward jump
+        the jump command itself is inside the block.
+        '''
+        cmd_bound = self.pos if self.forward else self.pos + self.width
+        return (min(cmd_bound, self.target), max(cmd_bound, self.target))
+
+
+class InstructionIndex:
+    '''
+    Offsets, opcodes and lengths of every command from `start` to the end of
+    an event's data, as parallel arrays built in one pass with
+    command_length.  Lengths are u16 rather than u8 because 0x4E carries
+    its data blob inline.
+
+    The index is only valid for the exact bytearray it was built from.
+    Event checks source/data_len before use and patches the index on
+    insert_commands/delete_commands.
+
+    The offsets of jump commands are also kept, sorted, in `jumps` so that
+    an edit only needs to look at the jumps near it.  Jump targets are
+    read from the data on demand since jump offsets are edited in place.
+    '''
+
+    def __init__(self, data: bytearray, start: int, platform: Platform):
+        self.source = data
+        self.start = start
+        self.platform = platform
+        self.offsets = array('H' if len(data) <= 0xFFFF else 'I')
+        self.opcodes = array('B')
+        self.lengths = array('H')
+        self.jumps = array(self.offsets.typecode)
+        self._scan(data, start, len(data), self.offsets, self.opcodes,
+                   self.lengths, self.jumps)
+        self.data_len = len(data)
+
+    def _scan(self, data, pos: int, end: int, offsets: array,
+              opcodes: array, lengths: array, jumps: array) -> None:
+        platform = self.platform
+        while pos < end:
+            length = command_length(data, pos, platform)
+            opcode = data[pos]
+            offsets.append(pos)
+            opcodes.append(opcode)
+            lengths.append(length)
+            # A jump with no arguments (SNES 0x6E) has no offset to fix up.
+            if opcode in _JUMP_OPCODES and length > 1:
+                jumps.append(pos)
+            pos += length
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def is_valid_for(self, data: bytearray, start: int) -> bool:
+        return (
+            data is self.source and len(data) == self.data_len and
+            start == self.start
+        )
+
+    def locate(self, pos: int) -> Optional[int]:
+        '''Index of the command starting exactly at pos, or None.'''
+        ind = bisect_left(self.offsets, pos)
+        if ind < len(self.offsets) and self.offsets[ind] == pos:
+            return ind
+        return None
+
+    def bound(self, pos: int) -> int:
+        '''Index of the first command starting at or after pos.'''
+        return bisect_left(self.offsets, pos)
+
+    def find(self, cmd_ids: Iterable[int], first: int,
+             end_pos: int) -> Optional[int]:
+        '''
+        Index of the first command from index `first` that starts before
+        end_pos and decodes to one of cmd_ids.
+        '''
+        wanted = _opcodes_for(frozenset(cmd_ids))
+        opcodes = self.opcodes
+        last = self.bound(end_pos)
+        for ind in range(first, last):
+            if opcodes[ind] in wanted:
+                return ind
+        return None
+
+    def jump_sites(self, lo: int, hi: int) -> Iterator[JumpSite]:
+        '''Jump commands starting in [lo, hi).'''
+        jumps = self.jumps
+        data = self.source
+        for ind in range(bisect_left(jumps, lo), bisect_left(jumps, hi)):
+            pos = jumps[ind]
+            width = self.lengths[self.locate(pos)]
+            offset = data[pos + width - 1]
+            if data[pos] in _FWD_JUMP_OPCODES:
+                yield JumpSite(pos, width, True, pos + width + offset - 1)
+            else:
+                yield JumpSite(pos, width, False, pos + width - offset - 1)
+
+    def jumps_spanning(self, before_pos: int,
+                       after_pos: int) -> Iterator[JumpSite]:
+        '''Jump commands close enough to [before_pos, after_pos) to span it.'''
+        return self.jump_sites(max(after_pos - _JUMP_REACH, 0),
+                               before_pos + _JUMP_REACH)
+
+    def patch_delete(self, pos: int, length: int) -> bool:
+        '''
+        Update for data[pos:pos+length] having been deleted.  Returns False
+        if pos is not a command boundary, in which case the index is stale.
+        '''
+        first = self.locate(pos)
+        if first is None:
+            return False
+        last = self.bound(pos + length)
+        del self.offsets[first:last]
+        del self.opcodes[first:last]
+        del self.lengths[first:last]
+        self._shift(self.offsets, first, -length)
+
+        jumps = self.jumps
+        first = bisect_left(jumps, pos)
+        del jumps[first:bisect_left(jumps, pos + length)]
+        self._shift(jumps, first, -length)
+
+        self.data_len -= length
+        return True
+
+    def patch_insert(self, pos: int, length: int) -> bool:
+        '''
+        Update for `length` bytes of whole commands having been inserted at
+        pos (already written to the source data).  Returns False if pos was
+        not a command boundary.
+        '''
+        ind = self.bound(pos)
+        if pos != self.data_len and self.locate(pos) is None:
+            return False
+        if pos < self.start:
+            return False
+        if self.offsets.typecode == 'H' and self.data_len + length > 0xFFFF:
+            return False
+        offsets = array(self.offsets.typecode)
+        opcodes = array('B')
+        lengths = array('H')
+        jumps = array(self.jumps.typecode)
+        self._scan(self.source, pos, pos + length, offsets, opcodes, lengths,
+                   jumps)
+        if offsets and offsets[-1] + lengths[-1] != pos + length:
+            return False
+        self._shift(self.offsets, ind, length)
+        self.offsets[ind:ind] = offsets
+        self.opcodes[ind:ind] = opcodes
+        self.lengths[ind:ind] = lengths
+
+        jump_ind = bisect_left(self.jumps, pos)
+        self._shift(self.jumps, jump_ind, length)
+        self.jumps[jump_ind:jump_ind] = jumps
+
+        self.data_len += length
+        return True
+
+    @staticmethod
+    def _shift(positions: array, first: int, shift: int) -> None:
+        positions[first:] = array(positions.typecode,
+                                  map(shift.__add__, positions[first:]))
@@ -0,0 +1,199 @@
+'''
+Compaction of the compressed event scripts in a rom.
+
+Rewriting a script frees its old packet, so after many saves the script
+banks are full of small holes.  Compaction slides each bank's scripts down
+over the free space in front of them, which merges those holes into one
+block after the last script that moved.  A script is only moved if every
+byte between it and its new address is free or belongs to another script
+that is moving, so data this module does not know about never moves.
+
+Only packets reached through the location table are moved.  Run this after
+pending scripts have been written; it does not touch ScriptManager's loaded
+scripts.
+'''
+from __future__ import annotations
+
+from typing import NamedTuple, Tuple
+
+from .byteops import get_value_from_bytes, to_file_ptr, to_little_endian, \
+    to_rom_ptr
+from .ctdecompress import get_compressed_length
+from .ctevent import ScriptManager
+from .freespace import BankStats, FreeSpace, FSWriteType
+
+NUM_LOCATIONS = 0x200
+
+
+class ScriptBlock(NamedTuple):
+    '''A compressed script and the event pointer indices that use it.'''
+    start: int
+    end: int
+    event_inds: Tuple[int, ...]
+
+
+class ScriptMove(NamedTuple):
+    old: int
+    new: int
+    length: int
+    event_inds: Tuple[int, ...]
+
+
+class CompactionReport(NamedTuple):
+    moves: list[ScriptMove]
+    before: dict[int, BankStats]
+    after: dict[int, BankStats]
+    dry_run: bool
+
+    def lines(self) -> list[str]:
+        '''Human readable summary: the moves and each changed bank.'''
+        verb = 'Would move' if self.dry_run else 'Moved'
+        ret = [f'{verb} {len(self.moves)} scripts.']
+        for move in self.moves:
+            ret.append(
+                f'  [{move.old:06X}, {move.old+move.length:06X}) -> '
+                f'{move.new:06X}  (events '
+                f'{", ".join(f"{ind:03X}" for ind in move.event_inds)})'
+            )
+
+        empty = BankStats(0, 0, 0)
+        for bank in sorted(set(self.before) | set(self.after)):
+            before = self.before.get(bank, empty)
+            after = self.after.get(bank, empty)
+            if before == after:
+                continue
+            ret.append(
+                f'  Bank {bank:02X}: {before.holes} holes, largest '
+                f'{before.largest:04X} -> {after.holes} holes, largest '
+                f'{after.largest:04X}'
+            )
+        return ret
+
+
+def _is_file_ptr(rom_ptr: int) -> bool:
+    return 0xC00000 <= rom_ptr <= 0xFFFFFF or 0x400000 <= rom_ptr <= 0x5FFFFF
+
+
+def find_script_blocks(manager: ScriptManager,
+                       num_locations: int = NUM_LOCATIONS
+                       ) -> list[ScriptBlock]:
+    '''
+    Used, non-overlapping script packets reached from the first
+    num_locations locations, sorted by address.
+    '''
+    space = manager.fsrom.space_manager
+    users: dict[int, list[int]] = {}
+    with manager.fsrom.getbuffer() as rom:
+        event_inds = set()
+        for loc_id in range(num_locations):
+            event_ind_st = manager.loc_data_ptr + 14*loc_id + 8
+            event_inds.add(
+                get_value_from_bytes(rom[event_ind_st:event_ind_st+2])
+            )
+
+        for event_ind in sorted(event_inds):
+            ptr_st = manager.event_data_ptr + 3*event_ind
+            rom_ptr = get_value_from_bytes(rom[ptr_st:ptr_st+3])
+            if _is_file_ptr(rom_ptr) and to_file_ptr(rom_ptr) < len(rom):
+                users.setdefault(to_file_ptr(rom_ptr), []).append(event_ind)
+
+        blocks = []
+        for start, inds in sorted(users.items()):
+            try:
+                length = get_compressed_length(rom, start)
+            except IndexError:
+                continue
+            blocks.append(ScriptBlock(start, start+length, tuple(inds)))
+
+    # Drop packets that overlap each other or that sit in free space.
+    ret = []
+    for ind, block in enumerate(blocks):
+        if ind > 0 and blocks[ind-1].end > block.start:
+            continue
+        if ind+1 < len(blocks) and block.end > blocks[ind+1].start:
+            continue
+        if space.is_range_used(block.start, block.end):
+            ret.append(block)
+    return ret
+
+
+def plan_compaction(manager: ScriptManager,
+                    num_locations: int = NUM_LOCATIONS) -> list[ScriptMove]:
+    '''Moves that slide each bank's scripts down, in address order.'''
+    space = manager.fsrom.space_manager
+    moves = []
+
+    # cursor is where the next script would go: the start of the free run
+    # that ends at the current script, or None if there is none.
+    cursor = None
+    prev_end = 0
+    prev_bank = None
+    for block in find_script_blocks(manager, num_locations):
+        bank = block.start >> 16
+        if bank != prev_bank:
+            prev_bank = bank
+            prev_end = bank << 16
+            cursor = None
+
+        if (block.end - 1) >> 16 != bank:
+            # Never move a packet that crosses into the next bank.
+            cursor = None
+            prev_end = block.end
+            continue
+
+        if block.start > prev_end and not (
+                cursor is not None and
+                space.is_range_free(prev_end, block.start)
+        ):
+            extent = space.free_extent(block.start - 1)
+            cursor = None if extent is None else max(extent[0], prev_end)
+
+        length = block.end - block.start
+        if cursor is not None:
+            moves.append(ScriptMove(block.start, cursor, length,
+                                    block.event_inds))
+            cursor += length
+        prev_end = block.end
+
+    return moves
+
+
+def _mark_moves(space: FreeSpace, moves: list[ScriptMove]):
+    for move in moves:
+        space.mark_block((move.old, move.old+move.length),
+                         FSWriteType.MARK_FREE)
+        space.mark_block((move.new, move.new+move.length),
+                         FSWriteType.MARK_USED)
+
+
+def compact_scripts(manager: ScriptManager, dry_run: bool = False,
+                    num_locations: int = NUM_LOCATIONS) -> CompactionReport:
+    '''
+    Slide scripts down over free space and rewrite their event pointers.
+    With dry_run, nothing changes and the report shows what would happen.
+    '''
+    fsrom = manager.fsrom
+    space = fsrom.space_manager
+    before = space.bank_stats()
+    moves = plan_compaction(manager, num_locations)
+
+    if dry_run:
+        planned = space.copy()
+        _mark_moves(planned, moves)
+        return CompactionReport(moves, before, planned.bank_stats(), True)
+
+    # Moves are in address order and each goes down, so a packet is always
+    # read before anything is written over it.
+    for move in moves:
+        fsrom.seek(move.old)
+        packet = fsrom.read(move.length)
+        fsrom.seek(move.new)
+        fsrom.write(packet)
+
+        ptr = to_little_endian(to_rom_ptr(move.new), 3)
+        for event_ind in move.event_inds:
+            fsrom.seek(manager.event_data_ptr + 3*event_ind)
+            fsrom.write(ptr)
+
+    _mark_moves(space, moves)
+    return CompactionReport(moves, before, space.bank_stats(), False)
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import shutil
-import struct
+import threading
+from collections.abc import MutableSequence
 from pathlib import Path
 
 from sourcefiles.jetsoftime import ctevent, ctstrings
@@ -14,8 +17,14 @@ from pcgamedata import (
     read_scene_script_raw,
     load_string_table,
     discover_msg_prefix,
-    _SCRIPT_INDEX_OFFSET,
-    _MAP_INDEX_OFFSET,
+)
+from pccache import user_cache_dir
+from pcsceneindex import (
+    MAPINFO_DIR,
+    SceneInfo,
+    build_scene_index,
+    load_scene_index,
+    save_scene_index,
 )
 
 
@@ -128,13 +137,66 @@ def _pc_str_to_ct_ascii(s: str) -> str:
     return ''.join(result)
 
 
+def _translate_pc_string(pc_str: str) -> ctstrings.CTString:
+    translated = _pc_str_to_ct_ascii(pc_str) or '?'
+    try:
+        return ctstrings.CTString.from_ascii(translated)
+    except Exception:
+        return ctstrings.CTString.from_ascii('?')
+
+
+class _LazyStrings(MutableSequence):
+    """
+    Event.strings for a PC scene.  Entries start as the raw PC strings of a
+    shared message table and are translated to CTStrings on first access.
+    """
+
+    def __init__(self, raw_strings: list[str]):
+        # Each item is an untranslated PC str or a translated CTString.
+        self._items: list[str | ctstrings.CTString] = list(raw_strings)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if isinstance(item, str):
+            item = _translate_pc_string(item)
+            self._items[index] = item
+        return item
+
+    def __setitem__(self, index, value) -> None:
+        self._items[index] = value
+
+    def __delitem__(self, index) -> None:
+        del self._items[index]
+
+    def insert(self, index: int, value: ctstrings.CTString) -> None:
+        self._items.insert(index, value)
+
+    def stage(self, index: int, pc_str: str) -> None:
+        """Replace an entry with a different untranslated PC string."""
+        self._items[index] = pc_str
+
+
 class PcBackend(GameBackend):
-    def __init__(self, path: Path):
-        self._gd = GameData(str(path))
+    def __init__(self, path: Path, cache_dir: Path | None = None):
+        self._gd = GameData(str(path), str(cache_dir) if cache_dir is not None else None)
+        self._cache_dir = cache_dir
         self._script_cache: dict[int, ctevent.Event] = {}
         # scene_index -> script_index (from mapinfo header)
         self._scene_to_script: dict[int, int] = {}
+        self.scenes: dict[int, SceneInfo] = {}
+        self._scene_index_writer: threading.Thread | None = None
         self._location_list: list[tuple[int, str]] = []
+        # table_idx -> {string_idx: PC string} not yet written to disk
+        self._pending_strings: dict[int, dict[int, str]] = {}
+        # table_idx -> parsed message table, shared by every scene using it
+        self._string_tables: dict[int, list[str] | None] = {}
+        # Set once the archive has been backed up before its first append.
+        self._archive_backed_up = False
         self._msg_prefix: str | None = discover_msg_prefix(self._gd)
         self._build_location_list()
 
@@ -146,45 +208,59 @@ class PcBackend(GameBackend):
         if table_idx is None:
             return
 
-        raw_strings = load_string_table(self._gd, self._msg_prefix, table_idx)
+        if table_idx not in self._string_tables:
+            self._string_tables[table_idx] = load_string_table(self._gd, self._msg_prefix, table_idx)
+        raw_strings = self._string_tables[table_idx]
         if raw_strings is None:
             return
 
-        ct_strings: list[ctstrings.CTString] = []
-        for s in raw_strings:
-            translated = _pc_str_to_ct_ascii(s) or '?'
-            try:
-                ct_strings.append(ctstrings.CTString.from_ascii(translated))
-            except Exception:
-                ct_strings.append(ctstrings.CTString.from_ascii('?'))
-
-        event.strings = ct_strings
+        strings = _LazyStrings(raw_strings)
+        for string_idx, pc_str in self._pending_strings.get(table_idx, {}).items():
+            if string_idx < len(strings):
+                strings.stage(string_idx, pc_str)
+        event.strings = strings
+
+    def _scene_index_path(self) -> str:
+        """
+        Sidecar location: in cache_dir if given, else the per-user cache.
+        Never inside the game data, which save_to_file copies into the mod.
+        """
+        if self._gd.is_archive:
+            data_path = self._gd.archive_path
+        else:
+            data_path = self._gd.directory
+        cache_dir = str(self._cache_dir) if self._cache_dir is not None else user_cache_dir()
+        key = hashlib.sha1(os.path.abspath(data_path).encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir, f"scene_index_{key}.bin")
+
+    def _load_scenes(self) -> dict[int, SceneInfo]:
+        fingerprint = self._gd.fingerprint(MAPINFO_DIR)
+        sidecar = self._scene_index_path()
+        scenes = load_scene_index(sidecar, fingerprint)
+        if scenes is None:
+            scenes = build_scene_index(self._gd, _MAX_SCENE_PROBE, _MISS_LIMIT)
+            # Saving is off the startup path; a failed save just means the
+            # next launch rebuilds again.
+            self._scene_index_writer = threading.Thread(
+                target=save_scene_index, args=(sidecar, fingerprint, scenes),
+                daemon=True)
+            self._scene_index_writer.start()
+        return scenes
+
+    def wait_for_scene_index(self) -> None:
+        """Block until a pending scene index sidecar write has finished."""
+        if self._scene_index_writer is not None:
+            self._scene_index_writer.join()
 
     def _build_location_list(self) -> None:
-        consecutive_misses = 0
-        for scene_index in range(_MAX_SCENE_PROBE):
-            vpath = f"Game/field/Mapinfo/mapinfo_{scene_index}.dat"
-            if not self._gd.exists(vpath):
-                consecutive_misses += 1
-                if consecutive_misses >= _MISS_LIMIT:
-                    break
-                continue
-
-            consecutive_misses = 0
-            locations_map = dict(locations)
-            try:
-                raw = self._gd.read(vpath)
-                if len(raw) < 18:
-                    continue
-                script_index = struct.unpack_from('<H', raw, _SCRIPT_INDEX_OFFSET)[0]
-                map_index    = struct.unpack_from('<H', raw, _MAP_INDEX_OFFSET)[0]
-                self._scene_to_script[scene_index] = script_index
-                if scene_index in locations_map:
-                    self._location_list.append((scene_index, f"{scene_index:03X} - {locations_map[scene_index]}"))
-                else:
-                    self._location_list.append((scene_index,  f"Unknown - Scene {scene_index:04d}  (map={map_index}, script={script_index})"))
-            except Exception:
-                pass
+        self.scenes = self._load_scenes()
+        locations_map = dict(locations)
+        for scene_index, info in self.scenes.items():
+            self._scene_to_script[scene_index] = info.script_index
+            if scene_index in locations_map:
+                self._location_list.append((scene_index, f"{scene_index:03X} - {locations_map[scene_index]}"))
+            else:
+                self._location_list.append((scene_index,  f"Unknown - Scene {scene_index:04d}  (map={info.map_index}, script={info.script_index})"))
 
     def get_script(self, location_id: int) -> ctevent.Event:
         if location_id in self._script_cache:
@@ -201,25 +277,100 @@ class PcBackend(GameBackend):
         return list(self._location_list)
 
     def write_script(self, location_id: int) -> None:
-        if self._gd.is_archive:
+        self._write_scripts([location_id])
+
+    def write_dirty_scripts(self) -> list[int]:
+        written = self._dirty_locations()
+        if written:
+            self._write_scripts(written)
+        return written
+
+    def _dirty_locations(self) -> list[int]:
+        return [location_id for location_id, event in self._script_cache.items() if event.dirty]
+
+    def _write_scripts(self, location_ids: list[int]) -> None:
+        self._backup_archive()
+        self._gd.write_many(self._script_updates(location_ids))
+        self._clear_pending_strings()
+        for location_id in location_ids:
+            self._script_cache[location_id].dirty = False
+
+    def _script_updates(self, location_ids: list[int]) -> dict[str, bytes]:
+        """New file contents for the given scripts, by virtual path."""
+        # Staged string tables go out in the same batch as the scripts.
+        updates = self._staged_string_tables()
+        for location_id in location_ids:
+            script_index = self._scene_to_script[location_id]
+            vpath = f"Game/field/atel/Atel_{script_index:04d}.dat"
+            updates[vpath] = bytes(self._script_cache[location_id].get_bytearray())
+        return updates
+
+    def _backup_archive(self) -> None:
+        """Copy the archive to <name>.bak before the first in-place append."""
+        if not self._gd.is_archive or self._archive_backed_up:
             return
-        script_index = self._scene_to_script[location_id]
-        event = self._script_cache[location_id]
-        vpath = f"Game/field/atel/Atel_{script_index:04d}.dat"
-        self._gd.write(vpath, bytes(event.get_bytearray()))
+        backup = self._gd.archive_path + '.bak'
+        if not os.path.exists(backup):
+            shutil.copy2(self._gd.archive_path, backup)
+        self._archive_backed_up = True
 
     def save_to_file(self, path: Path) -> None:
+        dst = self._copy_to(path)
+        if dst is None:
+            self.flush_strings()
+        elif self._pending_strings:
+            self._write_copy(dst, self._staged_string_tables())
+
+    def save_as(self, path: Path) -> list[int]:
+        """
+        Copy the game data to path and write every dirty script and staged
+        string into the copy.  The open game data is never written, so the
+        edits stay pending for a later save_to_file.
+        """
+        dst = self._copy_to(path)
+        if dst is None:
+            written = self.write_dirty_scripts()
+            self.flush_strings()
+            return written
+        written = self._dirty_locations()
+        updates = self._script_updates(written)
+        if updates:
+            self._write_copy(dst, updates)
+        return written
+
+    def _copy_to(self, path: Path) -> Path | None:
+        """
+        Copy the game data as it is on disk to path and return the copy's
+        path, or return None if path is the open game data itself.
+        """
         if self._gd.is_archive:
-            return
+            src = Path(self._gd.archive_path).resolve()
+            dst = path.resolve()
+            if dst.is_dir():
+                dst = dst / src.name
+            if src == dst:
+                return None
+            # Edits are appended in place; write a compacted copy.
+            self._gd.compact(str(dst))
+            return dst
         src = Path(self._gd.directory).resolve()
         dst = path.resolve()
         if src == dst:
-            return  # already written in-place by write_script
+            return None
         if dst.is_relative_to(src):
             raise ValueError(f"Destination {dst} is inside source {src}")
         if dst.exists():
             shutil.rmtree(dst)
         shutil.copytree(src, dst)
+        return dst
+
+    @staticmethod
+    def _write_copy(dst: Path, updates: dict[str, bytes]) -> None:
+        copy = GameData(str(dst), memory_cache_bytes=0)
+        try:
+            copy.write_many(updates)
+        finally:
+            copy.close()
 
     def modify_string(self, loc_id: int, string_idx: int, new_ascii: str) -> None:
         event = self.get_script(loc_id)
@@ -227,24 +378,43 @@ class PcBackend(GameBackend):
             return
         event.strings[string_idx] = ctstrings.CTString.from_ascii(new_ascii)
 
-        if self._gd.is_archive:
-            return  # read-only archive — in-memory update only
-
         table_idx = event.get_string_index()
-        if table_idx is None:
+        if table_idx is None or self._msg_prefix is None:
             return
-        self._rewrite_string_table(table_idx, string_idx, _ct_ascii_to_pc_str(new_ascii))
+        # Staged until the next save so bulk edits cost one write per table.
+        self._pending_strings.setdefault(table_idx, {})[string_idx] = _ct_ascii_to_pc_str(new_ascii)
 
-    def _rewrite_string_table(self, table_idx: int, string_idx: int, new_pc_str: str) -> None:
-        fname = MSG_TABLE_FILES[table_idx]
-        vpath = f"{self._msg_prefix}/{fname}"
-        raw = self._gd.read(vpath)
+    def flush_strings(self) -> None:
+        """Write every message table with staged string edits."""
+        if not self._pending_strings:
+            return
+        self._backup_archive()
+        self._gd.write_many(self._staged_string_tables())
+        self._clear_pending_strings()
+
+    def _clear_pending_strings(self) -> None:
+        # The shared parsed tables no longer match the files just written.
+        for table_idx in self._pending_strings:
+            self._string_tables.pop(table_idx, None)
+        self._pending_strings.clear()
+
+    def _staged_string_tables(self) -> dict[str, bytes]:
+        """New contents of every message table with staged edits, by virtual path."""
+        updates = {}
+        for table_idx, edits in self._pending_strings.items():
+            vpath = f"{self._msg_prefix}/{MSG_TABLE_FILES[table_idx]}"
+            updates[vpath] = self._rewrite_string_table(self._gd.read(vpath), edits)
+        return updates
+
+    @staticmethod
+    def _rewrite_string_table(raw: bytes, edits: dict[int, str]) -> bytes:
         lines = raw.decode('utf-8').splitlines()
-        if string_idx < len(lines):
-            line = lines[string_idx]
-            key = line.split(',', 1)[0] if ',' in line else ''
-            lines[string_idx] = f"{key},{new_pc_str}" if key else new_pc_str
-        self._gd.write(vpath, '\n'.join(lines).encode('utf-8'))
+        for string_idx, new_pc_str in edits.items():
+            if string_idx < len(lines):
+                line = lines[string_idx]
+                key = line.split(',', 1)[0] if ',' in line else ''
+                lines[string_idx] = f"{key},{new_pc_str}" if key else new_pc_str
+        return '\n'.join(lines).encode('utf-8')
 
     @property
     def platform(self) -> Platform:
@@ -252,4 +422,4 @@ class PcBackend(GameBackend):
 
     @property
     def is_read_only(self) -> bool:
-        return self._gd.is_archive
+        return False
@@ -0,0 +1,243 @@
+"""
+Caches of decrypted resources.bin entries: a persistent on-disk cache
+(ResourceCache) and a per-session in-memory LRU (MemoryCache).  Other
+derived data with no cache_dir of its own goes under user_cache_dir().
+
+Layout under the cache root:
+  <sha1 of archive path>/
+    fingerprint          archive size, mtime and header hash this dir is valid for
+    index.json           parsed directory index {path: [offset, size]}
+    entries/<sha1>.dat   decompressed entry, named by a hash of its path
+
+When the archive's fingerprint changes behind our back, its directory is
+wiped and rebuilt.  Writes made through ResourcesBin instead re-key the
+directory in place with rekey(), dropping only the entries they replaced.
+Entry files are evicted least-recently-used first (by file mtime, which is
+bumped on every hit) once the total exceeds the byte budget.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from collections import OrderedDict
+from typing import Iterable
+
+# Default size budget for cached entries of one archive.
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Default size budget for GameData's in-memory read cache.
+DEFAULT_MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def user_cache_dir() -> str:
+    """The per-user cache directory for data derived from the game files."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'TemporalRedux')
+
+
+def archive_fingerprint(bin_path: str, raw_header: bytes) -> str:
+    """Identify an archive by its size, mtime and (encrypted) header bytes."""
+    st = os.stat(bin_path)
+    hasher = hashlib.sha1()
+    hasher.update(f"{st.st_size}:{st.st_mtime_ns}:".encode('ascii'))
+    hasher.update(raw_header)
+    return hasher.hexdigest()
+
+
+class ResourceCache:
+    """Cache of decompressed entries for a single resources.bin archive."""
+
+    def __init__(self, cache_dir: str, bin_path: str, fingerprint: str,
+                 max_bytes: int = DEFAULT_CACHE_BYTES):
+        path_key = hashlib.sha1(os.path.abspath(bin_path).encode('utf-8')).hexdigest()
+        self.root = os.path.join(cache_dir, path_key)
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._entries_dir = os.path.join(self.root, 'entries')
+        # entry file name -> size, least recently used first
+        self._lru: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+
+        self._validate()
+        self._scan_entries()
+
+    def _validate(self) -> None:
+        try:
+            with open(self._fingerprint_path, 'r', encoding='ascii') as f:
+                valid = f.read().strip() == self.fingerprint
+        except OSError:
+            valid = False
+
+        if not valid:
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self._entries_dir, exist_ok=True)
+            self._write_atomic(self._fingerprint_path, self.fingerprint.encode('ascii'))
+
+    @property
+    def _fingerprint_path(self) -> str:
+        return os.path.join(self.root, 'fingerprint')
+
+    def rekey(self, fingerprint: str, index: dict[str, tuple[int, int]],
+              changed: Iterable[str] = ()) -> None:
+        """
+        Adopt a new fingerprint and index after the archive was rewritten by
+        us.  Only the changed paths are dropped; every other entry stays.
+        """
+        for path in changed:
+            self.invalidate(path)
+        self.fingerprint = fingerprint
+        self._write_atomic(self._fingerprint_path, fingerprint.encode('ascii'))
+        self.store_index(index)
+
+    def _scan_entries(self) -> None:
+        found = []
+        with os.scandir(self._entries_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.dat'):
+                    st = entry.stat()
+                    found.append((st.st_mtime_ns, entry.name, st.st_size))
+        for _, name, size in sorted(found):
+            self._lru[name] = size
+            self._total_bytes += size
+
+    def _entry_name(self, path: str) -> str:
+        digest = hashlib.sha1(path.encode('utf-8'))
+        return digest.hexdigest() + '.dat'
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def load_index(self) -> dict[str, tuple[int, int]] | None:
+        try:
+            with open(os.path.join(self.root, 'index.json'), 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {path: (off, size) for path, (off, size) in raw.items()}
+
+    def store_index(self, index: dict[str, tuple[int, int]]) -> None:
+        self._write_atomic(os.path.join(self.root, 'index.json'),
+                           json.dumps(index).encode('utf-8'))
+
+    def get(self, path: str) -> bytes | None:
+        """Return a cached entry, or None on a miss."""
+        name = self._entry_name(path)
+        if name not in self._lru:
+            return None
+        fs_path = os.path.join(self._entries_dir, name)
+        try:
+            # Callers keep the bytes, so one plain read is the only copy;
+            # mapping the file first would just add an mmap on top.
+            with open(fs_path, 'rb') as f:
+                data = f.read()
+            os.utime(fs_path)
+        except OSError:
+            self._forget(name)
+            return None
+        self._lru.move_to_end(name)
+        return data
+
+    def put(self, path: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        name = self._entry_name(path)
+        self._forget(name)
+        try:
+            self._write_atomic(os.path.join(self._entries_dir, name), data)
+        except OSError:
+            return
+        self._lru[name] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+
+    def invalidate(self, path: str) -> None:
+        name = self._entry_name(path)
+        if name in self._lru:
+            self._forget(name)
+            try:
+                os.remove(os.path.join(self._entries_dir, name))
+            except OSError:
+                pass
+
+    def _forget(self, name: str) -> None:
+        size = self._lru.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._lru:
+            name, size = self._lru.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self._entries_dir, name))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write_atomic(fs_path: str, data: bytes) -> None:
+        tmp_path = fs_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, fs_path)
+
+
+class MemoryCache:
+    """
+    In-memory LRU of file contents keyed by virtual path, bounded by the
+    total size of the cached data.  hits and misses count get() results.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._lru
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, path: str) -> bytes | None:
+        """Return a cached entry, or None on a miss."""
+        data = self._lru.get(path)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._lru.move_to_end(path)
+        return data
+
+    def put(self, path: str, data: bytes) -> None:
+        self.invalidate(path)
+        if len(data) > self.max_bytes:
+            return
+        self._lru[path] = data
+        self._total_bytes += len(data)
+        while self._total_bytes > self.max_bytes:
+            _, evicted = self._lru.popitem(last=False)
+            self._total_bytes -= len(evicted)
+
+    def invalidate(self, path: str) -> None:
+        data = self._lru.pop(path, None)
+        if data is not None:
+            self._total_bytes -= len(data)
+
+    def clear(self) -> None:
+        self._lru.clear()
+        self._total_bytes = 0
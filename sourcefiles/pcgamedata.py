@@ -6,10 +6,73 @@ laid out as Game/ and Localize/ sub-trees.
 """
 from __future__ import annotations
 
+import argparse
+import fnmatch
+import hashlib
+import mmap
 import os
 import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
 
-from decrypt import to_i32, xor_decrypt, decrypt_then_decompress
+from decrypt import to_i32, xor_decrypt, decrypt_then_decompress, compress_then_encrypt
+from pccache import (
+    DEFAULT_MEMORY_CACHE_BYTES,
+    MemoryCache,
+    ResourceCache,
+    archive_fingerprint,
+)
+
+
+def _decode_block(view: memoryview, offset: int, size: int) -> bytes:
+    """Decrypt and decompress one archive block out of a mapped view."""
+    with view[offset:offset+size] as raw:
+        return decrypt_then_decompress(raw, to_i32(offset))
+
+
+def _decoded_size(view: memoryview, offset: int) -> int:
+    """Read a block's decompressed length by decrypting only its 4-byte prefix."""
+    prefix = xor_decrypt(bytes(view[offset:offset+4]), to_i32(offset))
+    return struct.unpack('>I', prefix)[0]
+
+
+def _dir_ignores_case(fs_dir: str, names: list[str]) -> bool:
+    """
+    Whether the filesystem holding fs_dir resolves names case-insensitively,
+    found by looking up one of its entries (names) with the case swapped.
+    """
+    listed = set(names)
+    for name in names:
+        swapped = name.swapcase()
+        if swapped != name and swapped not in listed:
+            return os.path.exists(os.path.join(fs_dir, swapped))
+    return os.path.normcase('A') == 'a'
+
+
+def _write_file(fs_path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(fs_path), exist_ok=True)
+    tmp_path = fs_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, fs_path)
+
+
+# Per-process archive mapping used by extract_all's worker pool.
+_worker_view: memoryview | None = None
+
+
+def _init_extract_worker(bin_path: str) -> None:
+    global _worker_view
+    with open(bin_path, 'rb') as f:
+        _worker_view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _extract_entry(job: tuple[int, int, str]) -> int:
+    offset, size, fs_path = job
+    data = _decode_block(_worker_view, offset, size)
+    _write_file(fs_path, data)
+    return len(data)
 
 class ResourcesBin:
     """
@@ -28,16 +91,59 @@ class ResourcesBin:
         null-terminated path strings
 
       Each file (XOR+gzip, seed = file_offset)
+
+    If cache_dir is given, the directory index and decompressed entries are
+    kept in a persistent ResourceCache so later sessions skip the XOR/zlib work.
+
+    write_files appends changed entries and a new directory to the end of the
+    archive, leaving the old blocks behind as dead space; compact rebuilds the
+    archive without it.
     """
 
-    def __init__(self, bin_path: str):
+    def __init__(self, bin_path: str, cache_dir: str | None = None):
         self.bin_path = bin_path
         self._index: dict[str, tuple[int, int]] = {}  # path -> (offset, size)
-        self._load_directory()
+        self._cache: ResourceCache | None = None
+        self._cache_dir = cache_dir
+
+        self._map_archive()
+        self._load_directory(cache_dir)
+
+    def _map_archive(self) -> None:
+        # One read-only mapping of the whole archive, shared by every read.
+        self._file = open(self.bin_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Not a resources.bin: {self.bin_path} is empty")
+        self._view = memoryview(self._map)
+
+    def close(self) -> None:
+        """Release the archive mapping and file handle."""
+        if self._map.closed:
+            return
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> ResourcesBin:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _load_directory(self, cache_dir: str | None = None):
+        raw_header = bytes(self._view[0:16])
+
+        if cache_dir is not None:
+            fingerprint = archive_fingerprint(self.bin_path, raw_header)
+            self._cache = ResourceCache(cache_dir, self.bin_path, fingerprint)
+            cached_index = self._cache.load_index()
+            if cached_index is not None:
+                self._index = cached_index
+                return
 
-    def _load_directory(self):
-        with open(self.bin_path, 'rb') as f:
-            raw_header = f.read(16)
         header = xor_decrypt(raw_header, 0)
         sig = header[0:4]
         if sig != b'ARC1':
@@ -45,10 +151,7 @@ class ResourcesBin:
         dir_offset = struct.unpack_from('<I', header, 8)[0]
         dir_length = struct.unpack_from('<I', header, 12)[0]
 
-        with open(self.bin_path, 'rb') as f:
-            f.seek(dir_offset)
-            raw_dir = f.read(dir_length)
-        dir_data = decrypt_then_decompress(raw_dir, to_i32(dir_offset))
+        dir_data = self._decode(dir_offset, dir_length)
 
         file_count = struct.unpack_from('<I', dir_data, 0)[0]
         entries = []
@@ -63,37 +166,270 @@ class ResourcesBin:
             path_str = dir_data[path_off:end].decode('utf-8')
             self._index[path_str] = (file_off, file_sz)
 
+        if self._cache is not None:
+            self._cache.store_index(self._index)
+
+    def _decode(self, offset: int, size: int) -> bytes:
+        """Decrypt and decompress a block straight out of the mapping."""
+        return _decode_block(self._view, offset, size)
+
     def file_exists(self, path: str) -> bool:
         return path in self._index
 
     def file_get(self, path: str) -> bytes:
         if path not in self._index:
             raise FileNotFoundError(f"Not in resources.bin: {path}")
-        file_off, file_sz = self._index[path]
-        with open(self.bin_path, 'rb') as f:
-            f.seek(file_off)
-            raw = f.read(file_sz)
-        return decrypt_then_decompress(raw, to_i32(file_off))
+        if self._cache is not None:
+            data = self._cache.get(path)
+            if data is not None:
+                return data
+        data = self._decode(*self._index[path])
+        if self._cache is not None:
+            self._cache.put(path, data)
+        return data
+
+    def read_many(self, paths: list[str]) -> dict[str, bytes]:
+        """
+        Read several entries at once.  Reads are issued in archive order so
+        the mapping is walked sequentially.  Returns {path: data}.
+        """
+        missing = [p for p in paths if p not in self._index]
+        if missing:
+            raise FileNotFoundError(f"Not in resources.bin: {missing[0]}")
+
+        result: dict[str, bytes] = {}
+        for path in sorted(set(paths), key=lambda p: self._index[p][0]):
+            result[path] = self.file_get(path)
+        return result
 
     def list_files(self) -> list[str]:
         return sorted(self._index.keys())
 
+    def entry_span(self, path: str) -> tuple[int, int]:
+        """Return (offset, stored size) of an entry's block in the archive."""
+        return self._index[path]
+
+    @property
+    def dead_bytes(self) -> int:
+        """Bytes of superseded blocks that compact() would reclaim."""
+        header = xor_decrypt(bytes(self._view[0:16]), 0)
+        dir_length = struct.unpack_from('<I', header, 12)[0]
+        live = 16 + dir_length + sum(size for _, size in self._index.values())
+        return len(self._view) - live
+
+    @staticmethod
+    def _pack_directory(index: dict[str, tuple[int, int]]) -> bytes:
+        table = bytearray(struct.pack('<I', len(index)))
+        names = bytearray()
+        names_start = 4 + 12 * len(index)
+        for path, (offset, size) in index.items():
+            table += struct.pack('<III', names_start + len(names), offset, size)
+            names += path.encode('utf-8') + b'\x00'
+        return bytes(table + names)
+
+    @staticmethod
+    def _pack_header(total_length: int, dir_offset: int, dir_length: int) -> bytes:
+        header = b'ARC1' + struct.pack('<III', total_length, dir_offset, dir_length)
+        return xor_decrypt(header, 0)
+
+    def _reopen(self, written: dict[str, bytes]) -> None:
+        """Remap the archive after a write and re-key the cache to it."""
+        self._map_archive()
+        if self._cache is None:
+            return
+        fingerprint = archive_fingerprint(self.bin_path, bytes(self._view[0:16]))
+        self._cache.rekey(fingerprint, self._index, written)
+        for path, data in written.items():
+            self._cache.put(path, data)
+
+    def write_files(self, files: dict[str, bytes]) -> None:
+        """
+        Store new contents for the given paths (new paths are added).
+
+        Only the changed entries and a fresh directory are appended; the
+        header is rewritten last, so an interrupted write leaves the archive
+        pointing at its previous, intact directory, and the in-memory index
+        is only replaced once the header is written.
+        """
+        if not files:
+            return
+        self.close()
+        committed: dict[str, bytes] = {}
+        try:
+            new_index = dict(self._index)
+            with open(self.bin_path, 'r+b') as f:
+                end = f.seek(0, os.SEEK_END)
+                for path, data in files.items():
+                    block = compress_then_encrypt(data, to_i32(end))
+                    f.write(block)
+                    new_index[path] = (end, len(block))
+                    end += len(block)
+
+                dir_offset = end
+                dir_block = compress_then_encrypt(self._pack_directory(new_index),
+                                                  to_i32(dir_offset))
+                f.write(dir_block)
+                end += len(dir_block)
+                f.flush()
+                os.fsync(f.fileno())
+
+                f.seek(0)
+                f.write(self._pack_header(end, dir_offset, len(dir_block)))
+            self._index = new_index
+            committed = files
+        finally:
+            self._reopen(committed)
+
+    def compact(self, dest: str | None = None) -> None:
+        """
+        Rebuild the archive without dead space, in place or into dest.
+
+        Entries are re-keyed for their new offsets without being
+        decompressed, so this costs one XOR pass over the live data.
+        """
+        if dest is not None and os.path.abspath(dest) == os.path.abspath(self.bin_path):
+            dest = None
+        target = self.bin_path if dest is None else dest
+        tmp_path = target + '.tmp'
+        new_index: dict[str, tuple[int, int]] = {}
+        with open(tmp_path, 'wb') as out:
+            out.write(bytes(16))
+            pos = 16
+            for path, (offset, size) in sorted(self._index.items(), key=lambda kv: kv[1][0]):
+                with self._view[offset:offset+size] as raw:
+                    plain = xor_decrypt(raw, to_i32(offset))
+                out.write(xor_decrypt(plain, to_i32(pos)))
+                new_index[path] = (pos, size)
+                pos += size
+
+            # Keep the original directory order.
+            new_index = {path: new_index[path] for path in self._index}
+            dir_block = compress_then_encrypt(self._pack_directory(new_index), to_i32(pos))
+            out.write(dir_block)
+            out.seek(0)
+            out.write(self._pack_header(pos + len(dir_block), pos, len(dir_block)))
+
+        if dest is not None:
+            os.replace(tmp_path, dest)
+            return
+        self.close()
+        try:
+            os.replace(tmp_path, self.bin_path)
+            self._index = new_index
+        finally:
+            self._reopen({})
+
+    def extract_all(self, dest: str, workers: int | None = None,
+                    pattern: str | None = None,
+                    progress: Callable[[int, int], None] | None = None
+                    ) -> tuple[int, int]:
+        """
+        Extract entries into dest as the Game/ + Localize/ tree GameData reads.
+
+        Entries are decoded in a pool of `workers` processes (all CPUs if None,
+        in-process if 1).  pattern is an fnmatch glob over virtual paths.
+        Files that already exist with the expected size are skipped, so an
+        interrupted extraction can be resumed.  progress(done, total) is
+        called after every file.  Returns (extracted, skipped).
+        """
+        dest_root = os.path.abspath(dest)
+        jobs: list[tuple[int, int, str]] = []
+        skipped = 0
+        for vpath, (offset, size) in sorted(self._index.items(), key=lambda kv: kv[1][0]):
+            if pattern is not None and not fnmatch.fnmatchcase(vpath, pattern):
+                continue
+            fs_path = os.path.abspath(os.path.join(dest_root, *vpath.split('/')))
+            if os.path.commonpath([dest_root, fs_path]) != dest_root:
+                raise ValueError(f"Archive path escapes destination: {vpath}")
+            try:
+                if os.path.getsize(fs_path) == _decoded_size(self._view, offset):
+                    skipped += 1
+                    continue
+            except OSError:
+                pass
+            jobs.append((offset, size, fs_path))
+
+        total = len(jobs) + skipped
+        done = skipped
+        if progress is not None:
+            progress(done, total)
+
+        if workers == 1 or len(jobs) <= 1:
+            for offset, size, fs_path in jobs:
+                _write_file(fs_path, self._decode(offset, size))
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        else:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_extract_worker,
+                                     initargs=(self.bin_path,)) as pool:
+                for _ in pool.map(_extract_entry, jobs, chunksize=16):
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+
+        return len(jobs), skipped
+
 class GameData:
     """
     Unified file reader for either a resources.bin archive or an extracted
     directory containing Game/ and Localize/ sub-trees.
+
+    cache_dir opts an archive into the persistent decrypted-entry cache; it is
+    ignored for extracted directories.  Reads are also kept in an in-memory
+    LRU of up to memory_cache_bytes (0 disables it), exposed as read_cache
+    and keyed like the path index, so spellings that name the same file on a
+    case-insensitive filesystem share one entry.
+
+    An extracted directory is walked once at open time, so exists(),
+    list_files() and glob() are set lookups rather than filesystem probes.
+    Files added behind GameData's back are only seen after refresh_index().
     """
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache_dir: str | None = None,
+                 memory_cache_bytes: int = DEFAULT_MEMORY_CACHE_BYTES):
+        self.read_cache = MemoryCache(memory_cache_bytes)
+        # Whether virtual path lookups ignore case, as the directory's
+        # filesystem does.  Archive paths always match exactly.
+        self._ignore_case = False
         if os.path.isfile(path) and path.lower().endswith('.bin'):
-            self._bin = ResourcesBin(path)
+            self._bin = ResourcesBin(path, cache_dir)
             self._dir = None
         elif os.path.isdir(path):
             self._bin = None
             self._dir = path
+            self.refresh_index()
         else:
             raise FileNotFoundError(f"Path not found or not recognised: {path}")
 
+    def _index_key(self, virtual_path: str) -> str:
+        return virtual_path.lower() if self._ignore_case else virtual_path
+
+    def refresh_index(self) -> None:
+        """Re-walk an extracted directory to rebuild the path index."""
+        self._ignore_case = _dir_ignores_case(self._dir, os.listdir(self._dir))
+        # index key -> virtual path as spelled on disk
+        self._files: dict[str, str] = {}
+        self._dirs: set[str] = set()
+        stack = [('', self._dir)]
+        while stack:
+            vprefix, fs_dir = stack.pop()
+            with os.scandir(fs_dir) as it:
+                for entry in it:
+                    vpath = f"{vprefix}/{entry.name}" if vprefix else entry.name
+                    if entry.is_dir():
+                        self._dirs.add(self._index_key(vpath))
+                        stack.append((vpath, entry.path))
+                    elif not entry.name.endswith('.tmp'):
+                        self._files[self._index_key(vpath)] = vpath
+
+    def _index_add(self, virtual_path: str) -> None:
+        self._files[self._index_key(virtual_path)] = virtual_path
+        parts = virtual_path.split('/')
+        for i in range(1, len(parts)):
+            self._dirs.add(self._index_key('/'.join(parts[:i])))
+
     @property
     def is_archive(self) -> bool:
         return self._bin is not None
@@ -106,28 +442,121 @@ class GameData:
     def read(self, virtual_path: str) -> bytes:
         """Read a file by its virtual path (forward slashes normalised)."""
         virtual_path = virtual_path.replace('\\', '/')
+        key = self._index_key(virtual_path)
+        data = self.read_cache.get(key)
+        if data is None:
+            data = self._read_uncached(virtual_path)
+            self.read_cache.put(key, data)
+        return data
+
+    def _read_uncached(self, virtual_path: str) -> bytes:
         if self._bin is not None:
             return self._bin.file_get(virtual_path)
+        # Open the file as spelled on disk.
+        virtual_path = self._files.get(self._index_key(virtual_path), virtual_path)
         fs_path = os.path.join(self._dir, *virtual_path.split('/'))
         with open(fs_path, 'rb') as f:
             return f.read()
 
+    def read_many(self, virtual_paths: list[str]) -> dict[str, bytes]:
+        """Read several files at once.  Returns {virtual_path: data}."""
+        normalised = {vp: vp.replace('\\', '/') for vp in virtual_paths}
+        found: dict[str, bytes] = {}
+        missing: list[str] = []
+        for norm in dict.fromkeys(normalised.values()):
+            data = self.read_cache.get(self._index_key(norm))
+            if data is None:
+                missing.append(norm)
+            else:
+                found[norm] = data
+
+        if self._bin is not None:
+            loaded = self._bin.read_many(missing)
+        else:
+            loaded = {norm: self._read_uncached(norm) for norm in missing}
+        for norm, data in loaded.items():
+            self.read_cache.put(self._index_key(norm), data)
+        found.update(loaded)
+        return {vp: found[norm] for vp, norm in normalised.items()}
+
+    @property
+    def archive_path(self) -> str | None:
+        """The resources.bin path, or None if backed by a directory."""
+        return self._bin.bin_path if self._bin is not None else None
+
+    def compact(self, dest: str | None = None) -> None:
+        """Rebuild the archive without dead space, in place or into dest."""
+        if self._bin is None:
+            raise RuntimeError("compact() is only supported for resources.bin archives.")
+        self._bin.compact(dest)
+
+    def close(self) -> None:
+        if self._bin is not None:
+            self._bin.close()
+
     def exists(self, virtual_path: str) -> bool:
         virtual_path = virtual_path.replace('\\', '/')
         if self._bin is not None:
             return self._bin.file_exists(virtual_path)
-        fs_path = os.path.join(self._dir, *virtual_path.split('/'))
-        return os.path.exists(fs_path)
+        key = self._index_key(virtual_path.strip('/'))
+        return key in self._files or key in self._dirs
+
+    def list_files(self, prefix: str = '') -> list[str]:
+        """Sorted virtual paths of every file under a directory prefix."""
+        prefix = prefix.replace('\\', '/').strip('/')
+        if self._bin is not None:
+            paths = self._bin.list_files()
+        else:
+            paths = sorted(self._files.values())
+        if not prefix:
+            return paths
+        key = self._index_key(prefix + '/')
+        return [p for p in paths if self._index_key(p).startswith(key)]
+
+    def fingerprint(self, prefix: str) -> str:
+        """
+        Hash identifying the current version of every file under prefix:
+        archive offsets and sizes, or on-disk sizes and mtimes.
+        """
+        hasher = hashlib.sha1()
+        for vpath in self.list_files(prefix):
+            if self._bin is not None:
+                offset, size = self._bin.entry_span(vpath)
+                stamp = f"{offset}:{size}"
+            else:
+                st = os.stat(os.path.join(self._dir, *vpath.split('/')))
+                stamp = f"{st.st_size}:{st.st_mtime_ns}"
+            hasher.update(f"{vpath}:{stamp}\n".encode('utf-8'))
+        return hasher.hexdigest()
+
+    def glob(self, pattern: str) -> list[str]:
+        """Sorted virtual paths matching an fnmatch pattern, e.g. 'Game/field/atel/*.dat'."""
+        pattern = self._index_key(pattern.replace('\\', '/'))
+        return [p for p in self.list_files()
+                if fnmatch.fnmatchcase(self._index_key(p), pattern)]
 
     def write(self, virtual_path: str, data: bytes) -> None:
-        """Write data to a file by its virtual path. Only supported for directory-backed instances."""
+        """
+        Write data to a file by its virtual path.  Archives are updated in
+        place by appending the new entry (see ResourcesBin.write_files).
+        """
+        self.write_many({virtual_path: data})
+
+    def write_many(self, files: dict[str, bytes]) -> None:
+        """
+        Write several files at once.  Each file is replaced atomically; an
+        archive gets a single append and directory rewrite for the batch.
+        """
+        files = {vp.replace('\\', '/'): data for vp, data in files.items()}
+        for virtual_path in files:
+            self.read_cache.invalidate(self._index_key(virtual_path))
         if self._bin is not None:
-            raise RuntimeError("Cannot write to a resources.bin archive.")
-        virtual_path = virtual_path.replace('\\', '/')
-        fs_path = os.path.join(self._dir, *virtual_path.split('/'))
-        os.makedirs(os.path.dirname(fs_path), exist_ok=True)
-        with open(fs_path, 'wb') as f:
-            f.write(data)
+            self._bin.write_files(files)
+            return
+        for virtual_path, data in files.items():
+            _write_file(os.path.join(self._dir, *virtual_path.split('/')), data)
+            if self._index_key(virtual_path) not in self._files:
+                self._index_add(virtual_path)
 
 # Mapinfo u16 field offsets (each field is 2 bytes):
 #   0: music_index, 2: tileset_l12, 4: tileset_l12_assembly, 6: tileset_l3,
@@ -224,3 +653,27 @@ def load_string_table(gd: GameData, msg_prefix: str, table_index: int) -> list[s
         else:
             strings.append(line)
     return strings
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Extract a Steam resources.bin into a Game/ + Localize/ directory.')
+    parser.add_argument('archive', help='path to resources.bin')
+    parser.add_argument('dest', help='destination directory')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: all CPUs)')
+    parser.add_argument('-g', '--glob', default=None,
+                        help="only extract virtual paths matching this glob, e.g. 'Game/field/*'")
+    args = parser.parse_args(argv)
+
+    def report(done: int, total: int) -> None:
+        print(f"\rExtracting {done}/{total}", end='', flush=True)
+
+    with ResourcesBin(args.archive) as rb:
+        extracted, skipped = rb.extract_all(args.dest, args.workers, args.glob, report)
+    print(f"\nExtracted {extracted} files, skipped {skipped} already present.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
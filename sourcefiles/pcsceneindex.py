@@ -0,0 +1,132 @@
+"""
+Persistent index of PC scene headers.
+
+Building the scene list means reading every mapinfo_N.dat header.  The
+result is saved as a small binary sidecar keyed by a fingerprint of the
+Mapinfo files, so later launches load it in one read.
+
+Sidecar format (little endian):
+  Header:
+    [0..4]   "TRSI" signature
+    [4..6]   u16  format version
+    [6..26]  sha1 fingerprint of the Mapinfo files
+    [26..30] u32  record count
+  Records (12 bytes each):
+    u16 scene_index, u16 script_index, u16 map_index, u16 music_index,
+    u8 scroll_left, u8 scroll_top, u8 scroll_right, u8 scroll_bottom
+"""
+from __future__ import annotations
+
+import os
+import struct
+from dataclasses import dataclass
+
+from pcgamedata import GameData, _MAP_INDEX_OFFSET, _SCRIPT_INDEX_OFFSET
+
+MAPINFO_DIR = "Game/field/Mapinfo"
+
+_SIGNATURE = b'TRSI'
+_VERSION = 1
+_HEADER = struct.Struct('<4sH20sI')
+_RECORD = struct.Struct('<HHHHBBBB')
+
+
+@dataclass(frozen=True)
+class SceneInfo:
+    scene_index: int
+    script_index: int
+    map_index: int
+    music_index: int
+    scroll_left: int = 0
+    scroll_top: int = 0
+    scroll_right: int = 0
+    scroll_bottom: int = 0
+
+
+def parse_mapinfo(scene_index: int, raw: bytes) -> SceneInfo | None:
+    """Decode a mapinfo header, or None if it is too short to hold a script index."""
+    if len(raw) < 18:
+        return None
+    scroll = tuple(raw[20:24]) if len(raw) >= 24 else (0, 0, 0, 0)
+    return SceneInfo(
+        scene_index,
+        struct.unpack_from('<H', raw, _SCRIPT_INDEX_OFFSET)[0],
+        struct.unpack_from('<H', raw, _MAP_INDEX_OFFSET)[0],
+        struct.unpack_from('<H', raw, 0)[0],
+        *scroll,
+    )
+
+
+def build_scene_index(gd: GameData, max_probe: int, miss_limit: int) -> dict[int, SceneInfo]:
+    """
+    Read mapinfo headers for scenes 0..max_probe-1, stopping after
+    miss_limit consecutive missing files.  Unreadable headers are skipped.
+    """
+    found: list[tuple[int, str]] = []
+    consecutive_misses = 0
+    for scene_index in range(max_probe):
+        vpath = f"{MAPINFO_DIR}/mapinfo_{scene_index}.dat"
+        if not gd.exists(vpath):
+            consecutive_misses += 1
+            if consecutive_misses >= miss_limit:
+                break
+            continue
+
+        consecutive_misses = 0
+        found.append((scene_index, vpath))
+
+    # Read every header in one pass so archive reads stay sequential.
+    try:
+        headers = gd.read_many([vpath for _, vpath in found])
+    except Exception:
+        headers = {}
+
+    scenes: dict[int, SceneInfo] = {}
+    for scene_index, vpath in found:
+        try:
+            raw = headers[vpath] if vpath in headers else gd.read(vpath)
+            info = parse_mapinfo(scene_index, raw)
+        except Exception:
+            continue
+        if info is not None:
+            scenes[scene_index] = info
+    return scenes
+
+
+def load_scene_index(path: str, fingerprint: str) -> dict[int, SceneInfo] | None:
+    """Load a sidecar, or return None if it is missing, corrupt or stale."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    sig, version, digest, count = _HEADER.unpack_from(data, 0)
+    if sig != _SIGNATURE or version != _VERSION or digest != bytes.fromhex(fingerprint):
+        return None
+    if len(data) != _HEADER.size + count * _RECORD.size:
+        return None
+
+    scenes: dict[int, SceneInfo] = {}
+    for fields in _RECORD.iter_unpack(data[_HEADER.size:]):
+        scenes[fields[0]] = SceneInfo(*fields)
+    return scenes
+
+
+def save_scene_index(path: str, fingerprint: str, scenes: dict[int, SceneInfo]) -> bool:
+    """Write a sidecar atomically.  Returns False if it could not be written."""
+    data = bytearray(_HEADER.pack(_SIGNATURE, _VERSION, bytes.fromhex(fingerprint), len(scenes)))
+    for info in scenes.values():
+        data += _RECORD.pack(info.scene_index, info.script_index, info.map_index,
+                             info.music_index, info.scroll_left, info.scroll_top,
+                             info.scroll_right, info.scroll_bottom)
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        return False
+    return True
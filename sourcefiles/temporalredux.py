@@ -266,7 +266,9 @@ class EventViewer(QMainWindow):
             print("Save cancelled")
             return
         location_id = self.location_selector.currentData()
-        self.state.backend.write_script(location_id)
+        written = self.state.backend.write_dirty_scripts()
+        print(f"Wrote {len(written)} edited script(s): "
+              + ", ".join(f"{loc_id:03X}" for loc_id in written))
         self.model.change_location(location_id)
         self.tree.expandAll()
         self.state.backend.save_to_file(self.state.file)
@@ -295,10 +297,11 @@ class EventViewer(QMainWindow):
                 print("Save cancelled")
                 return
             location_id = self.location_selector.currentData()
-            self.state.backend.write_script(location_id)
+            written = self.state.backend.save_as(Path(dest))
+            print(f"Wrote {len(written)} edited script(s): "
+                  + ", ".join(f"{loc_id:03X}" for loc_id in written))
             self.model.change_location(location_id)
             self.tree.expandAll()
-            self.state.backend.save_to_file(Path(dest))
             self._log.log_file_save(dest)
 
     def on_copy(self):
@@ -774,7 +777,7 @@ class EventViewer(QMainWindow):
             str(item.command),
             item.command.desc,
             str(item.command.args),
-            str(item.command.arg_descs)
+            str(list(item.command.arg_descs))
         ]
         self.command_label.setText('\n'.join(command_info))
         
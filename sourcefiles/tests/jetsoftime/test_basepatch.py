@@ -0,0 +1,39 @@
+"""Tests for table placement in the base patches."""
+import pytest
+
+from jetsoftime.base.basepatch import apply_mauron_player_tech_patch
+from jetsoftime.ctrom import CTRom
+from jetsoftime.freespace import FSWriteType
+
+_FREE = (0x3E0000, 0x3E1000)
+
+
+def _build_ct_rom():
+    ct_rom = CTRom(bytes(0x400000), ignore_checksum=True)
+    ct_rom.rom_data.space_manager.mark_block(_FREE, FSWriteType.MARK_FREE)
+    return ct_rom
+
+
+def _table_addrs(ct_rom):
+    # The patch loads each table with an LDA long at a fixed offset.
+    rom = ct_rom.rom_data.getbuffer()
+    local_ptr = int.from_bytes(rom[0x014619:0x01461C], 'little') - 0xC00000
+    bank_table = int.from_bytes(rom[0x014620:0x014623], 'little') - 0xC00000
+    return local_ptr, bank_table
+
+
+@pytest.mark.parametrize("given", ['local_ptr_addr', 'bank_table_addr', None])
+def test_player_tech_tables_do_not_overlap(given):
+    ct_rom = _build_ct_rom()
+    kwargs = {} if given is None else {given: _FREE[0]}
+    apply_mauron_player_tech_patch(ct_rom, **kwargs)
+
+    local_ptr, bank_table = _table_addrs(ct_rom)
+    if given == 'local_ptr_addr':
+        assert local_ptr == _FREE[0]
+    elif given == 'bank_table_addr':
+        assert bank_table == _FREE[0]
+    assert local_ptr + 0x200 <= bank_table or bank_table + 0x100 <= local_ptr
+    space = ct_rom.rom_data.space_manager
+    assert space.is_range_used(local_ptr, local_ptr + 0x200)
+    assert space.is_range_used(bank_table, bank_table + 0x100)
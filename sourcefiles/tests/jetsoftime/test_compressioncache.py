@@ -0,0 +1,136 @@
+"""Tests for the compressed script cache and ScriptManager's use of it."""
+from jetsoftime.compressioncache import CompressionCache
+from jetsoftime.ctdecompress import FAST_CHAIN_DEPTH, decompress
+from jetsoftime.ctevent import ScriptManager, get_loc_event_ptr
+from jetsoftime.freespace import FSRom, FSWriteType
+
+_SCRIPT_ADDR = 0x3D0000
+_FREE_BLOCK = (0x3E0000, 0x3F0000)
+
+
+def _script_bytes(fill=0x00):
+    # One object whose functions are all a single return.
+    ptrs = (32).to_bytes(2, 'little') * 16
+    return bytes([1]) + ptrs + bytes([0xAD, fill, 0x00])
+
+
+def _make_rom(cache=None):
+    rom = bytearray(0x400000)
+    # Location 0 uses event pointer 0, which points at _SCRIPT_ADDR.
+    rom[0x3CF9F0:0x3CF9F3] = (0xC00000 + _SCRIPT_ADDR).to_bytes(3, 'little')
+    packet = CompressionCache().compress(_script_bytes())
+    rom[_SCRIPT_ADDR:_SCRIPT_ADDR+len(packet)] = packet
+    fsrom = FSRom(bytes(rom), False)
+    fsrom.space_manager.mark_block(_FREE_BLOCK, FSWriteType.MARK_FREE)
+    return fsrom, ScriptManager(fsrom, [], compression_cache=cache)
+
+
+def test_cache_hits_on_same_bytes():
+    cache = CompressionCache()
+    first = cache.compress(_script_bytes())
+    assert cache.compress(bytearray(_script_bytes())) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.compress(_script_bytes(), max_compression=True)
+    assert cache.misses == 2
+
+
+def test_cache_round_trips_through_file(tmp_path):
+    path = str(tmp_path / 'scripts.cache')
+    cache = CompressionCache()
+    packet = cache.compress(_script_bytes(1))
+    assert cache.save(path)
+
+    loaded = CompressionCache(path)
+    assert len(loaded) == 1
+    assert loaded.compress(_script_bytes(1)) == packet
+    assert loaded.hits == 1
+
+
+def test_chain_depth_is_part_of_key(tmp_path):
+    cache = CompressionCache()
+    cache.compress(_script_bytes())
+    fast = cache.compress(_script_bytes(), chain_depth=FAST_CHAIN_DEPTH)
+    assert cache.misses == 2
+    assert decompress(fast, 0) == _script_bytes()
+
+    # Only full-search results are saved.
+    path = str(tmp_path / 'scripts.cache')
+    assert cache.save(path)
+    assert len(CompressionCache(path)) == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CompressionCache()
+    sizes = [len(cache.compress(_script_bytes(fill))) for fill in range(3)]
+    cache = CompressionCache(max_bytes=sizes[0] + sizes[1])
+    cache.compress(_script_bytes(0))
+    cache.compress(_script_bytes(1))
+    cache.compress(_script_bytes(0))  # 1 is now least recently used
+    cache.compress(_script_bytes(2))
+
+    assert len(cache) == 2
+    assert cache.total_bytes <= cache.max_bytes
+    cache.compress(_script_bytes(0))
+    assert cache.hits == 2
+    cache.compress(_script_bytes(1))
+    assert cache.misses == 4
+
+
+def test_save_keeps_only_entries_used_this_session(tmp_path):
+    path = str(tmp_path / 'scripts.cache')
+    cache = CompressionCache()
+    for fill in range(3):
+        cache.compress(_script_bytes(fill))
+    assert cache.save(path)
+
+    # Script 1 is gone from the rom, so the next session never asks for it.
+    session = CompressionCache(path)
+    assert len(session) == 3
+    session.compress(_script_bytes(0))
+    session.compress(_script_bytes(2))
+    session.compress(_script_bytes(3))
+    assert session.save()
+
+    reloaded = CompressionCache(path)
+    assert len(reloaded) == 3
+    reloaded.compress(_script_bytes(1))
+    assert reloaded.misses == 1
+
+
+def test_cache_ignores_bad_file(tmp_path):
+    path = tmp_path / 'scripts.cache'
+    path.write_bytes(b'TRCC\x01\x00\x05\x00\x00\x00short')
+    cache = CompressionCache(str(path))
+    assert len(cache) == 0
+
+
+def test_unchanged_script_is_not_rewritten():
+    cache = CompressionCache()
+    fsrom, manager = _make_rom(cache)
+    manager.get_script(0)
+    before = bytes(fsrom.getbuffer())
+
+    manager.write_script_to_rom(0)
+
+    assert bytes(fsrom.getbuffer()) == before
+    assert cache.misses == 0
+
+
+def test_edited_script_is_written_once():
+    cache = CompressionCache()
+    fsrom, manager = _make_rom(cache)
+    script = manager.get_script(0)
+    # Direct edits to data have to flag the script themselves.
+    script.data[-2] = 0x05
+    script.dirty = True
+
+    manager.write_script_to_rom(0)
+    ptr = get_loc_event_ptr(fsrom.getbuffer(), 0)
+    assert decompress(fsrom.getbuffer(), ptr) == _script_bytes(0x05)
+    assert cache.misses == 1
+
+    # Now the rom holds the edited script, so a second save is a no-op.
+    after = bytes(fsrom.getbuffer())
+    manager.write_script_to_rom(0)
+    assert bytes(fsrom.getbuffer()) == after
+    assert cache.misses == 1
@@ -0,0 +1,557 @@
+"""Tests for the LZ decompressor."""
+import random
+
+import pytest
+
+from jetsoftime.byteops import get_value_from_bytes, to_little_endian
+from jetsoftime.ctdecompress import (
+    FAST_CHAIN_DEPTH,
+    DecompressionError,
+    compress,
+    compress_py_hc,
+    compress_py_max,
+    decompress,
+    decompress_into,
+)
+
+
+def _decompress_py(rom, start):
+    '''The original decompressor, kept as the reference for decompress.'''
+    out_buffer = bytearray([0 for i in range(0, 0x10000)])
+
+    # First two bytes are little endian size of compressed packet
+    main_len = get_value_from_bytes(rom[start:start+2])
+
+    # print(f"Start position: {start:06X}")
+    # print(f"Main body length: {main_len:04X}")
+    # print(f"Max compr length: {len(rom[start:]):04X}")
+
+    out_pos = 0
+    src_pos = start+2
+
+    add_byte = src_pos + main_len
+
+    if rom[add_byte] & 0xC0 != 0:
+        smallwidth = True
+    else:
+        smallwidth = False
+
+    end_pos = add_byte
+
+    while True:
+        # First check if we've passed the main body
+        if src_pos == end_pos:
+            # print(f"End pos: {end_pos:06X}")
+            # print(f"Addendum byte: {rom[src_pos]:02X}")
+            if rom[src_pos] & 0x3F == 0:
+                # No addendum
+                # print(f"Compressed Size: {end_pos-start:04X}")
+                return out_buffer[0:out_pos]
+            else:
+                # Addendum, new end in next two bytes
+                end_pos = \
+                    start + get_value_from_bytes(rom[src_pos+1:src_pos+3])
+                # print(' '.join(f"{x:02X}"
+                #                for x in rom[src_pos+1:src_pos+3]))
+                # print(f"Addendum found, new end pos = {end_pos:04X}")
+                src_pos += 3  # Get to the byte after the new end byte
+
+        # print(f"[{out_pos:04X}] Getting new packet.")
+        header = rom[src_pos]
+        src_pos += 1
+        # input()
+
+        for i in range(8):
+            if src_pos == end_pos:
+                # ran out of data mid packet (in addendum)
+                break
+            elif header & (1 << i) == 0:
+                # Uncompressed, copy next byte
+                out_buffer[out_pos] = rom[src_pos]
+                out_pos += 1
+                src_pos += 1
+            else:
+                # Compressed, determine copy size and offset
+
+                copy_size = rom[src_pos+1]
+                copy_off = get_value_from_bytes(rom[src_pos:src_pos+2])
+
+                if smallwidth:
+                    copy_size >>= 3
+                    copy_off &= 0x07FF
+                else:
+                    copy_size >>= 4
+                    copy_off &= 0x0FFF
+
+                copy_size += 3
+                for j in range(0, copy_size):
+                    try:
+                        out_buffer[out_pos + j] = \
+                            out_buffer[out_pos - copy_off + j]
+                    except IndexError:
+
+                        # print(out_pos + j)
+                        exit()
+
+                out_pos += copy_size
+                src_pos += 2
+
+
+# Modification of Michael Springer's code to fit my applications
+# This is a greedy algorithm. On occassion it will be a byte (or two?) larger
+# than the original game's compression.  This happens when you almost fill up
+# the addendum packet but then have to add another 2 bytes for the compressed
+# length prior to the addendum.
+def _compress_py(source):
+
+    # We have to try compressing in two configurations and then return the
+    # better of the two.
+    compressed_data = [bytearray([0 for i in range(0x10000)])
+                       for j in range(2)]
+
+    best_size = 0x10000
+
+    for i in range(2):
+        # i=0: use 0x07FF for the range, 0xF800 for the max copy length
+        # i=1: use 0x0FFF for the range, 0xF000 for the max copy length
+        lookback_range = 0x07FF | (i << 11)
+
+        # max_copy_length = 0xFFFF ^ lookback_range (bits used)
+        max_copy_length = (0xFFFF ^ lookback_range) >> (16-(5-i))
+        max_copy_length += 3
+
+        # print(f'Iteration: i={i}')
+        # print(f'{lookback_range:04X} {max_copy_length:04X}')
+        src_pos = 0
+
+        # First two bytes are main body length
+        # Next byte will be the first packet's header
+        out_pos = 2
+
+        done = False
+
+        # print('i =', i)
+
+        while out_pos < best_size and not done:
+            # Fill up a compressed packet
+            header_pos = out_pos
+            out_pos += 1
+
+            # print(f'out_pos: {out_pos:04X}')
+
+            for bit in range(8):
+
+                # While filling a packet we ran out of source.
+                if src_pos == len(source):
+                    if bit == 0:
+                        # If bit == 0, then we ran out after filling a packet.
+                        # This means no addendum.
+                        compressed_data[i][header_pos] = 0xC0*(1-i)
+
+                        # Truncate to used size
+                        compressed_data[i] = compressed_data[i][0:header_pos+1]
+                    else:
+                        # Otherwise, we're mid-packet.  The packet becomes
+                        # the addendum.
+                        # print("Addendum.")
+
+                        # set unused bits of header for addendum header
+                        mask = (0xFF << bit) & 0xFF
+                        compressed_data[i][header_pos] |= mask
+
+                        # shift the addendum packet down three bytes
+                        compressed_data[i][header_pos+3:out_pos+3] = \
+                            compressed_data[i][header_pos:out_pos]
+
+                        # copy range + addendum length
+                        compressed_data[i][header_pos] = \
+                            0xC0*(1-i) | bit
+
+                        # total compressed length (remember shift by 3)
+                        compressed_data[i][header_pos+1:header_pos+3] = \
+                            to_little_endian(out_pos+3, 2)
+
+                        # Truncate to used size
+                        compressed_data[i][out_pos+3] = 0xC0*(1-i)
+                        compressed_data[i] = compressed_data[i][0:out_pos+4]
+
+                    # print(f"Main body len: {header_pos-2:04X}")
+                    compressed_data[i][0:2] = \
+                        to_little_endian(header_pos-2, 2)
+
+                    done = True
+                    break
+
+                lookback_st = max(0, src_pos - lookback_range)
+                lookback_end = src_pos
+
+                best_len = 0
+                best_len_st = 0
+
+                # Weird python stuff to avoid too many loops
+                # I hope we can do better than this.
+
+                # Use list comprehension to find potential starts
+                starts = [x for x in range(lookback_st, lookback_end)
+                          if source[x] == source[src_pos]]
+
+                # Refine the list of starts by matching the next bytes up
+                # to max copy length
+                for j in range(1, max_copy_length):
+                    next_starts = \
+                        [x for x in starts
+                         if (src_pos + j < len(source)
+                             and source[x+j] == source[src_pos+j])]
+
+                    if not next_starts:  # 'pythonic' way to check empty
+                        break
+                    else:
+                        starts = next_starts
+                        best_len_st = starts[0]
+                        best_len = j+1
+
+                '''
+                # This is how it would go in a C program and in Geiger's orig
+
+                best_len = 0
+                for start in range(lookback_st, lookback_end):
+                # for start in starts:
+
+                    # Match the source starting at 'start' with the source
+                    # starting at 'src_pos'
+                    cur_len = 0
+
+                    while (src_pos + cur_len < len(source) and
+                           cur_len < max_copy_length and
+                           source[start+cur_len] == source[src_pos+cur_len]):
+                        cur_len += 1
+
+                    # Update best match if needed
+                    if cur_len >= best_len:
+                        best_len = cur_len
+                        best_len_st = start
+                        if cur_len == max_copy_length:
+                            break
+
+                '''
+
+                if best_len > 2:
+                    # print(f'Best len: {best_len:02X}')
+                    # We matched at least 3 bytes, so we'll use compression
+
+                    # Mark the header to use compression for this bit
+                    compressed_data[i][header_pos] |= (1 << bit)
+
+                    lookback = src_pos - best_len_st
+                    # print(f"\tlookback: {lookback:04X}")
+
+                    # length is encoded with a -3 because there are always at
+                    # least 3 bytes to copy.  The length is shifted to the most
+                    # significant bits.  The shift depends on i.
+                    length = ((best_len-3) << (16-(5-i)))
+
+                    compr_stream = lookback | length
+
+                    compressed_data[i][out_pos:out_pos+2] = \
+                        to_little_endian(compr_stream, 2)
+
+                    out_pos += 2
+                    src_pos += best_len
+                else:
+                    # We failed to match 3 or more bytes, so just copy a byte
+                    compressed_data[i][out_pos] = source[src_pos]
+                    out_pos += 1
+                    src_pos += 1
+            # End of for loop to fill packet
+            # print(f'Header: {compressed_data[i][header_pos]:02X}')
+        # End of while not done loop
+
+        if len(compressed_data[i]) < best_size:
+            best_size = len(compressed_data[i])
+
+    if len(compressed_data[0]) <= len(compressed_data[1]):
+        return compressed_data[0]
+    else:
+        return compressed_data[1]
+
+
+def _find_match_len(data: bytes, pos_1: int, pos_2: int,
+                    max_match: int):
+
+    match_len = 0
+    while data[pos_1+match_len] == data[pos_2+match_len]:
+        match_len += 1
+
+        if match_len == max_match:
+            break
+
+        if (pos_1 + match_len == len(data)) or \
+           (pos_2 + match_len == len(data)):
+            break
+
+    return match_len
+
+
+# Modification of _compress_py which precomputes starting indices of every byte.
+# This was suggested by Atmatek on
+# https://www.ff6hacking.com/forums/thread-4085.html.
+def _compress_py_2(source: bytes) -> bytearray:
+    # We have to try compressing in two configurations and then return the
+    # better of the two.
+    compressed_data = [bytearray([0 for i in range(0x10000)])
+                       for j in range(2)]
+
+    best_size = 0x10000
+
+    byte_starts: list[list[int]] = [[] for ind in range(0x100)]
+    for ind, byte in enumerate(source):
+        byte_starts[byte].append(ind)
+
+    byte_ptrs = [0 for ind in range(0x100)]
+
+    # We're only going to use the i=0 version because it's almost always a
+    # smaller file.
+    for i in range(1):
+        # i=0: use 0x07FF for the range, 0xF800 for the max copy length
+        # i=1: use 0x0FFF for the range, 0xF000 for the max copy length
+        lookback_range = 0x07FF | (i << 11)
+
+        # max_copy_length = 0xFFFF ^ lookback_range (bits used)
+        max_copy_length = (0xFFFF ^ lookback_range) >> (16-(5-i))
+        max_copy_length += 3
+        src_pos = 0
+
+        # First two bytes are main body length
+        # Next byte will be the first packet's header
+        out_pos = 2
+
+        done = False
+        while not done:
+            # Fill up a compressed packet
+            header_pos = out_pos
+            out_pos += 1
+
+            for bit in range(8):
+                # While filling a packet we ran out of source.
+                if src_pos == len(source):
+                    if bit == 0:
+                        # If bit == 0, then we ran out after filling a packet.
+                        # This means no addendum.
+                        compressed_data[i][header_pos] = 0xC0*(1-i)
+
+                        # Truncate to used size
+                        compressed_data[i] = compressed_data[i][0:header_pos+1]
+                    else:
+                        # Otherwise, we're mid-packet.  The packet becomes
+                        # the addendum.
+                        # print("Addendum.")
+
+                        # set unused bits of header for addendum header
+                        mask = (0xFF << bit) & 0xFF
+                        compressed_data[i][header_pos] |= mask
+
+                        # shift the addendum packet down three bytes
+                        compressed_data[i][header_pos+3:out_pos+3] = \
+                            compressed_data[i][header_pos:out_pos]
+
+                        # copy range + addendum length
+                        compressed_data[i][header_pos] = \
+                            0xC0*(1-i) | bit
+
+                        # total compressed length (remember shift by 3)
+                        compressed_data[i][header_pos+1:header_pos+3] = \
+                            int.to_bytes(out_pos+3, 2, 'little')
+
+                        # Truncate to used size
+                        compressed_data[i][out_pos+3] = 0xC0*(1-i)
+                        compressed_data[i] = compressed_data[i][0:out_pos+4]
+
+                    # print(f"Main body len: {header_pos-2:04X}")
+                    compressed_data[i][0:2] =\
+                        int.to_bytes(header_pos-2, 2, 'little')
+
+                    done = True
+                    break
+
+                lookback_st = max(0, src_pos - lookback_range)
+                lookback_end = src_pos
+
+                best_len = 0
+                best_len_st = 0
+
+                src_val = source[src_pos]
+                while byte_starts[src_val][byte_ptrs[src_val]] < lookback_st:
+                    byte_ptrs[src_val] += 1
+
+                ptr = byte_ptrs[src_val]
+                while byte_starts[src_val][ptr] < src_pos:
+                    match_len = _find_match_len(
+                        source,
+                        byte_starts[src_val][ptr],
+                        src_pos,
+                        max_copy_length
+                    )
+
+                    if match_len > best_len:
+                        best_len = match_len
+                        best_len_st = byte_starts[src_val][ptr]
+
+                    ptr += 1
+
+                if best_len > 2:
+                    # print(f'Best len: {best_len:02X}')
+                    # We matched at least 3 bytes, so we'll use compression
+
+                    # Mark the header to use compression for this bit
+                    compressed_data[i][header_pos] |= (1 << bit)
+
+                    lookback = src_pos - best_len_st
+                    # print(f"\tlookback: {lookback:04X}")
+
+                    # length is encoded with a -3 because there are always at
+                    # least 3 bytes to copy.  The length is shifted to the most
+                    # significant bits.  The shift depends on i.
+                    length = ((best_len-3) << (16-(5-i)))
+
+                    compr_stream = lookback | length
+
+                    compressed_data[i][out_pos:out_pos+2] = \
+                        int.to_bytes(compr_stream, 2, 'little')
+
+                    out_pos += 2
+                    src_pos += best_len
+                else:
+                    # We failed to match 3 or more bytes, so just copy a byte
+                    compressed_data[i][out_pos] = source[src_pos]
+                    out_pos += 1
+                    src_pos += 1
+            # End of for loop to fill packet
+            # print(f'Header: {compressed_data[i][header_pos]:02X}')
+        # End of while not done loop
+
+        if len(compressed_data[i]) < best_size:
+            best_size = len(compressed_data[i])
+            best_ind = i
+        else:
+            best_ind = 0
+
+    # Test code for comparing performance of the two window schemes
+    # if len(compressed_data[0]) < len(compressed_data[1]):
+    #     min_len = len(compressed_data[0])
+    #     max_len = len(compressed_data[1])
+    #     best = "0"
+    # elif len(compressed_data[1]) < len(compressed_data[0]):
+    #     min_len = len(compressed_data[1])
+    #     max_len = len(compressed_data[0])
+    #     best = "1"
+    # else:
+    #     min_len = 1
+    #     max_len = 1
+    #     best = "Tie"
+
+    # print(max_len/min_len, 'Best:', best)
+
+    # if len(compressed_data[0]) <= len(compressed_data[1]):
+    #     return compressed_data[0]
+    # else:
+    #     return compressed_data[1]
+
+    return compressed_data[0]
+
+
+def _script_like(rng, length):
+    # Repeated short phrases plus some runs, like event script bytecode.
+    words = [bytes(rng.getrandbits(rng.choice([1, 2, 8]))
+                   for _ in range(rng.randint(1, 8)))
+             for _ in range(rng.randint(1, 50))]
+    out = bytearray()
+    while len(out) < length:
+        out += rng.choice(words) if rng.random() < 0.95 \
+            else bytes(rng.randint(3, 60))
+    return bytes(out[:length])
+
+
+def _random_packet(rng, num_packets, small_width):
+    body = bytearray()
+    for _ in range(num_packets):
+        header = rng.getrandbits(8) if rng.random() < 0.8 else 0
+        body.append(header)
+        for bit in range(8):
+            if header & (1 << bit):
+                # Random offsets, including ones before the output start
+                # and zero-offset copies.
+                body += bytes([rng.getrandbits(8), rng.getrandbits(8)])
+            else:
+                body.append(rng.getrandbits(8))
+    addendum = 0xC0 if small_width else 0x00
+    return len(body).to_bytes(2, 'little') + body + bytes([addendum])
+
+
+@pytest.mark.parametrize("small_width", [True, False])
+@pytest.mark.parametrize("seed", range(30))
+def test_decompress_matches_reference(seed, small_width):
+    rng = random.Random(seed)
+    packet = _random_packet(rng, rng.randint(0, 60), small_width)
+    # Put the packet somewhere other than the start of the "rom".
+    rom = bytes(rng.getrandbits(8) for _ in range(17)) + packet
+    assert decompress(rom, 17) == _decompress_py(rom, 17)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_round_trip_with_addendum(seed):
+    rng = random.Random(seed)
+    words = [bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 6)))
+             for _ in range(20)]
+    source = b''.join(rng.choice(words) for _ in range(rng.randint(1, 400)))
+    packet = _compress_py_2(source)
+    assert decompress(packet, 0) == source
+    assert _decompress_py(packet, 0) == source
+
+
+def test_decompress_into_reuses_buffer():
+    rng = random.Random(5)
+    buf = bytearray(b'\xFF' * 0x10000)
+    for _ in range(5):
+        packet = _random_packet(rng, 40, True)
+        out_len = decompress_into(packet, 0, buf)
+        assert buf[:out_len] == _decompress_py(packet, 0)
+
+
+def test_overflow_raises():
+    # One packet of 8 literal bytes into a 4 byte buffer.
+    packet = bytes([9, 0, 0]) + bytes(range(8)) + bytes([0xC0])
+    with pytest.raises(DecompressionError):
+        decompress_into(packet, 0, bytearray(4))
+    assert decompress(packet, 0) == bytes(range(8))
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 7, 8, 9, 64])
+def test_hash_chain_matches_compress_py_2_short(length):
+    source = _script_like(random.Random(length), length)
+    assert compress_py_hc(source) == _compress_py_2(source)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_hash_chain_matches_compress_py_2(seed):
+    rng = random.Random(seed)
+    source = _script_like(rng, rng.randint(100, 3000))
+    assert compress_py_hc(source) == _compress_py_2(source)
+    assert compress_py_hc(source) == _compress_py(source)
+
+
+@pytest.mark.parametrize("chain_depth", [1, 2, FAST_CHAIN_DEPTH])
+def test_shallow_chains_round_trip(chain_depth):
+    rng = random.Random(chain_depth)
+    source = _script_like(rng, 4000)
+    packet = compress_py_hc(source, chain_depth)
+    assert decompress(packet, 0) == source
+    assert decompress(compress(source, chain_depth), 0) == source
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_max_mode_round_trips_and_beats_greedy(seed):
+    rng = random.Random(seed)
+    source = _script_like(rng, rng.choice([0, 5, 8, 16, 300, 2000]))
+    packet = compress_py_max(source)
+    assert decompress(packet, 0) == source
+    assert len(packet) <= len(_compress_py_2(source))
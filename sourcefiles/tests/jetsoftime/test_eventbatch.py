@@ -0,0 +1,171 @@
+"""Tests for Event.batch() edits."""
+import random
+
+import pytest
+
+from jetsoftime.ctevent import Event
+from jetsoftime.eventcommand import (
+    EventCommand as EC,
+    Platform,
+    command_length,
+)
+
+_JUMPS = EC.fwd_jump_commands + EC.back_jump_commands
+# Commands with the same length on both platforms.
+_SHORT_CMDS = [bytes([0x00]), bytes([0xAD, 0x05]), bytes([0x96, 3, 4])]
+# Random jump offsets would overflow when insert/delete shifts them.
+_SKIP_OPCODES = {0x4E, *_JUMPS}
+
+
+def _build_random_commands(rng, count, platform):
+    out = bytearray()
+    for _ in range(count):
+        opcode = rng.choice([op for op in range(0x100)
+                             if op not in _SKIP_OPCODES])
+        buf = bytes([opcode]) + bytes(rng.getrandbits(8) for _ in range(40))
+        out += buf[:command_length(buf, 0, platform)]
+    return out
+
+
+def _build_jump_event(seed, platform):
+    rng = random.Random(seed)
+    code = bytearray()
+    for _ in range(400):
+        if rng.random() < 0.15:
+            opcode = rng.choice(_JUMPS)
+            buf = bytearray([opcode]) + bytes(rng.getrandbits(8)
+                                              for _ in range(10))
+            length = command_length(buf, 0, platform)
+            back_reach = len(code) + length - 1
+            if opcode in EC.back_jump_commands:
+                offset = rng.randint(1, max(1, min(100, back_reach)))
+            else:
+                offset = rng.randint(1, 100)
+            buf[length - 1] = offset
+            # The offset may have landed on a mode byte.
+            if command_length(buf, 0, platform) == length:
+                code += buf[:length]
+        else:
+            code += _build_random_commands(rng, 1, platform)
+    ptrs = (32).to_bytes(2, 'little') * 16
+    event = Event.from_pc_data(bytes([1]) + ptrs + code)
+    event.platform = platform
+    return event
+
+
+def _random_edits(event, rng, count):
+    offsets = list(event.instruction_index.offsets)
+    # Skip the first function so pointers see edits on both sides.
+    positions = sorted(rng.sample(offsets[10:-1], count), reverse=True)
+    edits = []
+    for pos in positions:
+        kind = rng.choice(['insert', 'delete', 'replace'])
+        if kind != 'insert' and event.data[pos] in _JUMPS:
+            kind = 'insert'
+        edits.append((kind, pos, rng.choice(_SHORT_CMDS)))
+    return edits
+
+
+def _apply(event, kind, pos, new_cmd):
+    if kind == 'insert':
+        event.insert_commands(bytearray(new_cmd), pos)
+    elif kind == 'delete':
+        event.delete_commands(pos, 1)
+    else:
+        event.insert_commands(bytearray(new_cmd), pos)
+        event.delete_commands(pos + len(new_cmd), 1)
+
+
+def _with_pointers(event):
+    # Point the functions of object 0 into the middle of the script.
+    offsets = event.instruction_index.offsets
+    for func in range(1, 16):
+        ptr = offsets[func * len(offsets) // 16]
+        event.data[2*func:2*func+2] = ptr.to_bytes(2, 'little')
+    event.invalidate_instruction_index()
+    return event
+
+
+@pytest.mark.parametrize("platform", [Platform.SNES, Platform.PC])
+@pytest.mark.parametrize("seed", range(8))
+def test_batch_matches_sequential_edits(seed, platform):
+    event = _with_pointers(_build_jump_event(seed, platform))
+    expected = _with_pointers(_build_jump_event(seed, platform))
+    rng = random.Random(seed)
+    edits = _random_edits(event, rng, 12)
+
+    for edit in edits:
+        _apply(expected, *edit)
+
+    rng.shuffle(edits)
+    data = event.data
+    original = bytes(data)
+    with event.batch():
+        for kind, pos, new_cmd in edits:
+            if kind == 'insert':
+                event.insert_commands(bytearray(new_cmd), pos)
+            elif kind == 'delete':
+                event.delete_commands(pos, 1)
+            else:
+                event.replace_commands(bytearray(new_cmd), pos)
+        # Nothing is applied until the block exits.
+        assert event.data == original
+
+    assert event.data is data
+    assert event.data == expected.data
+
+
+def test_inserts_at_one_position_keep_call_order():
+    event = _build_jump_event(0, Platform.PC)
+    expected = _build_jump_event(0, Platform.PC)
+    pos = event.instruction_index.offsets[50]
+
+    with event.batch():
+        for cmd in _SHORT_CMDS:
+            event.insert_commands(bytearray(cmd), pos)
+
+    for cmd in _SHORT_CMDS:
+        expected.insert_commands(bytearray(cmd), pos)
+        pos += len(cmd)
+
+    assert event.data == expected.data
+
+
+def test_delete_range_in_batch():
+    event = _build_jump_event(2, Platform.PC)
+    expected = _build_jump_event(2, Platform.PC)
+    offsets = event.instruction_index.offsets
+    ind = next(i for i in range(100, len(offsets))
+               if not {event.data[offsets[j]] for j in range(i, i+4)} &
+               set(_JUMPS))
+    start, end = offsets[ind], offsets[ind + 4]
+
+    with event.batch():
+        event.delete_commands_range(start, end)
+    expected.delete_commands_range(start, end)
+
+    assert event.data == expected.data
+
+
+def test_failed_batch_leaves_script_unchanged():
+    event = _build_jump_event(3, Platform.PC)
+    original = bytes(event.data)
+    pos = event.instruction_index.offsets[40]
+
+    with pytest.raises(KeyError):
+        with event.batch():
+            event.insert_commands(bytearray([0x00]), pos)
+            raise KeyError
+    assert event.data == original
+
+    length = command_length(event.data, pos, event.platform)
+    with pytest.raises(ValueError):
+        with event.batch():
+            event.delete_commands(pos, 2)
+            event.insert_commands(bytearray([0x00]), pos + length)
+    assert event.data == original
+
+    # A new batch works after a failed one.
+    with event.batch():
+        event.insert_commands(bytearray([0x00]), pos)
+    assert len(event.data) == len(original) + 1
@@ -0,0 +1,186 @@
+"""Tests for the table-driven event command decoder."""
+import random
+
+import pytest
+
+from jetsoftime.byteops import get_value_from_bytes
+from jetsoftime.eventcommand import (
+    _PC_ARG_LENS_OVERRIDES,
+    EventCommand,
+    Platform,
+    command_length,
+    event_commands,
+    get_command,
+)
+
+_ATTRS = ('command', 'num_args', 'arg_lens', 'arg_descs', 'name', 'desc',
+          'command_type', 'command_subtype', 'args', 'logical_args')
+
+
+def _get_command_py(buf: bytes, offset: int = 0,
+                     platform: Platform = Platform.SNES) -> EventCommand:
+    '''
+    The original decoder, kept as the reference: copy the event_commands
+    entry and apply the platform overrides on every call.
+    '''
+
+    command_id = buf[offset]
+    command = event_commands[command_id].copy()
+
+    # Apply PC-specific argument-length overrides before mode-based fixups.
+    if platform == Platform.PC and command_id in _PC_ARG_LENS_OVERRIDES:
+        command.arg_lens = _PC_ARG_LENS_OVERRIDES[command_id][:]
+        command.num_args = len(command.arg_lens)
+
+    if command_id == 0x2E:
+        mode = buf[offset+1] >> 4
+        if mode in [4, 5]:
+            command.arg_lens = [1, 1, 1, 1, 1]
+        elif mode == 8:
+            if platform == Platform.PC:
+                # PC: cmd byte + bits byte + palette-index byte = 3 args
+                command.arg_lens = [1, 1, 1]
+            else:
+                copy_len = get_value_from_bytes(buf[offset+3:offset+4]) - 2
+                command.arg_lens = [1, 1, 2, copy_len]
+        else:
+            print(f"{command_id:02X}: Error, Unknown Mode")
+    elif command_id == 0x4E:
+        # Data to copy follows command.  Shove data in last arg.
+        # SNES layout: [dest(2), mid(1), length(2), blob(n)] — length at offset+4
+        # PC layout:   [dest(2), length(2), blob(n)]          — length at offset+3
+        if platform == Platform.PC:
+            data_len = get_value_from_bytes(buf[offset+3:offset+5]) - 2
+            command.arg_lens = [2, 2, data_len]
+        else:
+            data_len = get_value_from_bytes(buf[offset+4:offset+6]) - 2
+            command.arg_lens = [2, 1, 2, data_len]
+    elif command_id == 0x88:
+        mode = buf[offset+1] >> 4
+        if mode == 0:
+            command.arg_lens = [1]
+        elif mode in [2, 3]:
+            command.arg_lens = [1, 1, 1]
+        elif mode in [4, 5]:
+            command.arg_lens = [1, 1, 1, 1]
+        elif mode == 8:
+            if platform == Platform.PC:
+                # PC: cmd byte + palette-index byte = 2 args
+                command.arg_lens = [1, 1]
+            else:
+                # SNES: variable-length copy; length encoded in third byte
+                copy_len = buf[offset+2] - 2
+                command.arg_lens = [1, 1, 1, copy_len]
+        else:
+            print(f"{command_id:02X}: Error, Unknown Mode")
+    elif command_id == 0xF1:
+        color = buf[offset+1]
+        if color == 0:
+            command.arg_lens = [1]
+        else:
+            command.arg_lens = [1, 1]
+    elif command_id == 0xFF:  # Mode7 scenes can be weird
+        scene = buf[offset+1]
+        if scene == 0x90:
+            command.arg_lens = [1, 1, 1, 1]
+        if scene == 0x97:
+            command.arg_lens = [1, 1, 1, 1]
+
+    # Now we can use arg_lens to extract the args
+    pos = offset + 1
+    command.args = []
+
+    if command.command == 0x4E:
+        for i in command.arg_lens[0:-1]:
+            command.args.append(get_value_from_bytes(buf[pos:pos+i]))
+            pos += i
+
+        command.args.append(
+            bytearray(buf[pos:pos+command.arg_lens[-1]])
+        )
+        pos += command.arg_lens[-1]
+    else:
+        for i in command.arg_lens:
+            command.args.append(get_value_from_bytes(buf[pos:pos+i]))
+            pos += i
+
+    return command
+
+
+def _assert_same(buf, offset, platform):
+    try:
+        expected = _get_command_py(buf, offset, platform)
+    except IndexError:
+        with pytest.raises(IndexError):
+            get_command(buf, offset, platform)
+        return
+    actual = get_command(buf, offset, platform)
+    for attr in _ATTRS:
+        value, expected_value = getattr(actual, attr), getattr(expected, attr)
+        if attr in ('arg_lens', 'arg_descs'):
+            # Shared spec values are tuples; per-instance overrides are lists.
+            value, expected_value = list(value), list(expected_value)
+        assert value == expected_value, attr
+    assert command_length(buf, offset, platform) == len(expected)
+
+
+@pytest.mark.parametrize("platform", [Platform.SNES, Platform.PC])
+@pytest.mark.parametrize("opcode", range(0x100))
+def test_get_command_matches_reference(opcode, platform):
+    rng = random.Random(opcode)
+    for trial in range(24):
+        tail = bytes(rng.getrandbits(8) for _ in range(40))
+        if trial < 16:
+            # Walk every mode nibble of the mode-dependent commands.
+            tail = bytes([trial << 4]) + tail[1:]
+        buf = bytes([0xEE, 0xEE, opcode]) + tail
+        _assert_same(buf, 2, platform)
+
+
+@pytest.mark.parametrize("platform", [Platform.SNES, Platform.PC])
+def test_truncated_buffer_matches_reference(platform):
+    for opcode in range(0x100):
+        for cut in range(1, 4):
+            _assert_same(bytes([opcode]) + bytes([0x22] * (cut - 1)), 0, platform)
+
+
+def test_decoded_commands_are_independent():
+    first = get_command(bytes([0x10, 0x05]))
+    first.args[0] = 0x7F
+    first.own_list('arg_lens').append(9)
+    second = get_command(bytes([0x10, 0x05]))
+    assert second.args == [0x05]
+    assert second.arg_lens == (1,)
+    assert first.arg_lens == [1, 9]
+
+
+def test_reading_does_not_copy_spec():
+    cmd = get_command(bytes([0x8B, 0x01, 0x02]))
+    assert cmd.arg_lens is cmd.spec.arg_lens
+    assert cmd.arg_descs is cmd.spec.arg_descs
+    assert cmd._own is None
+    with pytest.raises(TypeError):
+        cmd.arg_lens[0] = 2
+
+
+def test_decoded_commands_share_spec():
+    first = get_command(bytes([0x8B, 0x01, 0x02]))
+    second = get_command(bytes([0x8B, 0x03, 0x04]))
+    assert first.spec is second.spec
+    assert not hasattr(first, '__dict__')
+    assert first.name == second.name == first.spec.name
+
+
+def test_instance_overrides_stay_local():
+    cmd = get_command(bytes([0x8B, 0x01, 0x02]))
+    other = get_command(bytes([0x8B, 0x03, 0x04]))
+    cmd.desc += ' (edited)'
+    cmd.logical_args.append(5)
+    assert other.desc == cmd.spec.desc
+    assert other.logical_args == []
+
+    dup = cmd.copy()
+    assert dup.desc == cmd.desc
+    assert dup.logical_args == []
+    dup.own_list('arg_lens')[0] = 2
+    assert len(dup) == 4 and len(cmd) == 3
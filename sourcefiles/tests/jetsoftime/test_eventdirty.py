@@ -0,0 +1,138 @@
+"""Tests for Event dirty tracking and dirty-only saves."""
+import random
+
+import pytest
+
+from jetsoftime.compressioncache import CompressionCache
+from jetsoftime.ctdecompress import decompress
+from jetsoftime.ctevent import Event, ScriptManager, get_loc_event_ptr
+from jetsoftime.ctstrings import CTString
+from jetsoftime.eventfunction import EventFunction as EF
+from jetsoftime.freespace import FSRom, FSWriteType
+
+_LOC_DATA = 0x360000
+_EVENT_PTRS = 0x3CF9F0
+_SCRIPT_ADDR = 0x3D0000
+
+
+def _build_script_bytes(num_pauses, seed=0):
+    # One object whose functions all start with num_pauses pause commands.
+    rng = random.Random(seed)
+    ptrs = (32).to_bytes(2, 'little') * 16
+    body = bytearray()
+    for _ in range(num_pauses):
+        body += bytes([0xAD, rng.randrange(0x100)])
+    return bytes([1]) + ptrs + bytes(body) + b'\x00'
+
+
+def _build_packet(script_bytes):
+    return bytes(CompressionCache().compress(script_bytes))
+
+
+def _build_script_rom(num_locs, holes=()):
+    # num_locs one-pause scripts packed from _SCRIPT_ADDR, with holes free.
+    rom = bytearray(0x400000)
+    addr = _SCRIPT_ADDR
+    for loc_id in range(num_locs):
+        ind_st = _LOC_DATA + 14*loc_id + 8
+        rom[ind_st:ind_st+2] = loc_id.to_bytes(2, 'little')
+        ptr_st = _EVENT_PTRS + 3*loc_id
+        rom[ptr_st:ptr_st+3] = (0xC00000 + addr).to_bytes(3, 'little')
+        packet = _build_packet(_build_script_bytes(1, loc_id))
+        rom[addr:addr+len(packet)] = packet
+        addr += len(packet)
+
+    fsrom = FSRom(bytes(rom), False)
+    for hole in holes:
+        fsrom.space_manager.mark_block(hole, FSWriteType.MARK_FREE)
+    return fsrom, ScriptManager(fsrom, list(range(num_locs)))
+
+
+def _set_script(manager, loc_id, script_bytes):
+    script = Event.from_rom(_build_packet(script_bytes), 0)
+    manager.set_script(script, loc_id)
+
+
+def _rom_script(fsrom, loc_id):
+    return decompress(fsrom.getbuffer(),
+                      get_loc_event_ptr(fsrom.getbuffer(), loc_id))
+
+
+def _build_clean_event():
+    event = Event.from_rom(_build_script_rom(1)[0].getbuffer(), _SCRIPT_ADDR)
+    assert not event.dirty
+    return event
+
+
+def test_mutators_mark_dirty():
+    edits = (
+        lambda ev: ev.insert_commands(bytearray([0xAD, 0x01]), 32),
+        lambda ev: ev.delete_commands(32),
+        lambda ev: ev.replace_commands(bytearray([0x00]), 32),
+        lambda ev: ev.set_function(0, 0, EF.from_bytearray(bytearray([0]))),
+        lambda ev: ev.append_empty_object(),
+        lambda ev: ev.add_py_string('hi'),
+    )
+    for edit in edits:
+        event = _build_clean_event()
+        edit(event)
+        assert event.dirty
+
+    event = _build_clean_event()
+    with event.batch():
+        event.delete_commands(32)
+    assert event.dirty
+
+    # A batch that raises drops its edits and leaves the script clean.
+    event = _build_clean_event()
+    with pytest.raises(KeyError):
+        with event.batch():
+            event.delete_commands(32)
+            raise KeyError
+    assert not event.dirty
+
+    # Looking is not editing.
+    event = _build_clean_event()
+    event.get_function(0, 0)
+    event.find_command_opt([0xAD])
+    assert not event.dirty
+
+
+def test_string_change_marks_dirty():
+    event = _build_clean_event()
+    event.strings.append(CTString.from_ascii('hi'))
+    event.modified_strings = True
+    assert event.dirty
+
+
+def test_save_writes_only_dirty_scripts():
+    fsrom, manager = _build_script_rom(3, [(0x3E0000, 0x3F0000)])
+    for loc_id in range(3):
+        manager.get_script(loc_id)
+    assert manager.dirty_locations() == []
+    before = bytes(fsrom.getbuffer())
+    assert manager.write_scripts_to_rom() == []
+    assert bytes(fsrom.getbuffer()) == before
+
+    manager.get_script(1).insert_commands(bytearray([0xAD, 0x07]), 32)
+    _set_script(manager, 2, _build_script_bytes(5, 2))
+    assert manager.dirty_locations() == [1, 2]
+
+    assert manager.write_scripts_to_rom() == [1, 2]
+    assert manager.dirty_locations() == []
+    assert bytes(_rom_script(fsrom, 1)[33:35]) == b'\xAD\x07'
+    assert bytes(_rom_script(fsrom, 2)) == _build_script_bytes(5, 2)
+    assert not manager.write_script_to_rom(0)
+
+
+def test_undone_edit_is_not_rewritten():
+    fsrom, manager = _build_script_rom(1, [(0x3E0000, 0x3F0000)])
+    script = manager.get_script(0)
+    script.insert_commands(bytearray([0xAD, 0x07]), 32)
+    script.delete_commands(32)
+    assert script.dirty
+
+    before = bytes(fsrom.getbuffer())
+    assert manager.write_scripts_to_rom() == []
+    assert bytes(fsrom.getbuffer()) == before
+    assert not script.dirty
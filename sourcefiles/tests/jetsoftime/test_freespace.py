@@ -0,0 +1,374 @@
+"""Tests for FreeSpace against the FreeSpace_py reference."""
+import random
+from typing import Tuple
+
+import pytest
+
+from jetsoftime.freespace import FreeSpace, FreeSpaceError, FSRom, \
+    FSWriteType
+
+_ROM_SIZE = 0x60000
+_MARKS = (FSWriteType.MARK_USED, FSWriteType.MARK_FREE)
+
+
+class FreeSpace_py():
+    '''
+    The original marker-list FreeSpace, kept as the reference.  markers
+    alternates free/used blocks starting with a block of type first_free.
+    '''
+    def __init__(self, num_bytes, is_free):
+
+        self.num_bytes = num_bytes
+        self.markers = [0, self.num_bytes]
+        self.first_free = is_free
+
+    # Mark a block of the buffer as free/not free depending on is_free.
+    # block is a half-open interval [block[0], block[1]) as is Python's way.
+    def mark_block(self,
+                   block: Tuple[int, int],
+                   mark_type: FSWriteType):
+
+        if mark_type == FSWriteType.NO_MARK:
+            return
+        else:
+            # print(f"Marking [{block[0]:06X}, {block[1]:06X})  as {is_free}")
+            is_free = (mark_type == FSWriteType.MARK_FREE)
+
+        # maybe verify block is valid?
+        if block[1] <= block[0]:
+            print(
+                'Error: Block [%6.6X, %6.6X) has nonpositive size. Returning.'
+                % (block[0], block[1])
+            )
+
+        # If the block to mark goes past the end of the file, extend?
+        # This should probably throw an error.
+        if block[1] > self.markers[-1]:
+            print('Warning: block [%6.6X, %6.6X) exceeds EOF. Truncating.'
+                  % (block[0], block[1]))
+            block = (block[0], self.markers[-1])
+
+        if block[0] < 0:
+            print('Warning: block [%6.6X, %6.6X) preceeds 0. Truncating.'
+                  % (block[0], block[1]))
+            block = (0, block[1])
+
+        left_blk = self.__search(0, len(self.markers)-2, block[0])
+        right_blk = self.__search(0, len(self.markers)-2, block[1])
+
+        lc = (left_blk % 2 == 0)
+        rc = (right_blk % 2 == 0)
+
+        left_type = (lc == (self.first_free == is_free))
+        right_type = (rc == (self.first_free == is_free))
+
+        if left_type:
+            # If the left_type matches the type we're marking, then the left
+            # endpoint of the block we found will be the start of a block
+            start = left_blk
+        elif block[0] == self.markers[left_blk]:
+            # If the left_type doesn't match, but we're starting at its
+            # leftmost point, then we're just extending the previous matching
+            # block.
+            if left_blk != 0:  # Unless we're already at the start.
+                start = left_blk-1
+            else:
+                # When at the start, theen just start at the beginning
+                start = 0
+
+                # Now the first block's type changes to is_free
+                self.first_free = is_free
+        else:
+            # cut a block
+            self.markers.insert(left_blk+1, block[0])
+            start = left_blk+1
+            right_blk += 1
+
+        if right_type:
+            # If the right_type matches, then just extend that block
+            end = right_blk+1
+        elif block[1] == self.markers[right_blk+1]:
+            # If it doesn't match, but it's at the very end of the block,
+            # then extend through the next matching block.
+            if right_blk+2 == len(self.markers):  # Unless we're at the end_grp
+                end = right_blk+1
+            else:
+                end = right_blk+2
+        else:
+            # cut the block
+            self.markers.insert(right_blk+1, block[1])
+            end = right_blk+1
+
+        # delete all markers between the start and the end (not inclusive)
+        if end > start+1:
+            del self.markers[start+1:end]
+    # End of mark_block
+
+    def is_block_free(self, block) -> bool:
+        left = block[0]
+        right = block[1]
+
+        left_ind = self.__search(0, len(self.markers)-2, left)
+        right_ind = self.__search(0, len(self.markers)-2, right)
+
+        left_parity = left_ind % 2 == 0
+        left_free = left_parity == (self.first_free is True)
+
+        return (left_ind == right_ind) and left_free
+
+    def extend_end_marker(self, new_end, is_free):
+        last_free = self.__is_free(len(self.markers)-2)
+
+        # print(f"{new_end:06X}, {is_free}")
+        if last_free == is_free:
+            self.markers[-1] = new_end
+        else:
+            self.markers.append(new_end)
+
+    def __is_free(self, ind):
+        return ((ind % 2 == 0) == self.first_free)
+
+    # First fit.  Location must be after hint
+    def get_free_addr(self, size, hint=0):
+        # block associated with its left marker, so search to len-2
+        ind = self.__search(0, len(self.markers)-2, hint)
+
+        # print(f"Searching for {size} free bytes.")
+        if self.__is_free(ind) and (self.markers[ind+1]-hint > 0):
+            return hint
+        else:
+            if not self.__is_free(ind):
+                ind += 1
+
+            start = ind
+            ret = None
+            for x in range(start, len(self.markers)-1, 2):
+                # print(f"({self.markers[x]}, {self.markers[x+1]})")
+                # print(f"Size: {self.markers[x+1]-self.markers[x]}")
+
+                block_st = self.markers[x]
+                block_end = self.markers[x+1]
+                next_bank = (block_st & 0xFF0000) + 0x010000
+
+                true_block_end = min(block_end, next_bank)
+                if true_block_end - block_st >= size:
+                    ret = block_st
+                    break
+
+                # If the block ends before the next bank starts, then
+                # block_end == true_block_end, and this if won't trigger.
+                # Otherwise, true_block_end is the start of the next bank, and
+                # we're trying to fit at the start of the next bank.
+                if block_end - true_block_end >= size:
+                    ret = true_block_end  # == next bank start
+                    break
+
+            if ret is None:
+                # print("Error: Not enough free space.")
+                # print(f"size: {size:06X}, hint: {hint:06X}")
+                # self.print_blocks()
+                raise FreeSpaceError(
+                    f'Not Enough Free Space.  Size: {size:06X}, '
+                    f'hint: {hint:06X}'
+                )
+
+            return ret
+
+    # Find the index of an address in the block map
+    def __search(self, start_ind, end_ind, addr):
+        search_ind = (start_ind+end_ind)//2
+
+        left = self.markers[search_ind]
+        right = self.markers[search_ind+1]
+
+        if left <= addr < right:
+            return search_ind
+        elif addr >= right:
+            if start_ind == len(self.markers)-1:
+                return len(self.markers)-2
+            else:
+                return self.__search(search_ind+1, end_ind, addr)
+        else:
+            return self.__search(start_ind, search_ind-1, addr)
+
+
+def _random_block(rng, end):
+    start = rng.randrange(end - 1)
+    size = rng.choice((rng.randint(1, 0x40), rng.randint(1, 0x4000)))
+    return (start, min(start + size, end))
+
+
+def _fragmented(rng, num_marks=400, is_free=True):
+    new, old = FreeSpace(_ROM_SIZE, is_free), FreeSpace_py(_ROM_SIZE, is_free)
+    for _ in range(num_marks):
+        block = _random_block(rng, _ROM_SIZE)
+        mark = rng.choice(_MARKS)
+        new.mark_block(block, mark)
+        old.mark_block(block, mark)
+    return new, old
+
+
+def _result(space, method, *args):
+    try:
+        return getattr(space, method)(*args)
+    except FreeSpaceError:
+        return None
+
+
+def _brute_first_fit(space, size, hint=0, bank=None):
+    for start, end in space.free_blocks():
+        addr = max(start, hint)
+        while addr < end:
+            bank_end = ((addr >> 16) + 1) << 16
+            if bank is None or addr >> 16 == bank:
+                if min(end, bank_end) - addr >= size:
+                    return addr
+            addr = bank_end
+    return None
+
+
+def _bank_pieces(space):
+    for start, end in space.free_blocks():
+        while start < end:
+            piece_end = min(end, ((start >> 16) + 1) << 16)
+            yield (piece_end - start, start)
+            start = piece_end
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_marking_matches_reference(seed):
+    rng = random.Random(seed)
+    new, old = _fragmented(rng, is_free=bool(seed % 2))
+    assert new.markers == old.markers
+    assert new.first_free == old.first_free
+
+    for _ in range(200):
+        block = _random_block(rng, _ROM_SIZE)
+        assert new.is_block_free(block) == old.is_block_free(block)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_first_fit_matches_reference(seed):
+    rng = random.Random(seed)
+    new, old = _fragmented(rng)
+
+    for _ in range(300):
+        size = rng.choice((rng.randint(1, 0x100), rng.randint(1, 0x18000)))
+        hint = rng.choice((0, rng.randrange(_ROM_SIZE + 0x100)))
+        addr = _result(new, 'get_free_addr', size, hint)
+        assert addr == _result(old, 'get_free_addr', size, hint)
+
+        if addr is not None and rng.random() < 0.5:
+            block = (addr, min(addr + size, _ROM_SIZE))
+            new.mark_block(block, FSWriteType.MARK_USED)
+            old.mark_block(block, FSWriteType.MARK_USED)
+        assert new.markers == old.markers
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_extend_matches_reference(seed):
+    new, old = _fragmented(random.Random(seed), num_marks=200)
+
+    end = _ROM_SIZE
+    for is_free in (True, False, FSWriteType.MARK_USED, True):
+        end += 0x1000
+        new.extend_end_marker(end, is_free)
+        old.extend_end_marker(end, is_free)
+        assert new.markers == old.markers
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_bank_constrained_queries(seed):
+    rng = random.Random(seed)
+    space, _ = _fragmented(rng)
+
+    for _ in range(200):
+        size = rng.randint(1, 0x2000)
+        hint = rng.randrange(_ROM_SIZE)
+        bank = rng.choice((None, rng.randrange(_ROM_SIZE >> 16)))
+        expected = _brute_first_fit(space, size, hint, bank)
+        assert _result(space, 'get_first_fit_addr', size, hint, bank) == \
+            expected
+
+        fits = sorted(
+            piece for piece in _bank_pieces(space)
+            if piece[0] >= size and (bank is None or piece[1] >> 16 == bank)
+        )
+        best = fits[0][1] if fits else None
+        assert _result(space, 'get_best_fit_addr', size, bank) == best
+
+
+def test_best_fit_prefers_smallest_block():
+    space = FreeSpace(0x30000, False)
+    space.mark_block((0x00100, 0x00400), FSWriteType.MARK_FREE)
+    space.mark_block((0x10100, 0x10180), FSWriteType.MARK_FREE)
+    space.mark_block((0x2FF00, 0x30000), FSWriteType.MARK_FREE)
+
+    assert space.get_free_addr(0x80) == 0x00100
+    assert space.get_best_fit_addr(0x80) == 0x10100
+    assert space.get_best_fit_addr(0x81) == 0x2FF00
+    assert space.get_first_fit_addr(0x80, bank=2) == 0x2FF00
+    assert space.largest_free_in_bank(0) == 0x300
+    with pytest.raises(FreeSpaceError):
+        space.get_best_fit_addr(0x400)
+
+
+def test_fsrom_write_extends_like_reference():
+    fsrom = FSRom(bytes(0x100), True)
+    fsrom.space_manager.mark_block((0, 0x80), FSWriteType.MARK_USED)
+    fsrom.seek(0x120)
+    fsrom.write(b'\x01' * 0x10, FSWriteType.MARK_USED)
+
+    old = FreeSpace_py(0x100, True)
+    old.mark_block((0, 0x80), FSWriteType.MARK_USED)
+    old.extend_end_marker(0x130, FSWriteType.MARK_USED)
+    old.mark_block((0x120, 0x130), FSWriteType.MARK_USED)
+    assert fsrom.space_manager.markers == old.markers
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_plan_same_bank_leaves_map_alone(seed):
+    rng = random.Random(seed)
+    space, _ = _fragmented(rng, num_marks=600)
+
+    for _ in range(50):
+        sizes = [rng.randint(1, 0x800) for _ in range(rng.randint(1, 5))]
+        hint = rng.choice((0, rng.randrange(_ROM_SIZE)))
+        markers = space.markers
+        try:
+            plan = space.plan_same_bank(sizes, hint)
+        except FreeSpaceError:
+            assert space.markers == markers
+            continue
+        assert space.markers == markers
+
+        blocks = sorted((addr, addr + size) for addr, size in zip(plan, sizes))
+        assert all(start >= hint for start, _ in blocks)
+        assert len({start >> 16 for start, _ in blocks}) == 1
+        assert all((end - 1) >> 16 == start >> 16 for start, end in blocks)
+        assert all(a[1] <= b[0] for a, b in zip(blocks, blocks[1:]))
+
+        space.claim_blocks(blocks)
+        assert not any(space.is_range_free(*block) for block in blocks)
+
+
+def test_claim_blocks_is_all_or_nothing():
+    space = FreeSpace(0x20000, False)
+    space.mark_block((0x100, 0x200), FSWriteType.MARK_FREE)
+    space.mark_block((0x10000, 0x10100), FSWriteType.MARK_FREE)
+    markers = space.markers
+
+    for blocks in (
+            [(0x100, 0x180), (0x1F0, 0x210)],  # runs into used space
+            [(0x100, 0x180), (0x170, 0x190)],  # overlapping
+    ):
+        with pytest.raises(FreeSpaceError):
+            space.claim_blocks(blocks)
+        assert space.markers == markers
+
+    # Only one of the two fits in bank 0 after the hint.
+    assert space.plan_same_bank([0x80, 0x40], hint=0x180) == \
+        [0x10000, 0x10080]
+    assert space.get_same_bank_free_addrs([0x40, 0x80]) == [0x180, 0x100]
+    with pytest.raises(FreeSpaceError):
+        space.plan_same_bank([0x100, 0x100])
@@ -0,0 +1,108 @@
+"""Tests for the cached function table on ctevent.Event."""
+import random
+
+import pytest
+
+from jetsoftime.ctevent import Event
+
+
+def _random_event(seed, num_objects=6):
+    rng = random.Random(seed)
+    code_len = 40 * num_objects
+    header_len = 32 * num_objects
+    obj_starts = sorted(rng.sample(range(header_len + 1,
+                                         header_len + code_len), num_objects))
+    obj_starts[0] = header_len
+    ptrs = []
+    for obj_id, obj_start in enumerate(obj_starts):
+        obj_end = obj_starts[obj_id+1] if obj_id + 1 < num_objects \
+            else header_len + code_len
+        func_starts = [obj_start]
+        for _ in range(15):
+            roll = rng.random()
+            if roll < 0.3:
+                # Empty: repeat an earlier start.
+                func_starts.append(rng.choice(func_starts))
+            elif roll < 0.45:
+                # Linked: point into another object.
+                func_starts.append(rng.choice(obj_starts))
+            else:
+                func_starts.append(rng.randrange(func_starts[-1], obj_end)
+                                   if func_starts[-1] < obj_end
+                                   else func_starts[-1])
+        ptrs.extend(func_starts)
+
+    raw = bytes([num_objects]) + b''.join(p.to_bytes(2, 'little')
+                                          for p in ptrs)
+    return Event.from_pc_data(raw + bytes(code_len))
+
+
+def _start(event, obj_id, func_id):
+    ptr = 32*obj_id + 2*func_id
+    return int.from_bytes(event.data[ptr:ptr+2], 'little')
+
+
+def _end_reference(event, obj_id, func_id):
+    start = _start(event, obj_id, func_id)
+    for ptr in range(32*obj_id + 2*func_id + 2, 32*event.num_objects, 2):
+        next_start = int.from_bytes(event.data[ptr:ptr+2], 'little')
+        if next_start != start:
+            return next_start
+    return len(event.data)
+
+
+def _linked_reference(event, obj_id, func_id):
+    obj_st = event.get_object_start(obj_id)
+    next_st = len(event.data) if obj_id == event.num_objects - 1 \
+        else event.get_object_start(obj_id + 1)
+    return not obj_st <= _start(event, obj_id, func_id) < next_st
+
+
+def _empty_reference(event, obj_id, func_id):
+    start = _start(event, obj_id, func_id)
+    return any(_start(event, obj_id, ind) == start for ind in range(func_id))
+
+
+def _real_reference(event, obj_id, func_id):
+    return not (_empty_reference(event, obj_id, func_id) or
+                _linked_reference(event, obj_id, func_id))
+
+
+def _link_target_reference(event, obj_id, func_id):
+    if _real_reference(event, obj_id, func_id):
+        return None
+    target = _start(event, obj_id, func_id)
+    for tgt_obj in range(event.num_objects):
+        for tgt_func in range(16):
+            if (tgt_obj, tgt_func) != (obj_id, func_id) and \
+                    _real_reference(event, tgt_obj, tgt_func) and \
+                    _start(event, tgt_obj, tgt_func) == target:
+                return (tgt_obj, tgt_func)
+    return None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_function_table_matches_pointer_scan(seed):
+    event = _random_event(seed)
+    for obj_id in range(event.num_objects):
+        for func_id in range(16):
+            args = (event, obj_id, func_id)
+            assert event.get_function_end(obj_id, func_id) == \
+                _end_reference(*args)
+            assert event._function_is_linked(obj_id, func_id) == \
+                _linked_reference(*args)
+            assert event._function_is_empty(obj_id, func_id) == \
+                _empty_reference(*args)
+            assert event.get_link_target(obj_id, func_id) == \
+                _link_target_reference(*args)
+
+
+def test_function_table_follows_pointer_writes():
+    event = _random_event(1)
+    table = event.function_table
+    assert event.function_table is table
+
+    event._set_function_start(0, 5, event.get_function_start(1, 0))
+    assert event.function_table is not table
+    assert event._function_is_linked(0, 5)
+    assert event.get_function_end(0, 5) == _end_reference(event, 0, 5)
@@ -0,0 +1,189 @@
+"""Tests for the cached instruction index on ctevent.Event."""
+import random
+
+import pytest
+
+from jetsoftime.ctevent import Event
+from jetsoftime.eventcommand import (
+    EventCommand as EC,
+    Platform,
+    command_length,
+    get_command,
+)
+from jetsoftime.instructionindex import InstructionIndex
+
+# Random jump offsets would overflow when insert/delete shifts them.
+_SKIP_OPCODES = {0x4E, *EC.fwd_jump_commands, *EC.back_jump_commands}
+
+
+def _build_random_commands(rng, count, platform):
+    out = bytearray()
+    for _ in range(count):
+        opcode = rng.choice([op for op in range(0x100)
+                             if op not in _SKIP_OPCODES])
+        buf = bytes([opcode]) + bytes(rng.getrandbits(8) for _ in range(40))
+        out += buf[:command_length(buf, 0, platform)]
+    return out
+
+
+def _build_event_from_code(code, platform):
+    ptrs = (32).to_bytes(2, 'little') * 16
+    event = Event.from_pc_data(bytes([1]) + ptrs + code)
+    event.platform = platform
+    return event
+
+
+def _build_event(seed, platform=Platform.PC, num_commands=300):
+    rng = random.Random(seed)
+    code = _build_random_commands(rng, num_commands, platform)
+    return _build_event_from_code(code, platform)
+
+
+def _build_jump_event(seed, platform):
+    rng = random.Random(seed)
+    code = bytearray()
+    for _ in range(400):
+        if rng.random() < 0.15:
+            opcode = rng.choice(EC.fwd_jump_commands + EC.back_jump_commands)
+            buf = bytearray([opcode]) + bytes(rng.getrandbits(8)
+                                              for _ in range(10))
+            length = command_length(buf, 0, platform)
+            back_reach = len(code) + length - 1
+            if opcode in EC.back_jump_commands:
+                offset = rng.randint(1, max(1, min(100, back_reach)))
+            else:
+                offset = rng.randint(1, 100)
+            buf[length - 1] = offset
+            # The offset may have landed on a mode byte.
+            if command_length(buf, 0, platform) == length:
+                code += buf[:length]
+        else:
+            code += _build_random_commands(rng, 1, platform)
+    return _build_event_from_code(code, platform)
+
+
+def _assert_fresh(event):
+    index = event.instruction_index
+    fresh = InstructionIndex(event.data, event.get_object_start(0),
+                             event.platform)
+    assert list(index.offsets) == list(fresh.offsets)
+    assert list(index.opcodes) == list(fresh.opcodes)
+    assert list(index.lengths) == list(fresh.lengths)
+
+
+def _find_linear(event, cmd_ids, start, end):
+    pos = start
+    while pos < end:
+        cmd = get_command(event.data, pos, event.platform)
+        if cmd.command in cmd_ids:
+            return pos
+        pos += len(cmd)
+    return None
+
+
+@pytest.mark.parametrize("platform", [Platform.SNES, Platform.PC])
+@pytest.mark.parametrize("seed", range(8))
+def test_find_command_matches_linear_scan(seed, platform):
+    event = _build_event(seed, platform)
+    rng = random.Random(seed)
+    offsets = list(event.instruction_index.offsets)
+    for _ in range(50):
+        cmd_ids = rng.sample(range(0x100), 8)
+        start = rng.choice(offsets)
+        end = rng.randrange(start, len(event.data) + 1)
+        pos, _ = event.find_command_opt(cmd_ids, start, end)
+        assert pos == _find_linear(event, cmd_ids, start, end)
+
+
+def test_find_command_off_grid_start():
+    event = _build_event(1)
+    index = event.instruction_index
+    for ind in range(len(index) - 1):
+        if index.lengths[ind] > 1:
+            start = index.offsets[ind] + 1
+            break
+    pos, _ = event.find_command_opt([0xB8, 0x00], start, len(event.data))
+    assert pos == _find_linear(event, [0xB8, 0x00], start, len(event.data))
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_index_patched_through_inserts_and_deletes(seed):
+    event = _build_event(seed)
+    rng = random.Random(seed)
+    index = event.instruction_index
+    for _ in range(40):
+        offsets = list(event.instruction_index.offsets)
+        if rng.random() < 0.5:
+            pos = rng.choice(offsets + [len(event.data)])
+            event.insert_commands(
+                _build_random_commands(rng, rng.randint(1, 3),
+                                       event.platform), pos
+            )
+        else:
+            ind = rng.randrange(len(offsets) - 3)
+            event.delete_commands(offsets[ind], rng.randint(1, 3))
+        # Patched in place rather than rebuilt.
+        assert event.instruction_index is index
+        _assert_fresh(event)
+
+
+def test_index_rebuilt_after_structural_edit():
+    event = _build_event(3)
+    index = event.instruction_index
+    event.data = bytearray(event.data)
+    assert event.instruction_index is not index
+    _assert_fresh(event)
+
+    index = event.instruction_index
+    event.append_empty_object()
+    assert event.instruction_index is not index
+    _assert_fresh(event)
+
+
+def _shift_jumps_reference(event, before_pos, after_pos, shift):
+    # Full-scan version of Event.__shift_jumps.
+    jmp_cmds = EC.fwd_jump_commands + EC.back_jump_commands
+    pos = event.get_object_start(0)
+    while pos < len(event.data):
+        cmd = get_command(event.data, pos, event.platform)
+        if cmd.command in jmp_cmds and cmd.args:
+            jump_mult = 2*(cmd.command in EC.fwd_jump_commands)-1
+            jump_target = pos + len(cmd) + cmd.args[-1]*jump_mult - 1
+            cmd_bound = pos + len(cmd)*(jump_mult == -1)
+            start = min(cmd_bound, jump_target)
+            end = max(cmd_bound, jump_target)
+            if before_pos == after_pos:
+                can_shift_aft = (end > after_pos)
+            else:
+                can_shift_aft = (end >= after_pos)
+            if can_shift_aft and start < before_pos:
+                event.data[pos + len(cmd) - 1] += shift
+        pos += len(cmd)
+
+
+@pytest.mark.parametrize("platform", [Platform.SNES, Platform.PC])
+@pytest.mark.parametrize("seed", range(6))
+def test_jump_shifts_match_full_scan(seed, platform):
+    event = _build_jump_event(seed, platform)
+    expected = _build_jump_event(seed, platform)
+    rng = random.Random(seed)
+    short_cmds = [bytes([0x00]), bytes([0xAD, 0x05]), bytes([0x96, 3, 4])]
+    for _ in range(20):
+        offsets = list(event.instruction_index.offsets)
+        if rng.random() < 0.5:
+            pos = rng.choice(offsets)
+            new_cmd = rng.choice(short_cmds)
+            event.insert_commands(bytearray(new_cmd), pos)
+            _shift_jumps_reference(expected, pos, pos, len(new_cmd))
+            expected.data[pos:pos] = new_cmd
+        else:
+            pos = rng.choice(offsets[:-1])
+            length = command_length(event.data, pos, platform)
+            if event.data[pos] in EC.fwd_jump_commands + \
+                    EC.back_jump_commands:
+                continue
+            event.delete_commands(pos, 1)
+            _shift_jumps_reference(expected, pos, pos + length, -length)
+            del expected.data[pos:pos + length]
+        assert event.data[32:] == expected.data[32:]
+    _assert_fresh(event)
@@ -0,0 +1,117 @@
+"""Tests for sliding event scripts together to merge free space."""
+import random
+
+import pytest
+
+from jetsoftime.compressioncache import CompressionCache
+from jetsoftime.ctdecompress import decompress, get_compressed_length
+from jetsoftime.ctevent import Event, ScriptManager, get_loc_event_ptr
+from jetsoftime.freespace import FSRom, FSWriteType
+from jetsoftime.scriptcompaction import compact_scripts, plan_compaction
+
+_NUM_LOCS = 6
+_SCRIPT_BANK = 0x3D
+
+_LOC_DATA = 0x360000
+_EVENT_PTRS = 0x3CF9F0
+_SCRIPT_ADDR = 0x3D0000
+
+
+def _build_script_bytes(num_pauses, seed=0):
+    # One object whose functions all start with num_pauses pause commands.
+    rng = random.Random(seed)
+    ptrs = (32).to_bytes(2, 'little') * 16
+    body = bytearray()
+    for _ in range(num_pauses):
+        body += bytes([0xAD, rng.randrange(0x100)])
+    return bytes([1]) + ptrs + bytes(body) + b'\x00'
+
+
+def _build_packet(script_bytes):
+    return bytes(CompressionCache().compress(script_bytes))
+
+
+def _build_script_rom(num_locs, holes=()):
+    # num_locs one-pause scripts packed from _SCRIPT_ADDR, with holes free.
+    rom = bytearray(0x400000)
+    addr = _SCRIPT_ADDR
+    for loc_id in range(num_locs):
+        ind_st = _LOC_DATA + 14*loc_id + 8
+        rom[ind_st:ind_st+2] = loc_id.to_bytes(2, 'little')
+        ptr_st = _EVENT_PTRS + 3*loc_id
+        rom[ptr_st:ptr_st+3] = (0xC00000 + addr).to_bytes(3, 'little')
+        packet = _build_packet(_build_script_bytes(1, loc_id))
+        rom[addr:addr+len(packet)] = packet
+        addr += len(packet)
+
+    fsrom = FSRom(bytes(rom), False)
+    for hole in holes:
+        fsrom.space_manager.mark_block(hole, FSWriteType.MARK_FREE)
+    return fsrom, ScriptManager(fsrom, list(range(num_locs)))
+
+
+def _set_script(manager, loc_id, script_bytes):
+    script = Event.from_rom(_build_packet(script_bytes), 0)
+    manager.set_script(script, loc_id)
+
+
+def _rom_script(fsrom, loc_id):
+    return decompress(fsrom.getbuffer(),
+                      get_loc_event_ptr(fsrom.getbuffer(), loc_id))
+
+
+@pytest.fixture
+def fragmented_rom():
+    # Growing locations 1 and 3 moves them to the free block in the next
+    # bank and leaves holes where they were.
+    fsrom, manager = _build_script_rom(_NUM_LOCS, [(0x3E0000, 0x3E8000)])
+    for loc_id in (1, 3):
+        _set_script(manager, loc_id, _build_script_bytes(100, loc_id))
+    manager.write_scripts_to_rom()
+    scripts = [bytes(_rom_script(fsrom, loc_id))
+               for loc_id in range(_NUM_LOCS)]
+    return fsrom, manager, scripts
+
+
+def test_dry_run_changes_nothing(fragmented_rom):
+    fsrom, manager, _ = fragmented_rom
+    rom = bytes(fsrom.getbuffer())
+    markers = fsrom.space_manager.markers
+
+    report = compact_scripts(manager, dry_run=True, num_locations=_NUM_LOCS)
+    assert [move.event_inds for move in report.moves] == [(2,), (4,), (5,)]
+    assert report.before[_SCRIPT_BANK].holes == 2
+    assert report.after[_SCRIPT_BANK].holes == 1
+    assert report.lines()[0] == 'Would move 3 scripts.'
+
+    assert bytes(fsrom.getbuffer()) == rom
+    assert fsrom.space_manager.markers == markers
+
+
+def test_compaction_merges_holes(fragmented_rom):
+    fsrom, manager, scripts = fragmented_rom
+    space = fsrom.space_manager
+    holes_len = space.bank_stats()[_SCRIPT_BANK].free
+    planned = compact_scripts(manager, dry_run=True, num_locations=_NUM_LOCS)
+
+    report = compact_scripts(manager, num_locations=_NUM_LOCS)
+    assert report.moves == planned.moves
+    assert report.after == planned.after
+    assert report.after[_SCRIPT_BANK].largest == holes_len
+
+    for loc_id, script in enumerate(scripts):
+        assert bytes(_rom_script(fsrom, loc_id)) == script
+
+    # Scripts 0, 2, 4 and 5 are packed together, followed by the hole.
+    pos = get_loc_event_ptr(fsrom.getbuffer(), 0)
+    for loc_id in (0, 2, 4, 5):
+        assert get_loc_event_ptr(fsrom.getbuffer(), loc_id) == pos
+        pos += get_compressed_length(fsrom.getbuffer(), pos)
+    assert space.free_extent(pos)[0] == pos
+    assert plan_compaction(manager, _NUM_LOCS) == []
+
+    # Scripts written afterwards still free their own packets correctly.
+    _set_script(manager, 2, _build_script_bytes(30, 40))
+    manager.write_scripts_to_rom([2])
+    assert bytes(_rom_script(fsrom, 2)) == _build_script_bytes(30, 40)
+    assert bytes(_rom_script(fsrom, 4)) == scripts[4]
@@ -0,0 +1,156 @@
+"""Tests for ScriptManager's batch script writes."""
+import random
+
+import pytest
+
+from jetsoftime.compressioncache import CompressionCache
+from jetsoftime.ctdecompress import decompress, get_compressed_length
+from jetsoftime.ctevent import Event, ScriptManager, get_loc_event_ptr
+from jetsoftime.ctstrings import CTString
+from jetsoftime.freespace import FSRom, FSWriteType, FreeSpaceError
+
+_LOC_DATA = 0x360000
+_EVENT_PTRS = 0x3CF9F0
+_SCRIPT_ADDR = 0x3D0000
+
+
+def _build_script_bytes(num_pauses, seed=0):
+    # One object whose functions all start with num_pauses pause commands.
+    rng = random.Random(seed)
+    ptrs = (32).to_bytes(2, 'little') * 16
+    body = bytearray()
+    for _ in range(num_pauses):
+        body += bytes([0xAD, rng.randrange(0x100)])
+    return bytes([1]) + ptrs + bytes(body) + b'\x00'
+
+
+def _build_packet(script_bytes):
+    return bytes(CompressionCache().compress(script_bytes))
+
+
+def _build_script_rom(num_locs, holes=()):
+    # num_locs one-pause scripts packed from _SCRIPT_ADDR, with holes free.
+    rom = bytearray(0x400000)
+    addr = _SCRIPT_ADDR
+    for loc_id in range(num_locs):
+        ind_st = _LOC_DATA + 14*loc_id + 8
+        rom[ind_st:ind_st+2] = loc_id.to_bytes(2, 'little')
+        ptr_st = _EVENT_PTRS + 3*loc_id
+        rom[ptr_st:ptr_st+3] = (0xC00000 + addr).to_bytes(3, 'little')
+        packet = _build_packet(_build_script_bytes(1, loc_id))
+        rom[addr:addr+len(packet)] = packet
+        addr += len(packet)
+
+    fsrom = FSRom(bytes(rom), False)
+    for hole in holes:
+        fsrom.space_manager.mark_block(hole, FSWriteType.MARK_FREE)
+    return fsrom, ScriptManager(fsrom, list(range(num_locs)))
+
+
+def _set_script(manager, loc_id, script_bytes):
+    script = Event.from_rom(_build_packet(script_bytes), 0)
+    manager.set_script(script, loc_id)
+
+
+def _rom_script(fsrom, loc_id):
+    return decompress(fsrom.getbuffer(),
+                      get_loc_event_ptr(fsrom.getbuffer(), loc_id))
+
+
+def test_batch_writes_only_changed_scripts():
+    fsrom, manager = _build_script_rom(3, [(0x3E0000, 0x3F0000)])
+    edited = {0: _build_script_bytes(40, 10), 2: _build_script_bytes(20, 12)}
+    for loc_id, data in edited.items():
+        _set_script(manager, loc_id, data)
+    unchanged = bytes(_rom_script(fsrom, 1))
+
+    assert manager.write_scripts_to_rom() == [0, 2]
+    for loc_id, data in edited.items():
+        assert bytes(_rom_script(fsrom, loc_id)) == data
+    assert bytes(_rom_script(fsrom, 1)) == unchanged
+
+    assert manager.write_scripts_to_rom() == []
+
+
+def test_batch_places_largest_first():
+    small, large = _build_script_bytes(60, 20), _build_script_bytes(200, 21)
+    small_len, large_len = len(_build_packet(small)), len(_build_packet(large))
+    # The low hole only holds the large script and the high hole only the
+    # small one.  Writing the small script first with first fit would take
+    # the low hole and leave nowhere for the large one.
+    holes = [(0x3E0000, 0x3E0000 + large_len),
+             (0x3E8000, 0x3E8000 + small_len)]
+
+    fsrom, manager = _build_script_rom(2, holes)
+    _set_script(manager, 0, small)
+    _set_script(manager, 1, large)
+    with pytest.raises(FreeSpaceError):
+        for loc_id in (0, 1):
+            manager.write_script_to_rom(loc_id)
+
+    fsrom, manager = _build_script_rom(2, holes)
+    _set_script(manager, 0, small)
+    _set_script(manager, 1, large)
+    manager.write_scripts_to_rom()
+    assert get_loc_event_ptr(fsrom.getbuffer(), 0) == 0x3E8000
+    assert get_loc_event_ptr(fsrom.getbuffer(), 1) == 0x3E0000
+    assert bytes(_rom_script(fsrom, 0)) == small
+    assert bytes(_rom_script(fsrom, 1)) == large
+
+
+def test_batch_failure_writes_nothing():
+    fsrom, manager = _build_script_rom(2, [(0x3E0000, 0x3E0100)])
+    space = fsrom.space_manager
+    old_packets = [(ptr, ptr + get_compressed_length(fsrom.getbuffer(), ptr))
+                   for ptr in (get_loc_event_ptr(fsrom.getbuffer(), loc_id)
+                               for loc_id in range(2))]
+    _set_script(manager, 0, _build_script_bytes(60, 30))
+    _set_script(manager, 1, _build_script_bytes(200, 31))
+    script = manager.get_script(0)
+    script.strings.append(CTString.from_ascii('hi'))
+    script.modified_strings = True
+    data_obj, data = script.data, bytes(script.data)
+    before = bytes(fsrom.getbuffer())
+
+    with pytest.raises(FreeSpaceError):
+        manager.write_scripts_to_rom()
+    assert bytes(fsrom.getbuffer()) == before
+    assert space.is_range_free(0x3E0000, 0x3E0100)
+    # The live packets are still marked used and the scripts are untouched.
+    for start, end in old_packets:
+        assert space.is_range_used(start, end)
+    assert script.data is data_obj
+    assert bytes(script.data) == data
+    assert manager.dirty_locations() == [0, 1]
+
+
+def test_batch_rolls_back_on_any_error(monkeypatch):
+    fsrom, manager = _build_script_rom(2, [(0x3E0000, 0x3F0000)])
+    space = fsrom.space_manager
+    old_packets = [manager._script_block(loc_id) for loc_id in range(2)]
+    digests = dict(manager._rom_digests)
+    _set_script(manager, 0, _build_script_bytes(60, 30))
+    script = manager.get_script(0)
+    script.strings.append(CTString.from_ascii('hi'))
+    script.modified_strings = True
+    data_obj, data = script.data, bytes(script.data)
+
+    def fail(*args):
+        raise RuntimeError('compressor failed')
+    monkeypatch.setattr(manager.compression_cache, 'compress', fail)
+    with pytest.raises(RuntimeError):
+        manager.write_scripts_to_rom()
+    # The string block is released and the old packets are kept.
+    assert space.is_range_free(0x3E0000, 0x3F0000)
+    for start, end in old_packets:
+        assert space.is_range_used(start, end)
+    assert script.data is data_obj and bytes(script.data) == data
+    assert manager._rom_digests == digests
+
+
+def test_scripts_load_through_shared_buffer():
+    fsrom, manager = _build_script_rom(3)
+    for loc_id in range(3):
+        script = manager.get_script(loc_id)
+        assert bytes(script.get_bytearray()) == _build_script_bytes(1, loc_id)
+        assert script.data is not manager._load_buffer
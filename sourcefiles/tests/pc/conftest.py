@@ -0,0 +1,59 @@
+import gzip
+import struct
+
+import pytest
+
+from decrypt import xor_decrypt
+
+
+def _encrypt_entry(data: bytes, seed: int) -> bytes:
+    payload = struct.pack('>I', len(data)) + gzip.compress(data)
+    return xor_decrypt(payload, seed)
+
+
+def build_resources_bin(path, files: dict[str, bytes]) -> None:
+    """Write a minimal resources.bin containing the given virtual paths."""
+    body = bytearray(16)
+    entries = []
+    for vpath, data in files.items():
+        offset = len(body)
+        blob = _encrypt_entry(data, offset)
+        body += blob
+        entries.append((vpath, offset, len(blob)))
+
+    names = bytearray()
+    name_offsets = []
+    table_len = 4 + 12 * len(entries)
+    for vpath, _, _ in entries:
+        name_offsets.append(table_len + len(names))
+        names += vpath.encode('utf-8') + b'\x00'
+
+    directory = bytearray(struct.pack('<I', len(entries)))
+    for (vpath, offset, size), name_off in zip(entries, name_offsets):
+        directory += struct.pack('<III', name_off, offset, size)
+    directory += names
+
+    dir_offset = len(body)
+    dir_blob = _encrypt_entry(bytes(directory), dir_offset)
+    body += dir_blob
+
+    header = b'ARC1' + struct.pack('<III', len(body), dir_offset, len(dir_blob))
+    body[0:16] = xor_decrypt(header, 0)
+    path.write_bytes(bytes(body))
+
+
+@pytest.fixture(autouse=True)
+def _user_cache_dir(tmp_path, monkeypatch):
+    """Keep per-user caches written by the code under test inside tmp_path."""
+    cache_dir = tmp_path / 'user-cache'
+    monkeypatch.setattr('pcbackend.user_cache_dir', lambda: str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture
+def make_archive(tmp_path):
+    def _make(files: dict[str, bytes], name: str = 'resources.bin'):
+        bin_path = tmp_path / name
+        build_resources_bin(bin_path, files)
+        return bin_path
+    return _make
@@ -0,0 +1,59 @@
+"""Tests for the resources.bin LCG keystream."""
+from __future__ import annotations
+
+import random
+import time
+
+import pytest
+
+from decrypt import keystream, lcg_jump, to_i32, xor_decrypt, _BLOCK_SIZE, _LCG_BASE, _LCG_VAL1, _LCG_VAL2
+
+
+def xor_decrypt_py(data: bytes, block_seed: int) -> bytes:
+    """The original byte-at-a-time keystream, kept as the reference."""
+    num1 = to_i32(_LCG_BASE + block_seed)
+    out = bytearray(len(data))
+    for i, b in enumerate(data):
+        num1 = to_i32(num1 * _LCG_VAL1 + _LCG_VAL2)
+        out[i] = b ^ ((num1 >> 24) & 0xFF)
+    return bytes(out)
+
+
+@pytest.mark.parametrize("length", [0, 1, 16, 255, _BLOCK_SIZE - 1, _BLOCK_SIZE, _BLOCK_SIZE + 1, 2 * _BLOCK_SIZE + 7])
+@pytest.mark.parametrize("seed", [0, 1, 0x1234, 0x7FFFFFFF, -0x80000000, -5])
+def test_xor_decrypt_matches_reference(length, seed):
+    rng = random.Random(length ^ seed)
+    data = bytes(rng.getrandbits(8) for _ in range(length))
+    assert xor_decrypt(data, seed) == xor_decrypt_py(data, seed)
+
+
+def test_keystream_chunks_are_independent():
+    full = keystream(0x5000, 3 * _BLOCK_SIZE)
+    start = _BLOCK_SIZE + 123
+    assert keystream(0x5000, 1000, start=start) == full[start:start + 1000]
+
+
+def test_lcg_jump_composes():
+    mult_a, incr_a = lcg_jump(1000)
+    mult_b, incr_b = lcg_jump(234)
+    mult, incr = lcg_jump(1234)
+    state = 0xDEADBEEF
+    stepped = (mult_b * ((mult_a * state + incr_a) & 0xFFFFFFFF) + incr_b) & 0xFFFFFFFF
+    assert stepped == (mult * state + incr) & 0xFFFFFFFF
+
+
+def benchmark(num_bytes: int = 0x100000, seed: int = 0x1234) -> dict[str, float]:
+    """Time both XOR paths on num_bytes of data.  Returns MB/s per path."""
+    data = bytes(range(256)) * (num_bytes // 256)
+    keystream(seed, 1)  # don't count the one-time table build
+    results = {}
+    for name, func in (('xor_decrypt_py', xor_decrypt_py), ('xor_decrypt', xor_decrypt)):
+        start = time.perf_counter()
+        func(data, seed)
+        results[name] = len(data) / 1e6 / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    for name, rate in benchmark().items():
+        print(f"{name:>16}: {rate:8.2f} MB/s")
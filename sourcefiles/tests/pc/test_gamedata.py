@@ -0,0 +1,90 @@
+"""Tests for GameData's directory-listing index."""
+import pytest
+
+from pcgamedata import GameData, _dir_ignores_case, discover_msg_prefix
+
+
+FILES = {
+    'Game/field/Mapinfo/mapinfo_0.dat': bytes(24),
+    'Game/field/Mapinfo/mapinfo_1.dat': bytes(24),
+    'Game/field/atel/Atel_0000.dat': b'\x01',
+    'Localize/us/msg/cmes0.txt': b'KEY_0,Hello\n',
+}
+
+
+@pytest.fixture
+def extracted(tmp_path):
+    for vpath, data in FILES.items():
+        fs_path = tmp_path.joinpath(*vpath.split('/'))
+        fs_path.parent.mkdir(parents=True, exist_ok=True)
+        fs_path.write_bytes(data)
+    return tmp_path
+
+
+@pytest.fixture(params=['directory', 'archive'])
+def game_data(request, extracted, make_archive):
+    if request.param == 'directory':
+        gd = GameData(str(extracted))
+    else:
+        gd = GameData(str(make_archive(FILES)))
+    yield gd
+    gd.close()
+
+
+def test_exists_uses_index(extracted, monkeypatch):
+    gd = GameData(str(extracted))
+    monkeypatch.setattr('os.path.exists', lambda p: pytest.fail('filesystem probed'))
+    assert gd.exists('Game/field/Mapinfo/mapinfo_1.dat')
+    assert gd.exists('Game\\field\\atel\\Atel_0000.dat')
+    assert gd.exists('Localize/us/msg')
+    assert not gd.exists('Game/field/Mapinfo/mapinfo_2.dat')
+    assert discover_msg_prefix(gd) == 'Localize/us/msg'
+
+
+def test_list_files_and_glob(game_data):
+    assert game_data.list_files() == sorted(FILES)
+    assert game_data.list_files('Game/field/Mapinfo') == [
+        'Game/field/Mapinfo/mapinfo_0.dat', 'Game/field/Mapinfo/mapinfo_1.dat']
+    assert game_data.list_files('Game/field/Map') == []
+    assert game_data.glob('Game/*/atel/*.dat') == ['Game/field/atel/Atel_0000.dat']
+
+
+def test_write_updates_index(game_data):
+    game_data.write('Game/field/atel/Atel_0001.dat', b'\x02')
+    assert game_data.exists('Game/field/atel/Atel_0001.dat')
+    assert 'Game/field/atel/Atel_0001.dat' in game_data.list_files('Game/field/atel')
+
+
+def test_refresh_index_sees_external_files(extracted):
+    gd = GameData(str(extracted))
+    (extracted / 'Game' / 'new.dat').write_bytes(b'')
+    assert not gd.exists('Game/new.dat')
+    gd.refresh_index()
+    assert gd.exists('Game/new.dat')
+
+
+def test_case_sensitivity_probed_from_directory(extracted, monkeypatch):
+    # tmp_path is on a case-sensitive filesystem here.
+    assert not _dir_ignores_case(str(extracted), ['Game', 'Localize'])
+    assert not GameData(str(extracted)).exists('game/field/atel/atel_0000.dat')
+
+    # A case-insensitive volume resolves the swapped name of an entry.
+    monkeypatch.setattr('os.path.exists', lambda p: p.endswith('gAME'))
+    assert _dir_ignores_case(str(extracted), ['Game', 'Localize'])
+    gd = GameData(str(extracted))
+    assert gd.exists('game/FIELD/atel/atel_0000.dat')
+    assert gd.glob('game/*/ATEL/*') == ['Game/field/atel/Atel_0000.dat']
+
+
+def test_read_cache_shares_entries_across_case(extracted, monkeypatch):
+    monkeypatch.setattr('os.path.exists', lambda p: p.endswith('gAME'))
+    gd = GameData(str(extracted))
+    assert gd.read('game/FIELD/atel/atel_0000.dat') == b'\x01'
+    assert gd.read('Game/field/atel/Atel_0000.dat') == b'\x01'
+    assert len(gd.read_cache) == 1
+
+    # Writing through one spelling must not leave the other stale.
+    gd.write('Game/field/atel/Atel_0000.dat', b'\x02')
+    assert gd.read('game/FIELD/atel/atel_0000.dat') == b'\x02'
+    assert gd.read_many(['GAME/field/ATEL/Atel_0000.dat']) == {
+        'GAME/field/ATEL/Atel_0000.dat': b'\x02'}
@@ -0,0 +1,159 @@
+"""Tests for PcBackend string editing."""
+import struct
+
+import pytest
+
+from pcbackend import PcBackend
+
+
+def _mapinfo(script_index: int) -> bytes:
+    raw = bytearray(24)
+    struct.pack_into('<H', raw, 16, script_index)
+    return bytes(raw)
+
+
+def _script(table_index: int) -> bytes:
+    # One object whose functions all start at the single 0xB8 (string index) command.
+    return bytes([1]) + struct.pack('<H', 32) * 16 + bytes([0xB8, table_index])
+
+
+MSG = 'Localize/us/msg/cmes0.txt'
+FILES = {
+    'Game/field/Mapinfo/mapinfo_0.dat': _mapinfo(0),
+    'Game/field/Mapinfo/mapinfo_1.dat': _mapinfo(1),
+    'Game/field/atel/Atel_0000.dat': _script(0),
+    'Game/field/atel/Atel_0001.dat': _script(0),
+    MSG: b'K0,Hello\nK1,World\nK2,Again',
+}
+
+
+@pytest.fixture(params=['directory', 'archive'])
+def game_path(request, tmp_path, make_archive):
+    if request.param == 'archive':
+        return make_archive(FILES)
+    root = tmp_path / 'game'
+    for vpath, data in FILES.items():
+        fs_path = root.joinpath(*vpath.split('/'))
+        fs_path.parent.mkdir(parents=True, exist_ok=True)
+        fs_path.write_bytes(data)
+    return root
+
+
+def test_string_edits_are_batched_until_save(game_path, monkeypatch):
+    backend = PcBackend(game_path)
+    backend.wait_for_scene_index()
+    writes = []
+    real_write_many = backend._gd.write_many
+    monkeypatch.setattr(backend._gd, 'write_many',
+                        lambda files: writes.append(sorted(files)) or real_write_many(files))
+
+    backend.modify_string(0, 0, 'Howdy')
+    backend.modify_string(0, 2, 'Later')
+    assert writes == []
+    # Scenes loaded later see staged edits to a shared table.
+    assert backend.get_script(1).strings[0].to_ascii() == 'Howdy'
+
+    backend.write_script(0)
+    assert writes == [['Game/field/atel/Atel_0000.dat', MSG]]
+    assert backend._gd.read(MSG) == b'K0,Howdy\nK1,World\nK2,Later'
+
+    backend.save_to_file(game_path)
+    assert len(writes) == 1
+    backend._gd.close()
+
+
+def test_flush_strings_without_script(game_path):
+    backend = PcBackend(game_path)
+    backend.wait_for_scene_index()
+    backend.modify_string(1, 1, 'Earth')
+    backend.flush_strings()
+    assert backend._gd.read(MSG) == b'K0,Hello\nK1,Earth\nK2,Again'
+    backend._gd.close()
+
+
+def test_strings_translate_lazily_and_share_table(game_path, monkeypatch):
+    import pcbackend
+
+    backend = PcBackend(game_path)
+    backend.wait_for_scene_index()
+    translated = []
+    real_translate = pcbackend._translate_pc_string
+    monkeypatch.setattr(pcbackend, '_translate_pc_string',
+                        lambda s: translated.append(s) or real_translate(s))
+
+    first = backend.get_script(0).strings
+    second = backend.get_script(1).strings
+    assert len(first) == 3 and translated == []
+    assert first[1].to_ascii() == 'World'
+    assert first[1] is first[1]
+    assert translated == ['World']
+    # The other scene still holds the shared, untranslated table entry.
+    assert second._items[1] is backend._string_tables[0][1]
+    backend._gd.close()
+
+
+def test_dirty_scripts_written_in_one_batch(game_path, monkeypatch):
+    backend = PcBackend(game_path)
+    backend.wait_for_scene_index()
+    writes = []
+    real_write_many = backend._gd.write_many
+    monkeypatch.setattr(backend._gd, 'write_many',
+                        lambda files: writes.append(sorted(files)) or real_write_many(files))
+
+    for location_id in (0, 1):
+        backend.get_script(location_id).insert_commands(bytearray([0x00]), 32)
+    backend.modify_string(1, 1, 'Earth')
+
+    assert backend.write_dirty_scripts() == [0, 1]
+    assert writes == [['Game/field/atel/Atel_0000.dat',
+                       'Game/field/atel/Atel_0001.dat', MSG]]
+    assert backend._gd.read('Game/field/atel/Atel_0001.dat')[33:35] == b'\x00\xB8'
+    assert backend._gd.read(MSG) == b'K0,Hello\nK1,Earth\nK2,Again'
+
+    assert backend.write_dirty_scripts() == []
+    assert len(writes) == 1
+    backend._gd.close()
+
+
+def _snapshot(path):
+    if path.is_file():
+        return path.read_bytes()
+    return {p.relative_to(path): p.read_bytes() for p in path.rglob('*') if p.is_file()}
+
+
+def test_save_as_leaves_source_untouched(game_path, tmp_path):
+    source = _snapshot(game_path)
+    backend = PcBackend(game_path)
+    backend.wait_for_scene_index()
+    backend.get_script(0).insert_commands(bytearray([0x00]), 32)
+    backend.modify_string(1, 1, 'Earth')
+
+    out = tmp_path / 'out'
+    if game_path.is_file():
+        out.mkdir()
+    assert backend.save_as(out) == [0]
+    assert _snapshot(game_path) == source
+
+    copy = PcBackend(out / game_path.name if game_path.is_file() else out)
+    assert copy._gd.read('Game/field/atel/Atel_0000.dat')[33:35] == b'\x00\xB8'
+    assert copy._gd.read(MSG) == b'K0,Hello\nK1,Earth\nK2,Again'
+    copy._gd.close()
+
+    # The edits are still pending for a save over the source.
+    assert backend.get_script(0).dirty
+    assert backend.write_dirty_scripts() == [0]
+    assert backend._gd.read(MSG) == b'K0,Hello\nK1,Earth\nK2,Again'
+    backend._gd.close()
+
+
+def test_archive_backed_up_before_first_append(make_archive):
+    bin_path = make_archive(FILES)
+    original = bin_path.read_bytes()
+    backend = PcBackend(bin_path)
+    backend.wait_for_scene_index()
+    for _ in range(2):
+        backend.get_script(0).insert_commands(bytearray([0x00]), 32)
+        backend.write_dirty_scripts()
+    assert bin_path.read_bytes() != original
+    assert bin_path.with_name(bin_path.name + '.bak').read_bytes() == original
+    backend._gd.close()
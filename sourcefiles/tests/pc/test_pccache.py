@@ -0,0 +1,106 @@
+"""Tests for the persistent decrypted-entry cache."""
+import os
+
+from pccache import MemoryCache, ResourceCache
+from pcgamedata import GameData
+
+
+FILES = {
+    'Game/field/atel/Atel_0000.dat': b'\x01' + bytes(range(64)),
+    'Localize/us/msg/cmes0.txt': b'KEY_0,Hello\nKEY_1,World\n',
+}
+
+
+def test_second_session_served_from_cache(make_archive, tmp_path, monkeypatch):
+    bin_path = make_archive(FILES)
+    cache_dir = tmp_path / 'cache'
+
+    gd = GameData(str(bin_path), str(cache_dir))
+    for vpath, data in FILES.items():
+        assert gd.read(vpath) == data
+
+    def fail(*args, **kwargs):
+        raise AssertionError('cache miss decrypted the archive')
+
+    monkeypatch.setattr('pcgamedata.xor_decrypt', fail)
+    monkeypatch.setattr('pcgamedata.decrypt_then_decompress', fail)
+    gd2 = GameData(str(bin_path), str(cache_dir))
+    for vpath, data in FILES.items():
+        assert gd2.read(vpath) == data
+
+
+def test_cache_invalidated_when_archive_changes(make_archive, tmp_path):
+    bin_path = make_archive(FILES)
+    cache_dir = tmp_path / 'cache'
+    GameData(str(bin_path), str(cache_dir)).read('Localize/us/msg/cmes0.txt')
+
+    changed = dict(FILES)
+    changed['Localize/us/msg/cmes0.txt'] = b'KEY_0,Changed\n'
+    make_archive(changed)
+    os.utime(bin_path, ns=(0, os.stat(bin_path).st_mtime_ns + 10**9))
+
+    gd = GameData(str(bin_path), str(cache_dir))
+    assert gd.read('Localize/us/msg/cmes0.txt') == b'KEY_0,Changed\n'
+
+
+def test_lru_eviction_respects_budget(tmp_path):
+    cache = ResourceCache(str(tmp_path), 'archive.bin', 'fp', max_bytes=250)
+    cache.put('a', b'a' * 100)
+    cache.put('b', b'b' * 100)
+    assert cache.get('a') == b'a' * 100  # 'b' is now least recently used
+    cache.put('c', b'c' * 100)
+
+    assert cache.total_bytes <= 250
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a' * 100
+    assert cache.get('c') == b'c' * 100
+
+    # LRU order survives a new session
+    reopened = ResourceCache(str(tmp_path), 'archive.bin', 'fp', max_bytes=250)
+    assert reopened.total_bytes == 200
+
+
+def test_memory_cache_evicts_by_bytes():
+    cache = MemoryCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'5678')
+    assert cache.get('a') == b'1234'
+    cache.put('c', b'90ab')
+    assert 'b' not in cache
+    assert cache.total_bytes == 8
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.put('huge', bytes(11))
+    assert 'huge' not in cache
+
+
+def test_game_data_reads_hit_memory_cache(make_archive, monkeypatch):
+    gd = GameData(str(make_archive(FILES)))
+    vpath = 'Localize/us/msg/cmes0.txt'
+    assert gd.read(vpath) == FILES[vpath]
+
+    def fail(*args, **kwargs):
+        raise AssertionError('memory cache hit decrypted the archive')
+
+    with monkeypatch.context() as m:
+        m.setattr('pcgamedata.decrypt_then_decompress', fail)
+        assert gd.read(vpath.replace('/', '\\')) == FILES[vpath]
+        assert gd.read_many([vpath]) == {vpath: FILES[vpath]}
+    assert gd.read_cache.hits == 2
+    assert gd.read_cache.misses == 1
+
+    gd.write(vpath, b'KEY_0,Bye\n')
+    assert vpath not in gd.read_cache
+    assert gd.read(vpath) == b'KEY_0,Bye\n'
+    gd.close()
+
+
+def test_game_data_memory_cache_directory(tmp_path):
+    (tmp_path / 'Game').mkdir()
+    (tmp_path / 'Game' / 'a.dat').write_bytes(b'abc')
+    gd = GameData(str(tmp_path))
+    assert gd.read('Game/a.dat') == b'abc'
+    gd.write('Game/a.dat', b'xyz')
+    assert gd.read('Game/a.dat') == b'xyz'
+    assert gd.read_cache.misses == 2
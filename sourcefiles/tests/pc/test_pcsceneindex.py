@@ -0,0 +1,83 @@
+"""Tests for the persistent PC scene index."""
+import struct
+
+from pcgamedata import GameData
+from pcsceneindex import (
+    MAPINFO_DIR,
+    SceneInfo,
+    build_scene_index,
+    load_scene_index,
+    save_scene_index,
+)
+
+
+def _mapinfo(script_index: int, map_index: int, music: int = 0) -> bytes:
+    raw = bytearray(24)
+    struct.pack_into('<H', raw, 0, music)
+    struct.pack_into('<H', raw, 12, map_index)
+    struct.pack_into('<H', raw, 16, script_index)
+    raw[20:24] = bytes([1, 2, 3, 4])
+    return bytes(raw)
+
+
+FILES = {
+    f'{MAPINFO_DIR}/mapinfo_0.dat': _mapinfo(5, 6, 7),
+    f'{MAPINFO_DIR}/mapinfo_2.dat': _mapinfo(8, 9),
+    f'{MAPINFO_DIR}/mapinfo_3.dat': b'short',
+}
+
+
+def test_build_scene_index(make_archive):
+    gd = GameData(str(make_archive(FILES)))
+    scenes = build_scene_index(gd, max_probe=600, miss_limit=10)
+    assert scenes == {
+        0: SceneInfo(0, 5, 6, 7, 1, 2, 3, 4),
+        2: SceneInfo(2, 8, 9, 0, 1, 2, 3, 4),
+    }
+    gd.close()
+
+
+def test_sidecar_round_trip_and_staleness(tmp_path):
+    scenes = {0: SceneInfo(0, 5, 6, 7, 1, 2, 3, 4), 300: SceneInfo(300, 1, 2, 3)}
+    path = str(tmp_path / 'scenes.bin')
+    fingerprint = 'ab' * 20
+    assert save_scene_index(path, fingerprint, scenes)
+    assert load_scene_index(path, fingerprint) == scenes
+    assert load_scene_index(path, 'cd' * 20) is None
+    assert load_scene_index(str(tmp_path / 'missing.bin'), fingerprint) is None
+
+    (tmp_path / 'scenes.bin').write_bytes(b'TRSI')
+    assert load_scene_index(path, fingerprint) is None
+
+
+def test_backend_reuses_sidecar(make_archive, monkeypatch, _user_cache_dir):
+    import pcbackend
+
+    bin_path = make_archive(FILES)
+    backend = pcbackend.PcBackend(bin_path)
+    backend.wait_for_scene_index()
+    # The sidecar goes to the per-user cache, never beside the game data.
+    assert sorted(p.name for p in bin_path.parent.iterdir()) == ['resources.bin', 'user-cache']
+    assert len(list(_user_cache_dir.iterdir())) == 1
+    assert backend._scene_to_script == {0: 5, 2: 8}
+    locations = backend.get_location_list()
+    backend._gd.close()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('scene index rebuilt')
+
+    monkeypatch.setattr(pcbackend, 'build_scene_index', fail)
+    reopened = pcbackend.PcBackend(bin_path)
+    assert reopened.get_location_list() == locations
+    assert reopened.scenes[0].music_index == 7
+    reopened._gd.close()
+
+    # Rewriting a mapinfo entry changes the fingerprint and forces a rebuild.
+    monkeypatch.undo()
+    gd = GameData(str(bin_path))
+    gd.write(f'{MAPINFO_DIR}/mapinfo_2.dat', _mapinfo(11, 9))
+    gd.close()
+    rebuilt = pcbackend.PcBackend(bin_path)
+    assert rebuilt._scene_to_script == {0: 5, 2: 11}
+    rebuilt.wait_for_scene_index()
+    rebuilt._gd.close()
@@ -0,0 +1,163 @@
+"""Tests for the resources.bin archive reader."""
+import pytest
+
+from pcgamedata import GameData, ResourcesBin
+
+
+FILES = {
+    'Game/field/Mapinfo/mapinfo_0.dat': bytes(range(24)),
+    'Game/field/Mapinfo/mapinfo_1.dat': bytes(range(24, 48)),
+    'Game/field/atel/Atel_0000.dat': b'\x01' + bytes(64),
+    'Localize/us/msg/cmes0.txt': b'KEY_0,Hello\n',
+}
+
+
+def test_file_get_round_trip(make_archive):
+    with ResourcesBin(str(make_archive(FILES))) as rb:
+        assert rb.list_files() == sorted(FILES)
+        for vpath, data in FILES.items():
+            assert rb.file_get(vpath) == data
+
+
+def test_read_many_returns_every_path(make_archive):
+    with ResourcesBin(str(make_archive(FILES))) as rb:
+        paths = list(reversed(FILES))
+        assert rb.read_many(paths) == {p: FILES[p] for p in paths}
+        with pytest.raises(FileNotFoundError):
+            rb.read_many(['Game/missing.dat'])
+
+
+def test_read_many_in_archive_order(make_archive, monkeypatch):
+    rb = ResourcesBin(str(make_archive(FILES)))
+    offsets = []
+    orig_decode = rb._decode
+
+    def spy(offset, size):
+        offsets.append(offset)
+        return orig_decode(offset, size)
+
+    monkeypatch.setattr(rb, '_decode', spy)
+    rb.read_many(list(reversed(FILES)))
+    assert offsets == sorted(offsets)
+    rb.close()
+
+
+def test_game_data_read_many_normalises_paths(make_archive):
+    gd = GameData(str(make_archive(FILES)))
+    result = gd.read_many(['Game\\field\\atel\\Atel_0000.dat'])
+    assert result == {'Game\\field\\atel\\Atel_0000.dat': FILES['Game/field/atel/Atel_0000.dat']}
+    gd.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract_all_builds_readable_tree(make_archive, tmp_path, workers):
+    dest = tmp_path / 'extracted'
+    with ResourcesBin(str(make_archive(FILES))) as rb:
+        assert rb.extract_all(str(dest), workers=workers) == (len(FILES), 0)
+
+    gd = GameData(str(dest))
+    for vpath, data in FILES.items():
+        assert gd.read(vpath) == data
+
+
+def test_extract_all_filters_and_resumes(make_archive, tmp_path):
+    dest = tmp_path / 'extracted'
+    calls = []
+    with ResourcesBin(str(make_archive(FILES))) as rb:
+        assert rb.extract_all(str(dest), workers=1, pattern='Game/field/Mapinfo/*') == (2, 0)
+        assert not (dest / 'Localize').exists()
+
+        # Truncated file from an interrupted run gets re-extracted.
+        (dest / 'Game' / 'field' / 'Mapinfo' / 'mapinfo_1.dat').write_bytes(b'\x00')
+        result = rb.extract_all(str(dest), workers=1, progress=lambda d, t: calls.append((d, t)))
+
+    assert result == (len(FILES) - 1, 1)
+    assert calls[-1] == (len(FILES), len(FILES))
+    assert (dest / 'Game' / 'field' / 'Mapinfo' / 'mapinfo_1.dat').read_bytes() == FILES['Game/field/Mapinfo/mapinfo_1.dat']
+
+
+def test_write_files_appends_only_changed_entries(make_archive):
+    bin_path = make_archive(FILES)
+    original = bin_path.read_bytes()
+    new_script = b'\x02' + bytes(100)
+    with ResourcesBin(str(bin_path)) as rb:
+        rb.write_files({'Game/field/atel/Atel_0000.dat': new_script,
+                        'Game/field/atel/Atel_0001.dat': b'new'})
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == new_script
+        assert rb.dead_bytes > 0
+
+    updated = bin_path.read_bytes()
+    # Everything but the header is untouched; the new data is appended.
+    assert updated[16:len(original)] == original[16:]
+    with ResourcesBin(str(bin_path)) as rb:
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == new_script
+        assert rb.file_get('Game/field/atel/Atel_0001.dat') == b'new'
+        assert rb.file_get('Localize/us/msg/cmes0.txt') == FILES['Localize/us/msg/cmes0.txt']
+
+
+def test_write_files_refreshes_cache(make_archive, tmp_path):
+    bin_path = make_archive(FILES)
+    cache_dir = str(tmp_path / 'cache')
+    with ResourcesBin(str(bin_path), cache_dir) as rb:
+        rb.file_get('Game/field/atel/Atel_0000.dat')
+        rb.write_files({'Game/field/atel/Atel_0000.dat': b'edited'})
+    with ResourcesBin(str(bin_path), cache_dir) as rb:
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == b'edited'
+
+
+def test_write_files_keeps_other_cached_entries(make_archive, tmp_path, monkeypatch):
+    bin_path = make_archive(FILES)
+    cache_dir = str(tmp_path / 'cache')
+    with ResourcesBin(str(bin_path), cache_dir) as rb:
+        rb.read_many(list(FILES))
+        rb.write_files({'Game/field/atel/Atel_0000.dat': b'edited'})
+
+    def fail(*args, **kwargs):
+        raise AssertionError('cache miss decrypted the archive')
+
+    monkeypatch.setattr('pcgamedata.decrypt_then_decompress', fail)
+    with ResourcesBin(str(bin_path), cache_dir) as rb:
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == b'edited'
+        assert rb.file_get('Localize/us/msg/cmes0.txt') == FILES['Localize/us/msg/cmes0.txt']
+
+
+def test_failed_write_keeps_index(make_archive, monkeypatch):
+    bin_path = make_archive(FILES)
+    with ResourcesBin(str(bin_path)) as rb:
+        spans = {vpath: rb.entry_span(vpath) for vpath in FILES}
+
+        def fail(*args, **kwargs):
+            raise OSError('disk full')
+
+        monkeypatch.setattr(rb, '_pack_directory', fail)
+        with pytest.raises(OSError):
+            rb.write_files({'Game/field/atel/Atel_0000.dat': b'edited',
+                            'Game/field/atel/Atel_0001.dat': b'new'})
+        assert rb.list_files() == sorted(FILES)
+        assert {vpath: rb.entry_span(vpath) for vpath in FILES} == spans
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == FILES['Game/field/atel/Atel_0000.dat']
+
+
+@pytest.mark.parametrize("in_place", [True, False])
+def test_compact_drops_dead_space(make_archive, tmp_path, in_place):
+    bin_path = make_archive(FILES)
+    expected = dict(FILES, **{'Game/field/atel/Atel_0000.dat': b'edited'})
+    with ResourcesBin(str(bin_path)) as rb:
+        rb.write_files({'Game/field/atel/Atel_0000.dat': b'edited'})
+        dest = None if in_place else str(tmp_path / 'compact.bin')
+        rb.compact(dest)
+        assert rb.file_get('Game/field/atel/Atel_0000.dat') == b'edited'
+
+    out_path = bin_path if in_place else tmp_path / 'compact.bin'
+    with ResourcesBin(str(out_path)) as rb:
+        assert rb.dead_bytes == 0
+        assert rb.list_files() == sorted(expected)
+        for vpath, data in expected.items():
+            assert rb.file_get(vpath) == data
+
+
+def test_game_data_write_to_archive(make_archive):
+    gd = GameData(str(make_archive(FILES)))
+    gd.write('Localize\\us\\msg\\cmes0.txt', b'KEY_0,Bye\n')
+    assert gd.read('Localize/us/msg/cmes0.txt') == b'KEY_0,Bye\n'
+    gd.close()